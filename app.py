@@ -1,14 +1,61 @@
-from flask import Flask, request, jsonify, session, send_from_directory
+from flask import Flask, request, jsonify, session, g, has_app_context, Response
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
 import smtplib
 import sqlite3
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from functools import wraps
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+import click
 import logging
 import hashlib
+import hmac
+import queue
+import base64
+import csv
+import io
+import json
+import threading
+import time
+import zlib
+import re
+import gzip
+import mimetypes
+import urllib.parse
+
+import math
+import bisect
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele os assets saem só em gzip
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:  # fora do Unix a trava das migrações fica sem efeito
+    fcntl = None
+
+try:
+    import gevent
+    import gevent.monkey
+except ImportError:  # opcional: só existe com o worker gevent do gunicorn
+    gevent = None
+
+try:
+    import psycopg
+    from psycopg.rows import tuple_row
+    from psycopg_pool import ConnectionPool
+except ImportError:  # opcional: só o motor PostgreSQL (MotorPostgres) usa
+    psycopg = None
+
+try:
+    import orjson
+except ImportError:  # opcional: sem ele o JSON sai pelo encoder padrão do Flask
+    orjson = None
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PUBLIC_DIR = os.path.join(BASE_DIR, "public")
@@ -40,25 +87,616 @@ app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(minutes=5)
 app.config["SESSION_REFRESH_EACH_REQUEST"] = False
 
+
+class JSONProviderOrjson(DefaultJSONProvider):
+    # Mesmo contrato do provider padrão (datas, Decimal etc. caem no default
+    # do Flask; sort_keys e o indent de compact=False valem), serializado
+    # pelo orjson. Diferença: acentos saem em UTF-8, não como \uXXXX
+    # (ensure_ascii não tem equivalente no orjson).
+    def dumps(self, obj, **kwargs):
+        opcoes = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get("sort_keys", self.sort_keys):
+            opcoes |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            opcoes |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get("default", self.default), option=opcoes).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+if orjson is not None:
+    app.json = JSONProviderOrjson(app)
+
+# Compressão das respostas da API (after_request comprimir_resposta): só
+# acima do limite, e com níveis rápidos, já que é feita a cada requisição
+COMPRESSAO_CONFIG = {
+    "tamanho_min": 1024,
+    "nivel_gzip": 5,
+    "qualidade_brotli": 4,
+    "tipos": ("application/json", "text/plain", "text/csv"),
+}
+
 EMAIL_CONFIG = {
-    "smtp_server": "smtp.gmail.com",
-    "smtp_port": 587,
+    # SMTP_SERVER/SMTP_PORT/SMTP_TLS/SMTP_SENHA permitem apontar para outro
+    # servidor (ex.: o SMTP falso do benchmark.py)
+    "smtp_server": os.environ.get("SMTP_SERVER", "smtp.gmail.com"),
+    "smtp_port": int(os.environ.get("SMTP_PORT", 587)),
     "sender_email": "contratomais.suporte1@gmail.com",
-    "sender_password": "hsri smmy tyea sgac",
-    "use_tls": True,
+    "sender_password": os.environ.get("SMTP_SENHA", "hsri smmy tyea sgac"),
+    "use_tls": os.environ.get("SMTP_TLS", "1") != "0",
+    # Pool de sessões SMTP do processo que drena a fila (ver PoolSMTP e
+    # FILA_EMAIL_CONFIG["trava"]): os limites valem para todos os processos
+    "conexoes_max": int(os.environ.get("SMTP_CONEXOES", 2)),
+    "mensagens_por_sessao": 100,
+    "verificar_apos_s": 10,  # sessão ociosa há mais que isso é testada com NOOP
+    "ociosa_max_s": 120,  # e há mais que isso é descartada
+    "envios_por_segundo": float(os.environ.get("SMTP_ENVIOS_POR_SEGUNDO", 5)),
+    "timeout_s": 30,
+}
+
+# Banco do app no motor SQLite (o padrão, para um servidor): todos os
+# workers do gunicorn compartilham este arquivo (WAL com memória
+# compartilhada, que não funciona em disco de rede). Com
+# CONTRATOS_POSTGRES_URL o app inteiro passa para o PostgreSQL (ver
+# POSTGRES_CONFIG e ARMAZENAMENTO), para vários nós com o mesmo banco.
+DATABASE = os.environ.get("CONTRATOS_DB", os.path.join(DATA_DIR, "contratos.db"))
+
+# Fila de envio: /notificar só grava a notificação como "pendente"; os
+# workers enviam em segundo plano, com novas tentativas e backoff
+# exponencial. Só um processo roda os workers (o que segura a trava: por
+# servidor no SQLite, para o cluster todo no PostgreSQL), para os limites
+# do pool SMTP valerem para todos e não para cada worker do gunicorn. Com
+# EMAIL_WORKERS=0 nenhum worker sobe no processo web e a fila é drenada
+# por "flask --app app fila-email".
+FILA_EMAIL_CONFIG = {
+    "workers": int(os.environ.get("EMAIL_WORKERS", 2)),
+    "max_tentativas": 5,
+    "backoff_base_s": 30,
+    "backoff_max_s": 3600,
+    # tempo que uma notificação fica reservada para um worker; se ele morrer
+    # no meio do envio, outro a pega depois desse prazo
+    "reserva_s": 300,
+    "intervalo_s": 5,
+    # notificações reservadas de uma vez por worker e enviadas pela mesma
+    # sessão SMTP
+    "lote": 50,
+    # os demais processos tentam pegar a trava a cada intervalo_s e assumem
+    # a fila se o dono morrer
+    "trava": "fila_email",
+}
+
+# Conexões SQLite: WAL permite leitores concorrentes com um escritor, e o
+# busy_timeout faz a conexão esperar o lock em vez de falhar com
+# "database is locked".
+DB_CONFIG = {
+    "timeout": 30,  # segundos
+    "cache_size_kib": 64 * 1024,
+    "mmap_size": 256 * 1024 * 1024,
+    "pool_tamanho": 16,
+    # rotas de leitura (decorator somente_leitura) usam conexões abertas com
+    # mode=ro, num pool à parte; DB_LEITURA_RO=0 as manda para o pool comum
+    "leitura_ro": os.environ.get("DB_LEITURA_RO", "1") != "0",
+    # sob o worker gevent, threads do sistema que rodam as chamadas ao SQLite
+    # (ver _sqlite_bloqueante); limita quantas esperam lock ao mesmo tempo
+    "threads_gevent": int(os.environ.get("SQLITE_THREADS_GEVENT", 16)),
 }
 
-DATABASE = os.path.join(DATA_DIR, "contratos.db")
+# Motor PostgreSQL (MotorPostgres), usado quando a url está definida: pool
+# de conexões do psycopg por processo. Precisa das dependências de
+# requirements-postgres.txt.
+POSTGRES_CONFIG = {
+    "url": os.environ.get("CONTRATOS_POSTGRES_URL", ""),
+    "pool_min": int(os.environ.get("POSTGRES_POOL_MIN", 1)),
+    "pool_max": int(os.environ.get("POSTGRES_POOL_MAX", 10)),
+}
 
 RESET_CODE = "19192425"
 
+CAMPOS_CONTRATO = (
+    "id",
+    "nome",
+    "descricao",
+    "data_inicio",
+    "data_fim",
+    "status",
+    "criado_em",
+    "atualizado_em",
+    "dias_restantes",
+)
+# Campos que o cliente envia, na ordem de RepositorioContratos.inserir
+CAMPOS_CONTRATO_EDITAVEIS = ("nome", "descricao", "data_inicio", "data_fim", "status")
+LIMITE_PAGINA_PADRAO = 50
+LIMITE_PAGINA_MAX = 500
+STATS_CACHE_MAX = 10000
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
+# Formato gravado em data_inicio/data_fim (ver normalizar_data)
+FORMATO_DATA = "%Y-%m-%dT%H:%M:%S"
+
+STATUS_CONTRATO = ("ativo", "inativo", "concluido", "pendente")
+
+# Contratos por chamada de POST /api/notificacoes/batch
+NOTIFICACOES_LOTE_MAX = 5000
+
+# Importação em massa (POST /api/contratos/bulk): linhas por transação e
+# quantos erros por linha entram no relatório
+IMPORTACAO_CONFIG = {
+    "lote": 5000,
+    "erros_max": 1000,
+}
+
+# Exportações (/api/contratos/export, /api/notificacoes/export): linhas lidas
+# do cursor por vez e nível do gzip aplicado durante o streaming
+EXPORTACAO_CONFIG = {
+    "linhas_por_bloco": 1000,
+    "nivel_gzip": 6,
+}
+
+# Contadores do dashboard (usuario_estatisticas): mantidos por triggers nas
+# escritas; a cada intervalo_s um job move os contratos entre as faixas
+# "vencendo em 7 dias" e "vencidos" conforme o tempo passa.
+ESTATISTICAS_CONFIG = {
+    "intervalo_s": int(os.environ.get("ESTATISTICAS_INTERVALO", 60)),
+}
+
+# Retenção do histórico: notificações já processadas e mais antigas que
+# "dias" saem da tabela quente para o arquivo (lotes NDJSON comprimidos),
+# deixando contagens em notificacao_resumo. O arquivo é um banco à parte
+# no SQLite e o schema "arquivo" no PostgreSQL.
+RETENCAO_CONFIG = {
+    "dias": int(os.environ.get("NOTIFICACOES_RETENCAO_DIAS", 180)),
+    "arquivo": os.path.join(os.path.dirname(DATABASE), "notificacoes_arquivo.db"),
+    "lote": 2000,
+    "pausa_s": 0.05,
+    "intervalo_s": int(os.environ.get("RETENCAO_INTERVALO", 6 * 3600)),
+    "resumo": True,
+}
+
+# Escritas de contratos (criar/atualizar/excluir): cada processo tem uma
+# thread escritora que junta as escritas que chegam ao mesmo tempo numa só
+# transação (group commit): cada lote leva o que chegou enquanto o anterior
+# era gravado, mais o que chegar em até janela_s (0 = não espera), sem
+# passar de lote_max. ESCRITAS_AGRUPADAS=0 volta a gravar na conexão da
+# própria requisição, como sempre no PostgreSQL (ver escritas_agrupadas).
+ESCRITA_CONFIG = {
+    "habilitado": os.environ.get("ESCRITAS_AGRUPADAS", "1") != "0",
+    "janela_s": float(os.environ.get("ESCRITAS_JANELA_MS", 0)) / 1000,
+    "lote_max": 64,
+}
+
+# Migrações do schema (migrar_banco): rodam uma vez na subida do gunicorn
+# (on_starting, no master) sob uma trava de arquivo. Backfills andam em
+# lotes de "lote" linhas (keyset por rowid), uma transação por lote.
+MIGRACAO_CONFIG = {
+    "trava": os.path.join(os.path.dirname(DATABASE), "migracoes.lock"),
+    "lote": 5000,
+    "pausa_s": 0.01,
+}
+
+SSE_CONFIG = {
+    "heartbeat_s": 15,
+    # intervalo com que cada processo consulta usuario_versao para repassar
+    # alterações feitas por outros workers
+    "verificacao_s": 2,
+    # o stream é encerrado periodicamente; o navegador reconecta e a sessão
+    # é validada de novo
+    "duracao_max_s": 300,
+}
+
+# Métricas em GET /metrics (formato texto do Prometheus). São por processo:
+# com vários workers do gunicorn cada scrape cai em um deles, então o
+# Prometheus deve raspar cada worker (ou usar a agregação dele). Com
+# consulta_lenta_ms > 0, instruções SQL acima do limite vão para o log com
+# o EXPLAIN QUERY PLAN. /metrics só responde com METRICAS_TOKEN definido,
+# e exige "Authorization: Bearer <token>".
+METRICAS_CONFIG = {
+    "buckets_s": (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    "buckets_consultas": (1, 2, 5, 10, 20, 50, 100, 250, 1000),
+    "consulta_lenta_ms": float(os.environ.get("SQL_CONSULTA_LENTA_MS", 0)),
+    "token": os.environ.get("METRICAS_TOKEN"),
+}
+
+
+# ========== MÉTRICAS ==========
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.contagens = [0] * (len(self.buckets) + 1)
+        self.soma = 0.0
+
+    def observar(self, valor):
+        self.contagens[bisect.bisect_left(self.buckets, valor)] += 1
+        self.soma += valor
+
+
+class RegistroMetricas:
+    """
+    Contadores e histogramas em memória, indexados por (nome, rótulos).
+    Um único lock protege tudo: as atualizações são somas curtas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._descricoes = {}
+        self._contadores = {}
+        self._histogramas = {}
+
+    def descrever(self, nome, tipo, ajuda):
+        self._descricoes[nome] = (tipo, ajuda)
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, buckets=None, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = Histograma(buckets or METRICAS_CONFIG["buckets_s"])
+            histograma.observar(valor)
+
+    def exportar(self, medidores=()):
+        """
+        Texto no formato de exposição do Prometheus. medidores são tuplas
+        (nome, valor, rótulos) lidas na hora do scrape.
+        """
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted(
+                (chave, list(h.buckets), list(h.contagens), h.soma) for chave, h in self._histogramas.items()
+            )
+
+        linhas = []
+        descritos = set()
+
+        def cabecalho(nome):
+            if nome not in descritos and nome in self._descricoes:
+                descritos.add(nome)
+                tipo, ajuda = self._descricoes[nome]
+                linhas.append(f"# HELP {nome} {ajuda}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+
+        for nome, valor, rotulos in medidores:
+            cabecalho(nome)
+            linhas.append(f"{nome}{formatar_rotulos(rotulos)} {formatar_valor(valor)}")
+
+        for (nome, rotulos), valor in contadores:
+            cabecalho(nome)
+            linhas.append(f"{nome}{formatar_rotulos(rotulos)} {formatar_valor(valor)}")
+
+        for (nome, rotulos), buckets, contagens, soma in histogramas:
+            cabecalho(nome)
+            acumulado = 0
+            for limite, contagem in zip(buckets + ["+Inf"], contagens):
+                acumulado += contagem
+                le = limite if limite == "+Inf" else formatar_valor(limite)
+                linhas.append(f"{nome}_bucket{formatar_rotulos(rotulos + (('le', le),))} {acumulado}")
+            linhas.append(f"{nome}_sum{formatar_rotulos(rotulos)} {formatar_valor(soma)}")
+            linhas.append(f"{nome}_count{formatar_rotulos(rotulos)} {acumulado}")
+
+        return "\n".join(linhas) + "\n"
+
+
+def _escapar_rotulo(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def formatar_rotulos(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{chave}="{_escapar_rotulo(valor)}"' for chave, valor in rotulos) + "}"
+
+
+def formatar_valor(valor):
+    if isinstance(valor, float):
+        return repr(valor) if not valor.is_integer() else str(int(valor))
+    return str(valor)
+
+
+metricas = RegistroMetricas()
+metricas.descrever("contratomais_http_requisicoes_total", "counter", "Requisições HTTP atendidas")
+metricas.descrever("contratomais_http_requisicao_segundos", "histogram", "Latência das requisições HTTP")
+metricas.descrever("contratomais_sql_consultas_por_requisicao", "histogram", "Instruções SQL por requisição")
+metricas.descrever("contratomais_sql_segundos_por_requisicao", "histogram", "Tempo em SQL por requisição")
+metricas.descrever("contratomais_sql_consulta_segundos", "histogram", "Duração do execute de cada instrução SQL (sem os fetch)")
+metricas.descrever("contratomais_sql_consultas_lentas_total", "counter", "Instruções SQL acima do limite de lentidão")
+metricas.descrever("contratomais_smtp_conexao_segundos", "histogram", "Abertura de sessões SMTP (com login)")
+metricas.descrever("contratomais_smtp_envio_segundos", "histogram", "Envio de cada mensagem SMTP")
+metricas.descrever("contratomais_escritas_por_lote", "histogram", "Escritas de contratos por transação")
+metricas.descrever("contratomais_fila_email_pendentes", "gauge", "Notificações pendentes na fila de email")
+metricas.descrever("contratomais_fila_email_prontas", "gauge", "Pendentes já liberadas para envio")
+metricas.descrever("contratomais_fila_email_atraso_segundos", "gauge", "Espera da pendente liberada mais antiga")
+metricas.descrever("contratomais_sse_assinantes", "gauge", "Streams SSE abertos neste processo")
+metricas.descrever("contratomais_db_pool_ociosas", "gauge", "Conexões ociosas no pool do banco deste processo")
+
+@app.before_request
+def iniciar_medicao():
+    g._inicio_requisicao = time.perf_counter()
+    g._sql_consultas = 0
+    g._sql_tempo = 0.0
+
+
+# Registrado antes de comprimir_resposta, então roda depois dele (os
+# after_request rodam em ordem inversa) e a latência inclui a compressão.
+# Em respostas em streaming mede até o início do corpo.
+@app.after_request
+def registrar_medicao(resposta):
+    inicio = g.get("_inicio_requisicao")
+    if inicio is None:
+        return resposta
+    rota = request.url_rule.rule if request.url_rule is not None else "(sem rota)"
+    metricas.incrementar(
+        "contratomais_http_requisicoes_total", rota=rota, metodo=request.method, status=resposta.status_code
+    )
+    metricas.observar(
+        "contratomais_http_requisicao_segundos", time.perf_counter() - inicio, rota=rota, metodo=request.method
+    )
+    metricas.observar(
+        "contratomais_sql_consultas_por_requisicao",
+        g.get("_sql_consultas", 0),
+        buckets=METRICAS_CONFIG["buckets_consultas"],
+        rota=rota,
+    )
+    metricas.observar("contratomais_sql_segundos_por_requisicao", g.get("_sql_tempo", 0.0), rota=rota)
+    return resposta
+
+
+_SQL_EXPLICAVEIS = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def _operacao_sql(sql):
+    palavra = sql.lstrip().split(None, 1)
+    return palavra[0].upper() if palavra else ""
+
+
+_threadpool_gevent = None
+
+
+def _sqlite_bloqueante(funcao, *args):
+    """
+    Roda uma chamada ao SQLite fora do loop de eventos quando o processo está
+    sob o worker gevent (threading com monkey-patch). O sqlite3 bloqueia a
+    thread do sistema, inclusive nas esperas de lock do busy_timeout (até
+    DB_CONFIG["timeout"]), o que pararia todas as greenlets do worker; no
+    threadpool do hub só a greenlet que chamou espera. Cada chamada custa uma
+    troca de thread, e no máximo DB_CONFIG["threads_gevent"] rodam juntas: as
+    demais aguardam vez, como requisições num worker gthread.
+    """
+    global _threadpool_gevent
+    if gevent is None or not gevent.monkey.is_module_patched("threading"):
+        return funcao(*args)
+    if _threadpool_gevent is None:
+        _threadpool_gevent = gevent.get_hub().threadpool
+        _threadpool_gevent.maxsize = DB_CONFIG["threads_gevent"]
+    return _threadpool_gevent.apply(funcao, args)
+
+
+class _MedicaoSQL:
+    # Métricas dos cursores dos dois motores. Mede execute e os fetch*;
+    # linhas lidas iterando o cursor (for linha in cursor) não entram no
+    # tempo, só o primeiro passo feito no execute
+    _sql = None
+    _tempo = 0.0
+    _lenta_registrada = False
+
+    def _medir(self, inicio, parametros=None):
+        duracao = time.perf_counter() - inicio
+        self._tempo += duracao
+        if has_app_context():
+            g._sql_tempo = g.get("_sql_tempo", 0.0) + duracao
+
+        limite_ms = METRICAS_CONFIG["consulta_lenta_ms"]
+        if limite_ms and not self._lenta_registrada and self._tempo * 1000 >= limite_ms:
+            self._lenta_registrada = True
+            self._registrar_lenta(parametros)
+
+    def _registrar_lenta(self, parametros):
+        metricas.incrementar("contratomais_sql_consultas_lentas_total")
+        plano = ""
+        if parametros is not None and _operacao_sql(self._sql) in _SQL_EXPLICAVEIS:
+            try:
+                plano = "\n".join(f"  {detalhe}" for detalhe in self._plano(parametros))
+            except Exception as e:
+                plano = f"  (sem plano: {str(e)})"
+        logger.warning(f"Consulta lenta ({self._tempo * 1000:.1f} ms): {' '.join(self._sql.split())}\n{plano}")
+
+    def _iniciar(self, sql):
+        self._sql = sql
+        self._tempo = 0.0
+        self._lenta_registrada = False
+        if has_app_context():
+            g._sql_consultas = g.get("_sql_consultas", 0) + 1
+
+
+class CursorSQLite(_MedicaoSQL, sqlite3.Cursor):
+    def _explicar(self, parametros):
+        # direto no sqlite3.Connection: o EXPLAIN não entra nas métricas
+        linhas = sqlite3.Connection.execute(self.connection, "EXPLAIN QUERY PLAN " + self._sql, parametros)
+        return [linha[3] for linha in linhas]
+
+    def _plano(self, parametros):
+        return _sqlite_bloqueante(self._explicar, parametros)
+
+    def execute(self, sql, parametros=()):
+        self._iniciar(sql)
+        inicio = time.perf_counter()
+        try:
+            return _sqlite_bloqueante(super().execute, sql, parametros)
+        finally:
+            self._medir(inicio, parametros)
+            metricas.observar("contratomais_sql_consulta_segundos", self._tempo, operacao=_operacao_sql(sql))
+
+    def executemany(self, sql, parametros):
+        self._iniciar(sql)
+        inicio = time.perf_counter()
+        try:
+            return _sqlite_bloqueante(super().executemany, sql, parametros)
+        finally:
+            self._medir(inicio)
+            metricas.observar("contratomais_sql_consulta_segundos", self._tempo, operacao=_operacao_sql(sql))
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        try:
+            return _sqlite_bloqueante(super().fetchone)
+        finally:
+            self._medir(inicio)
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        try:
+            return _sqlite_bloqueante(super().fetchmany, self.arraysize if size is None else size)
+        finally:
+            self._medir(inicio)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        try:
+            return _sqlite_bloqueante(super().fetchall)
+        finally:
+            self._medir(inicio)
+
+
+class ConexaoSQLite(sqlite3.Connection):
+    # conn.execute do sqlite3 cria o cursor internamente, sem passar por
+    # cursor(); por isso execute/executemany são refeitos aqui
+    def cursor(self, factory=CursorSQLite):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def commit(self):
+        return _sqlite_bloqueante(super().commit)
+
+
+def abrir_conexao(somente_leitura=False):
+    conn = sqlite3.connect(
+        f"file:{urllib.parse.quote(DATABASE)}?mode=ro" if somente_leitura else DATABASE,
+        timeout=DB_CONFIG["timeout"],
+        factory=ConexaoSQLite,
+        # a conexão pode ser devolvida ao pool por uma thread e reutilizada
+        # por outra; nunca é usada por duas threads ao mesmo tempo
+        check_same_thread=False,
+        uri=somente_leitura,
+    )
     conn.row_factory = sqlite3.Row
+    if somente_leitura:
+        # o banco já está em WAL (modo persistente, gravado pelo primário);
+        # query_only barra também escritas em tabelas temporárias
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        # Antes do WAL, que já grava o cabeçalho de um banco novo. Em bancos
+        # existentes só passa a valer no próximo VACUUM.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_CONFIG['timeout'] * 1000)}")
+    conn.execute(f"PRAGMA cache_size=-{DB_CONFIG['cache_size_kib']}")
+    conn.execute(f"PRAGMA mmap_size={DB_CONFIG['mmap_size']}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+# Pools por processo: após o fork dos workers do gunicorn cada processo
+# descarta os pools herdados e abre as próprias conexões.
+_pool_conexoes = queue.LifoQueue()
+_pool_leitura = queue.LifoQueue()
+_pool_pid = os.getpid()
+
+
+def _obter_conexao_do_pool(somente_leitura=False):
+    global _pool_conexoes, _pool_leitura, _pool_pid
+    if _pool_pid != os.getpid():
+        _pool_conexoes = queue.LifoQueue()
+        _pool_leitura = queue.LifoQueue()
+        _pool_pid = os.getpid()
+    try:
+        return (_pool_leitura if somente_leitura else _pool_conexoes).get_nowait()
+    except queue.Empty:
+        return abrir_conexao(somente_leitura)
+
+
+def _devolver_conexao_ao_pool(conn, somente_leitura=False):
+    pool = _pool_leitura if somente_leitura else _pool_conexoes
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        if _pool_pid == os.getpid() and pool.qsize() < DB_CONFIG["pool_tamanho"]:
+            pool.put_nowait(conn)
+            return
+    except sqlite3.Error:
+        logger.exception("Conexão descartada do pool")
+    conn.close()
+
+
+def get_db_connection():
+    # Dentro de uma requisição, a conexão vem do pool do motor (ver
+    # ARMAZENAMENTO) e fica presa ao app context (devolvida no teardown).
+    # Fora dele (scripts, inicialização) é uma conexão avulsa que o chamador
+    # deve fechar.
+    if not has_app_context():
+        return motor.abrir()
+
+    if g.get("_somente_leitura") and DB_CONFIG["leitura_ro"]:
+        conn = g.get("_db_conn_leitura")
+        if conn is None:
+            conn = g._db_conn_leitura = motor.obter(somente_leitura=True)
+        return conn
+
+    conn = g.get("_db_conn")
+    if conn is None:
+        conn = motor.obter()
+        g._db_conn = conn
     return conn
 
 
+def somente_leitura(f):
+    # Rotas que só consultam: no SQLite get_db_connection devolve uma conexão
+    # mode=ro, que nunca disputa o lock de escrita (uma escrita acidental
+    # falha com "attempt to write a readonly database"); no PostgreSQL, onde
+    # leitores não esperam escritores, é a conexão comum do pool
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g._somente_leitura = True
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+@app.teardown_appcontext
+def liberar_conexao(exc):
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        motor.devolver(conn)
+    conn = g.pop("_db_conn_leitura", None)
+    if conn is not None:
+        motor.devolver(conn, somente_leitura=True)
+
+
+def _reciclar_conexao(conn):
+    # Depois de um erro num worker de segundo plano: desfaz a transação
+    # aberta e devolve a conexão para a próxima volta, ou None (fechada) se
+    # ela não responde mais, para o worker abrir outra
+    if conn is None:
+        return None
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        return conn
+    except Exception:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        return None
+
+
 def hash_senha(senha: str) -> str:
     return hashlib.sha256(senha.encode()).hexdigest()
 
@@ -67,11 +705,147 @@ def verificar_senha(senha: str, senha_hash: str) -> bool:
     return hash_senha(senha) == senha_hash
 
 
-def criar_tabelas():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _adicionar_coluna(cursor, tabela, coluna, definicao):
+    colunas = {row[1] for row in cursor.execute(f"PRAGMA table_info({tabela})")}
+    if coluna not in colunas:
+        cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+
+
+def _sql_ajuste_estatisticas(linha, sinal):
+    # Soma (ou subtrai) a linha OLD/NEW de contrato nos contadores do dono,
+    # num único UPSERT, usado nos triggers
+    ativo = f"{linha}.status = 'ativo'"
+    return f"""
+            INSERT INTO usuario_estatisticas (usuario_id, total, ativos, vencidos, vencendo_7dias)
+            SELECT
+                {linha}.usuario_id,
+                {sinal}1,
+                {sinal}({ativo}),
+                {sinal}({ativo} AND {linha}.data_fim < r.instante),
+                {sinal}({ativo} AND {linha}.data_fim BETWEEN r.instante AND r.limite_7dias)
+            FROM estatisticas_referencia r
+            WHERE r.id = 1
+            ON CONFLICT(usuario_id) DO UPDATE SET
+                total = total + excluded.total,
+                ativos = ativos + excluded.ativos,
+                vencidos = vencidos + excluded.vencidos,
+                vencendo_7dias = vencendo_7dias + excluded.vencendo_7dias;"""
+
+
+def _sql_ajuste_contagem_status(linha, sinal):
+    # Mesmo esquema para a contagem por status
+    return f"""
+            INSERT INTO contrato_status_contagem (usuario_id, status, total)
+            VALUES ({linha}.usuario_id, {linha}.status, {sinal}1)
+            ON CONFLICT(usuario_id, status) DO UPDATE SET total = total + excluded.total;"""
+
+
+# ========== MIGRAÇÕES ==========
+# Schema do motor SQLite (o PostgreSQL tem o seu em MotorPostgres.SCHEMA).
+# Cada migração roda uma única vez por banco e fica registrada em
+# schema_versao. Elas precisam ser idempotentes (IF NOT EXISTS,
+# _adicionar_coluna, backfills com WHERE): se o processo morrer no meio, a
+# migração é refeita do início na próxima subida. DDL vai numa transação
+# curta; backfills grandes usam preencher_em_lotes, e tabelas mantidas por
+# triggers (contadores, busca) são semeadas por semear_em_lotes.
+def _ddl(conn, *comandos):
+    conn.execute("BEGIN IMMEDIATE")
+    for sql in comandos:
+        conn.execute(sql)
+    conn.commit()
+
+
+def _tabela_existe(conn, nome):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (nome,)).fetchone()
+
+
+def _proximo_lote(conn, tabela, ultimo):
+    # Último rowid dos próximos MIGRACAO_CONFIG["lote"] depois de "ultimo"
+    # (keyset: rowids esparsos não geram lotes vazios); None se acabou
+    return conn.execute(
+        f"SELECT MAX(rowid) FROM (SELECT rowid FROM {tabela} WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+        (ultimo, MIGRACAO_CONFIG["lote"]),
+    ).fetchone()[0]
+
+
+def preencher_em_lotes(conn, tabela, atribuicoes, condicao, params=()):
+    """
+    UPDATE {tabela} SET {atribuicoes} WHERE {condicao}, em lotes de
+    MIGRACAO_CONFIG["lote"] linhas por rowid, cada um na sua transação e com
+    uma pausa entre eles, para as escritas da aplicação não esperarem o
+    backfill inteiro. Retorna quantas linhas mudaram.
+    """
+    ultimo = -1
+    alteradas = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        fim = _proximo_lote(conn, tabela, ultimo)
+        if fim is None:
+            conn.commit()
+            return alteradas
+        alteradas += conn.execute(
+            f"UPDATE {tabela} SET {atribuicoes} WHERE rowid > ? AND rowid <= ? AND ({condicao})",
+            (ultimo, fim, *params),
+        ).rowcount
+        conn.commit()
+        ultimo = fim
+        time.sleep(MIGRACAO_CONFIG["pausa_s"])
+
+
+def _criar_triggers(conn, triggers, marca=None):
+    # triggers: {nome: (evento, condição ou None, corpo)}. Com marca, cada um
+    # só vale para contratos com id <= migracao_marca.ate (ver
+    # semear_em_lotes); o id de OLD e NEW é o mesmo nos updates.
+    for nome, (evento, condicao, corpo) in triggers.items():
+        condicoes = [condicao] if condicao else []
+        if marca:
+            linha = "NEW" if "INSERT" in evento else "OLD"
+            condicoes.append(f"{linha}.id <= (SELECT ate FROM migracao_marca WHERE nome = '{marca}')")
+        quando = "WHEN " + " AND ".join(f"({c})" for c in condicoes) if condicoes else ""
+        conn.execute(f"DROP TRIGGER IF EXISTS {nome}")
+        conn.execute(f"CREATE TRIGGER {nome} {evento} {quando} BEGIN {corpo} END")
+
+
+def semear_em_lotes(conn, marca, triggers, preparar, semear, concluir=None):
+    """
+    Preenche uma tabela derivada de contrato e mantida por triggers
+    (contadores, índice FTS) sem segurar o lock de escrita pela passada
+    inteira. Numa primeira transação, preparar(conn) zera a tabela e os
+    triggers entram valendo só para os contratos com id <= marca (os já
+    semeados). Depois semear(conn, de, ate) trata os ids em (de, ate], em
+    lotes de MIGRACAO_CONFIG["lote"], cada um na transação que avança a
+    marca. Quando não sobra contrato, os triggers passam a valer para todos
+    e concluir(conn) roda, na mesma transação. Refeita do início se o
+    processo morrer no meio.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("CREATE TABLE IF NOT EXISTS migracao_marca (nome TEXT PRIMARY KEY, ate INTEGER NOT NULL)")
+    conn.execute("INSERT OR REPLACE INTO migracao_marca (nome, ate) VALUES (?, -1)", (marca,))
+    preparar(conn)
+    _criar_triggers(conn, triggers, marca)
+    conn.commit()
 
-    cursor.execute(
+    ultimo = -1
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        fim = _proximo_lote(conn, "contrato", ultimo)
+        if fim is None:
+            _criar_triggers(conn, triggers)
+            conn.execute("DELETE FROM migracao_marca WHERE nome = ?", (marca,))
+            if concluir:
+                concluir(conn)
+            conn.commit()
+            return
+        semear(conn, ultimo, fim)
+        conn.execute("UPDATE migracao_marca SET ate = ? WHERE nome = ?", (fim, marca))
+        conn.commit()
+        ultimo = fim
+        time.sleep(MIGRACAO_CONFIG["pausa_s"])
+
+
+def _migracao_tabelas_iniciais(conn):
+    _ddl(
+        conn,
         """
         CREATE TABLE IF NOT EXISTS usuario (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -80,10 +854,7 @@ def criar_tabelas():
             senha_hash TEXT NOT NULL,
             criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        """
-    )
-
-    cursor.execute(
+        """,
         """
         CREATE TABLE IF NOT EXISTS contrato (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -97,10 +868,7 @@ def criar_tabelas():
             usuario_id INTEGER NOT NULL,
             FOREIGN KEY (usuario_id) REFERENCES usuario (id)
         )
-        """
-    )
-
-    cursor.execute(
+        """,
         """
         CREATE TABLE IF NOT EXISTS notificacao (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -114,113 +882,581 @@ def criar_tabelas():
             criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (contrato_id) REFERENCES contrato (id)
         )
+        """,
+        # Versão dos dados de cada usuário: incrementada a cada escrita, serve
+        # de ETag barato para os endpoints consultados periodicamente pelo
+        # frontend.
+        """
+        CREATE TABLE IF NOT EXISTS usuario_versao (
+            usuario_id INTEGER PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (usuario_id) REFERENCES usuario (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario ON contrato(usuario_id)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_data_fim ON contrato(data_fim)",
+        "CREATE INDEX IF NOT EXISTS idx_usuario_email ON usuario(email)",
+    )
+
+
+def _migracao_fila_email(conn):
+    # Controle da fila de envio; lembretes automáticos com no máximo um por
+    # contrato + tipo + dia (chave_idempotencia)
+    conn.execute("BEGIN IMMEDIATE")
+    _adicionar_coluna(conn, "notificacao", "tentativas", "INTEGER NOT NULL DEFAULT 0")
+    _adicionar_coluna(conn, "notificacao", "proxima_tentativa", "TIMESTAMP")
+    _adicionar_coluna(conn, "notificacao", "ultimo_erro", "TEXT")
+    _adicionar_coluna(conn, "notificacao", "chave_idempotencia", "TEXT")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_fila ON notificacao(proxima_tentativa) "
+        "WHERE status = 'pendente'"
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_notificacao_chave ON notificacao(chave_idempotencia) "
+        "WHERE chave_idempotencia IS NOT NULL"
+    )
+    conn.commit()
+
+
+def _migracao_indices_contrato(conn):
+    _ddl(
+        conn,
+        # Listagem paginada por (atualizado_em, id) e filtros de /api/contratos
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_atualizado ON contrato(usuario_id, atualizado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_status_atualizado "
+        "ON contrato(usuario_id, status, atualizado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_data_fim ON contrato(usuario_id, data_fim)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_nome ON contrato(usuario_id, nome COLLATE NOCASE)",
+        # Índice de cobertura das contagens do dashboard
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_status_data_fim ON contrato(usuario_id, status, data_fim)",
+    )
+
+
+def _migracao_datas_canonicas(conn):
+    # Datas gravadas antes da normalização (mistura de "T"/espaço, sem
+    # segundos ou com fuso) passam para o formato canônico de normalizar_data
+    canonico = "'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]:[0-9][0-9]:[0-9][0-9]'"
+    preencher_em_lotes(
+        conn,
+        "contrato",
+        """
+        data_inicio = COALESCE(strftime('%Y-%m-%dT%H:%M:%S', data_inicio), data_inicio),
+        data_fim = COALESCE(strftime('%Y-%m-%dT%H:%M:%S', data_fim), data_fim)
+        """,
+        f"data_inicio NOT GLOB {canonico} OR data_fim NOT GLOB {canonico}",
+    )
+
+
+def _migracao_notificacao_usuario(conn):
+    # Dono da notificação copiado do contrato, para o histórico filtrar e
+    # ordenar só pelo índice, sem juntar com contrato
+    conn.execute("BEGIN IMMEDIATE")
+    _adicionar_coluna(conn, "notificacao", "usuario_id", "INTEGER")
+    conn.commit()
+    preencher_em_lotes(
+        conn,
+        "notificacao",
+        "usuario_id = (SELECT usuario_id FROM contrato WHERE id = notificacao.contrato_id)",
+        "usuario_id IS NULL",
+    )
+    _ddl(
+        conn,
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_usuario_criado ON notificacao(usuario_id, criado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_usuario_status_criado "
+        "ON notificacao(usuario_id, status, criado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_usuario_tipo_criado ON notificacao(usuario_id, tipo, criado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_contrato_criado ON notificacao(contrato_id, criado_em, id)",
+        "DROP INDEX IF EXISTS idx_notificacao_contrato",  # coberto por idx_notificacao_contrato_criado
+    )
+
+
+def _migracao_contadores_dashboard(conn):
+    # Contadores por usuário para o dashboard. As faixas de vencimento são
+    # relativas ao instante em estatisticas_referencia (avançado pelo job
+    # atualizar_estatisticas), não ao relógio de cada escrita. A contagem
+    # inicial anda em lotes junto com os triggers (semear_em_lotes), para
+    # nenhuma escrita escapar da conta nem ser contada duas vezes.
+    _ddl(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS usuario_estatisticas (
+            usuario_id INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            ativos INTEGER NOT NULL DEFAULT 0,
+            vencidos INTEGER NOT NULL DEFAULT 0,
+            vencendo_7dias INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS estatisticas_referencia (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            instante TEXT NOT NULL,
+            limite_7dias TEXT NOT NULL
+        )
+        """,
+    )
+    triggers = {
+        "trg_contrato_estatisticas_insert": (
+            "AFTER INSERT ON contrato",
+            None,
+            _sql_ajuste_estatisticas("NEW", "+"),
+        ),
+        "trg_contrato_estatisticas_update": (
+            "AFTER UPDATE OF status, data_fim, usuario_id ON contrato",
+            None,
+            _sql_ajuste_estatisticas("OLD", "-") + _sql_ajuste_estatisticas("NEW", "+"),
+        ),
+        "trg_contrato_estatisticas_delete": (
+            "AFTER DELETE ON contrato",
+            None,
+            _sql_ajuste_estatisticas("OLD", "-"),
+        ),
+    }
+    instante, limite = _referencia_estatisticas(datetime.utcnow())
+
+    def preparar(conn):
+        conn.execute("DELETE FROM usuario_estatisticas")
+        conn.execute(
+            "INSERT OR REPLACE INTO estatisticas_referencia (id, instante, limite_7dias) VALUES (1, ?, ?)",
+            (instante, limite),
+        )
+
+    def semear(conn, de, ate):
+        conn.execute(
+            """
+            INSERT INTO usuario_estatisticas (usuario_id, total, ativos, vencidos, vencendo_7dias)
+            SELECT
+                usuario_id,
+                COUNT(*),
+                SUM(status = 'ativo'),
+                SUM(status = 'ativo' AND data_fim < ?),
+                SUM(status = 'ativo' AND data_fim BETWEEN ? AND ?)
+            FROM contrato
+            WHERE id > ? AND id <= ?
+            GROUP BY usuario_id
+            ON CONFLICT(usuario_id) DO UPDATE SET
+                total = total + excluded.total,
+                ativos = ativos + excluded.ativos,
+                vencidos = vencidos + excluded.vencidos,
+                vencendo_7dias = vencendo_7dias + excluded.vencendo_7dias
+            """,
+            (instante, instante, limite, de, ate),
+        )
+
+    def concluir(conn):
+        conn.execute("UPDATE usuario_versao SET versao = versao + 1")
+
+    semear_em_lotes(conn, "contadores_dashboard", triggers, preparar, semear, concluir)
+
+
+def _migracao_busca_fts(conn):
+    # Busca textual (FTS5) sobre nome e descrição. Tabela de conteúdo externo:
+    # o índice guarda só os tokens e lê o texto de contrato; os triggers o
+    # mantêm em sincronia. remove_diacritics faz "licitacao" achar "licitação".
+    # usuario_id também é indexado para a consulta já cruzar com o dono dentro
+    # do índice, em vez de pontuar os contratos de todos os usuários.
+    # A indexação anda em lotes (semear_em_lotes): até um contrato ser
+    # indexado os triggers o ignoram, para o 'delete' de um update nunca
+    # apagar tokens que ainda não estão no índice.
+    _ddl(
+        conn,
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS contrato_fts USING fts5(
+            nome, descricao, usuario_id,
+            content = 'contrato', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3',
+            detail = column
+        )
+        """,
+    )
+    inserir = """
+            INSERT INTO contrato_fts (rowid, nome, descricao, usuario_id)
+            VALUES (NEW.id, NEW.nome, NEW.descricao, NEW.usuario_id);"""
+    remover = """
+            INSERT INTO contrato_fts (contrato_fts, rowid, nome, descricao, usuario_id)
+            VALUES ('delete', OLD.id, OLD.nome, OLD.descricao, OLD.usuario_id);"""
+    triggers = {
+        "trg_contrato_fts_insert": ("AFTER INSERT ON contrato", None, inserir),
+        "trg_contrato_fts_update": ("AFTER UPDATE OF nome, descricao, usuario_id ON contrato", None, remover + inserir),
+        "trg_contrato_fts_delete": ("AFTER DELETE ON contrato", None, remover),
+    }
+
+    def preparar(conn):
+        conn.execute("INSERT INTO contrato_fts (contrato_fts) VALUES ('delete-all')")
+
+    def semear(conn, de, ate):
+        conn.execute(
+            """
+            INSERT INTO contrato_fts (rowid, nome, descricao, usuario_id)
+            SELECT id, nome, descricao, usuario_id FROM contrato WHERE id > ? AND id <= ?
+            """,
+            (de, ate),
+        )
+
+    semear_em_lotes(conn, "busca_fts", triggers, preparar, semear)
+
+
+def _migracao_retencao(conn):
+    _ddl(
+        conn,
+        # Contagens das notificações que já foram para o arquivo
+        """
+        CREATE TABLE IF NOT EXISTS notificacao_resumo (
+            contrato_id INTEGER NOT NULL,
+            tipo TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            primeira TIMESTAMP,
+            ultima TIMESTAMP,
+            PRIMARY KEY (contrato_id, tipo, status)
+        )
+        """,
+        # Última execução dos jobs periódicos, compartilhada entre os workers
         """
+        CREATE TABLE IF NOT EXISTS manutencao (
+            tarefa TEXT PRIMARY KEY,
+            executada_em TIMESTAMP NOT NULL
+        )
+        """,
     )
 
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_contrato_usuario ON contrato(usuario_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notificacao_contrato ON notificacao(contrato_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_contrato_data_fim ON contrato(data_fim)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_usuario_email ON usuario(email)")
 
-    # Garante admin
-    cursor.execute("SELECT COUNT(*) as total FROM usuario WHERE email = ?", ("admin@contratomais.com",))
-    total = cursor.fetchone()[0]
-    if total == 0:
-        senha_hash = hash_senha("admin123")
-        cursor.execute(
-            "INSERT INTO usuario (nome_completo, email, senha_hash) VALUES (?, ?, ?)",
-            ("Administrador", "admin@contratomais.com", senha_hash),
+def _migracao_contagem_status(conn):
+    # Contratos por usuário e status, mantidos pelos triggers, para totais=1
+    # não agrupar todos os contratos do usuário a cada listagem. Contagem
+    # inicial em lotes, como em contadores_dashboard.
+    _ddl(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS contrato_status_contagem (
+            usuario_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (usuario_id, status)
+        ) WITHOUT ROWID
+        """,
+    )
+    triggers = {
+        "trg_contrato_status_insert": (
+            "AFTER INSERT ON contrato",
+            None,
+            _sql_ajuste_contagem_status("NEW", "+"),
+        ),
+        "trg_contrato_status_update": (
+            "AFTER UPDATE OF status, usuario_id ON contrato",
+            "OLD.status IS NOT NEW.status OR OLD.usuario_id IS NOT NEW.usuario_id",
+            _sql_ajuste_contagem_status("OLD", "-") + _sql_ajuste_contagem_status("NEW", "+"),
+        ),
+        "trg_contrato_status_delete": (
+            "AFTER DELETE ON contrato",
+            None,
+            _sql_ajuste_contagem_status("OLD", "-"),
+        ),
+    }
+
+    def preparar(conn):
+        conn.execute("DELETE FROM contrato_status_contagem")
+
+    def semear(conn, de, ate):
+        conn.execute(
+            """
+            INSERT INTO contrato_status_contagem (usuario_id, status, total)
+            SELECT usuario_id, status, COUNT(*) FROM contrato
+            WHERE id > ? AND id <= ?
+            GROUP BY usuario_id, status
+            ON CONFLICT(usuario_id, status) DO UPDATE SET total = total + excluded.total
+            """,
+            (de, ate),
         )
 
+    semear_em_lotes(conn, "contagem_status", triggers, preparar, semear)
+
+
+# Em ordem; uma versão nunca muda depois de publicada: alterações viram uma
+# migração nova no fim da lista
+MIGRACOES = (
+    (1, "tabelas_iniciais", _migracao_tabelas_iniciais),
+    (2, "fila_email", _migracao_fila_email),
+    (3, "indices_contrato", _migracao_indices_contrato),
+    (4, "datas_canonicas", _migracao_datas_canonicas),
+    (5, "notificacao_usuario", _migracao_notificacao_usuario),
+    (6, "contadores_dashboard", _migracao_contadores_dashboard),
+    (7, "busca_fts", _migracao_busca_fts),
+    (8, "retencao", _migracao_retencao),
+    (9, "contagem_status", _migracao_contagem_status),
+)
+
+
+def _garantir_admin(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    if not repo_usuarios.por_email(conn, "admin@contratomais.com"):
+        repo_usuarios.garantir(conn, "Administrador", "admin@contratomais.com", hash_senha("admin123"))
     conn.commit()
-    conn.close()
+
+
+def versoes_aplicadas(conn):
+    if not _tabela_existe(conn, "schema_versao"):
+        return {}
+    return {
+        linha["versao"]: linha["aplicada_em"]
+        for linha in conn.execute("SELECT versao, aplicada_em FROM schema_versao")
+    }
+
+
+def migrar_banco():
+    """
+    Aplica as migrações pendentes. Uma trava de arquivo ao lado do banco
+    garante que só um processo migra por vez (o master do gunicorn, o
+    servidor de desenvolvimento, um comando da CLI); quem chega depois
+    espera e encontra tudo aplicado. Retorna as versões aplicadas agora.
+    """
+    with open(MIGRACAO_CONFIG["trava"], "a") as trava:
+        if fcntl is not None:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        conn = abrir_conexao()
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_versao (
+                    versao INTEGER PRIMARY KEY,
+                    nome TEXT NOT NULL,
+                    aplicada_em TIMESTAMP NOT NULL,
+                    duracao_s REAL
+                )
+                """
+            )
+            conn.commit()
+            aplicadas = versoes_aplicadas(conn)
+            novas = []
+            for versao, nome, migracao in MIGRACOES:
+                if versao in aplicadas:
+                    continue
+                logger.info(f"Aplicando migração {versao:03d}_{nome}")
+                inicio = time.monotonic()
+                migracao(conn)
+                conn.execute(
+                    "INSERT INTO schema_versao (versao, nome, aplicada_em, duracao_s) VALUES (?, ?, ?, ?)",
+                    (versao, nome, _agora_iso(), round(time.monotonic() - inicio, 3)),
+                )
+                conn.commit()
+                novas.append(versao)
+            _garantir_admin(conn)
+            return novas
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_UN)
 
 
 def resetar_banco_completo():
-    # Reset literal: apaga o arquivo do SQLite e recria tudo do zero
+    # Reset literal: apaga todas as tabelas e recria tudo do zero. O arquivo
+    # não é removido: em WAL outras conexões do pool (e outros workers) ainda
+    # o mantêm aberto, e apagá-lo deixaria -wal/-shm órfãos.
+    conn = abrir_conexao()
     try:
-        if os.path.exists(DATABASE):
-            os.remove(DATABASE)
+        conn.execute("BEGIN IMMEDIATE")
+        while True:
+            tabela = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name NOT LIKE 'sqlite_%' AND name != 'usuario_versao' "
+                # tabelas virtuais antes: levam junto as suas tabelas internas
+                "ORDER BY sql LIKE 'CREATE VIRTUAL TABLE%' DESC LIMIT 1"
+            ).fetchone()
+            if not tabela:
+                break
+            conn.execute(f'DROP TABLE "{tabela[0]}"')
+        # As versões continuam crescendo após o reset (os ids de usuário são
+        # reaproveitados), para que ETags e caches antigos nunca coincidam
+        # com os dados novos.
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'usuario_versao'").fetchone():
+            conn.execute("UPDATE usuario_versao SET versao = versao + 1")
+        conn.commit()
+        conn.execute("VACUUM")
     except Exception as e:
-        logger.error(f"Falha ao remover banco: {str(e)}")
+        conn.rollback()
+        logger.error(f"Falha ao apagar banco: {str(e)}")
         raise
+    finally:
+        conn.close()
+
+    # Os ids recomeçam após o reset; o arquivo antigo não pode se misturar
+    if os.path.exists(RETENCAO_CONFIG["arquivo"]):
+        os.remove(RETENCAO_CONFIG["arquivo"])
 
-    criar_tabelas()
+    migrar_banco()
 
 
-def calcular_dias_restantes(data_fim):
+def normalizar_data(valor):
+    # Forma canônica de data_inicio/data_fim: ISO em UTC, sem fuso e com
+    # segundos (AAAA-MM-DDTHH:MM:SS). Ordena como texto e é lida de volta
+    # por um único fromisoformat.
     try:
-        if isinstance(data_fim, str):
-            try:
-                data_fim_obj = datetime.fromisoformat(data_fim.replace("Z", "+00:00"))
-            except Exception:
-                data_fim_obj = datetime.strptime(data_fim, "%Y-%m-%d %H:%M:%S")
-        else:
-            data_fim_obj = data_fim
+        data = valor if isinstance(valor, datetime) else datetime.fromisoformat(str(valor).strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Data inválida: {valor}")
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc).replace(tzinfo=None)
+    return data.isoformat(timespec="seconds")
 
-        hoje = datetime.utcnow()
-        diferenca = data_fim_obj - hoje
-        return diferenca.days
-    except Exception:
+
+def inicio_dia_utc(agora=None):
+    return (agora or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def calcular_dias_restantes(data_fim, agora=None):
+    # Dias de calendário (UTC) até data_fim: contados do início do dia, o
+    # valor só muda à meia-noite, junto com o dia que entra no ETag das
+    # listagens. Listagens passam o mesmo "agora" para todas as linhas.
+    try:
+        return (datetime.fromisoformat(data_fim) - inicio_dia_utc(agora)).days
+    except (TypeError, ValueError):
         return None
 
 
-def formatar_data_brasil(data):
-    if isinstance(data, str):
-        try:
-            data = datetime.fromisoformat(data.replace("Z", "+00:00"))
-        except Exception:
-            data = datetime.strptime(data, "%Y-%m-%d %H:%M:%S")
-    return data.strftime("%d/%m/%Y %H:%M")
+def contrato_para_dict(contrato, campos=CAMPOS_CONTRATO, agora=None):
+    item = {}
+    for campo in campos:
+        if campo == "dias_restantes":
+            item[campo] = calcular_dias_restantes(contrato["data_fim"], agora)
+        else:
+            item[campo] = contrato[campo]
+    return item
 
 
-def criar_template_email(assunto, titulo, mensagem, tipo_notificacao=None, contrato=None):
-    if contrato:
-        data_inicio = formatar_data_brasil(contrato["data_inicio"])
-        data_fim = formatar_data_brasil(contrato["data_fim"])
+# dias_restantes calculado pelo SQLite (MotorSQLite.dias_restantes), com o
+# mesmo arredondamento para baixo de timedelta.days; o deslocamento mantém a
+# divisão inteira sobre positivos
+_SQL_DIAS_RESTANTES = "(CAST(strftime('%s', {p}data_fim) AS INTEGER) - ? + 8640000000) / 86400 - 100000"
 
-        hoje = datetime.utcnow()
-        try:
-            data_fim_obj = datetime.fromisoformat(str(contrato["data_fim"]).replace("Z", "+00:00"))
-        except Exception:
-            data_fim_obj = datetime.strptime(str(contrato["data_fim"]), "%Y-%m-%d %H:%M:%S")
 
-        dias_restantes = (data_fim_obj - hoje).days
+def epoch_agora(agora=None):
+    # Arredondado para cima: com data_fim em segundos inteiros, dá o mesmo
+    # resultado que (data_fim - agora).days com os microssegundos
+    agora = agora or datetime.utcnow()
+    return math.ceil(agora.replace(tzinfo=timezone.utc).timestamp())
 
-        if tipo_notificacao == "urgente":
-            cor_primaria = "#dc2626"
-        elif tipo_notificacao == "aviso":
-            cor_primaria = "#f59e0b"
-        else:
-            cor_primaria = "#10b981"
 
+def resposta_lista_json(chave, itens_json, **campos):
+    # Envelope {"success": true, ...campos, chave: [itens]} com os itens já
+    # em JSON (serializados no banco pelos repositórios), sem decodificá-los
+    # de novo
+    corpo = app.json.dumps({"success": True, **campos})
+    return app.response_class(f'{corpo[:-1]},"{chave}":[{",".join(itens_json)}]}}', mimetype="application/json")
+
+
+def termos_busca(texto):
+    # Palavras da busca textual; pontuação e operadores digitados pelo
+    # usuário (do FTS5 ou do tsquery) não são interpretados
+    return re.findall(r"[^\W_]+", texto)
+
+
+def montar_consulta_fts(termos, usuario_id):
+    # Consulta FTS5 (motor SQLite): cada palavra vira um termo entre aspas
+    # com busca por prefixo ("venc"*), todos obrigatórios e restritos a
+    # nome/descrição
+    palavras = " ".join(f'"{t}"*' for t in termos)
+    return f'usuario_id : "{int(usuario_id)}" AND {{nome descricao}} : ({palavras})'
+
+
+def codificar_cursor(atualizado_em, id):
+    bruto = json.dumps([atualizado_em, id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        atualizado_em, id = json.loads(bruto)
+        return str(atualizado_em), int(id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def ler_limite_data(valor, fim=False):
+    # Aceita data (AAAA-MM-DD) ou data/hora ISO. Uma data pura como limite
+    # final inclui o dia inteiro.
+    try:
+        if len(valor) == 10:
+            dia = datetime.strptime(valor, "%Y-%m-%d")
+            if fim:
+                return (dia + timedelta(days=1)).strftime("%Y-%m-%d"), False
+            return dia.strftime("%Y-%m-%d"), True
+        return normalizar_data(valor), True
+    except ValueError:
+        raise ValueError(f"Data inválida: {valor}")
+
+
+def formatar_data_brasil(data):
+    if isinstance(data, str):
+        # formato canônico (AAAA-MM-DDTHH:MM:SS): recorta sem converter
+        if len(data) >= 16 and data[4] == "-" and data[10] in "T ":
+            return f"{data[8:10]}/{data[5:7]}/{data[0:4]} {data[11:16]}"
+        data = datetime.fromisoformat(data)
+    return data.strftime("%d/%m/%Y %H:%M")
+
+
+def cor_por_tipo(tipo_notificacao, com_contrato=True):
+    if not com_contrato:
+        return "#2563eb"
+    if tipo_notificacao == "urgente":
+        return "#dc2626"
+    if tipo_notificacao == "aviso":
+        return "#f59e0b"
+    return "#10b981"
+
+
+def detalhes_contrato_email(contrato, agora=None):
+    # Trechos do email que dependem do contrato, já formatados
+    dias_restantes = calcular_dias_restantes(contrato["data_fim"], agora)
+    return {
+        "nome": contrato["nome"],
+        "descricao": contrato["descricao"] or "Não informada",
+        "data_inicio": formatar_data_brasil(contrato["data_inicio"]),
+        "data_fim": formatar_data_brasil(contrato["data_fim"]),
+        "dias_restantes": dias_restantes,
+        "fundo_dias": "#fee2e2" if dias_restantes < 7 else "#fef3c7" if dias_restantes < 30 else "#d1fae5",
+        "cor_dias": "#991b1b" if dias_restantes < 7 else "#92400e" if dias_restantes < 30 else "#065f46",
+    }
+
+
+def layout_email(assunto, titulo, mensagem, tipo_notificacao=None, detalhes=None):
+    # Layout do email montado por inteiro a cada chamada. Os envios usam a
+    # versão compilada (compilar_template_email), gerada a partir deste.
+    cor_primaria = cor_por_tipo(tipo_notificacao, detalhes is not None)
+    rotulo = (tipo_notificacao or "notificacao").upper()
+    if detalhes:
         detalhes_contrato = f"""
         <div style="background:#f8fafc;border-radius:8px;padding:20px;margin:20px 0;border-left:4px solid {cor_primaria};">
             <h3 style="margin-top:0;color:#1e293b;">Detalhes do Contrato</h3>
             <table style="width:100%;border-collapse:collapse;">
                 <tr>
                     <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;"><strong>Nome:</strong></td>
-                    <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;">{contrato["nome"]}</td>
+                    <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;">{detalhes["nome"]}</td>
                 </tr>
                 <tr>
                     <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;"><strong>Descrição:</strong></td>
-                    <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;">{contrato["descricao"] or "Não informada"}</td>
+                    <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;">{detalhes["descricao"]}</td>
                 </tr>
                 <tr>
                     <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;"><strong>Data Início:</strong></td>
-                    <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;">{data_inicio}</td>
+                    <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;">{detalhes["data_inicio"]}</td>
                 </tr>
                 <tr>
                     <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;"><strong>Data Término:</strong></td>
-                    <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;">{data_fim}</td>
+                    <td style="padding:8px 0;border-bottom:1px solid #e2e8f0;">{detalhes["data_fim"]}</td>
                 </tr>
                 <tr>
                     <td style="padding:8px 0;"><strong>Dias Restantes:</strong></td>
                     <td style="padding:8px 0;">
-                        <span style="background: {'#fee2e2' if dias_restantes < 7 else '#fef3c7' if dias_restantes < 30 else '#d1fae5'};
-                              color: {'#991b1b' if dias_restantes < 7 else '#92400e' if dias_restantes < 30 else '#065f46'};
+                        <span style="background: {detalhes["fundo_dias"]};
+                              color: {detalhes["cor_dias"]};
                               padding:4px 12px;border-radius:20px;font-weight:bold;">
-                            {dias_restantes} dias
+                            {detalhes["dias_restantes"]} dias
                         </span>
                     </td>
                 </tr>
@@ -229,7 +1465,6 @@ def criar_template_email(assunto, titulo, mensagem, tipo_notificacao=None, contr
         """
     else:
         detalhes_contrato = ""
-        cor_primaria = "#2563eb"
 
     html = f"""
     <!DOCTYPE html>
@@ -248,7 +1483,7 @@ def criar_template_email(assunto, titulo, mensagem, tipo_notificacao=None, contr
             <div style="padding:22px;">
                 <h2 style="margin:0 0 8px 0;">{titulo}</h2>
                 <div style="display:inline-block;background:{cor_primaria}22;color:{cor_primaria};padding:8px 14px;border-radius:999px;font-weight:700;margin-bottom:14px;">
-                    {(tipo_notificacao or "notificacao").upper()}
+                    {rotulo}
                 </div>
                 <div style="color:#0f172a;line-height:1.6;">{mensagem}</div>
                 {detalhes_contrato}
@@ -268,81 +1503,2477 @@ def criar_template_email(assunto, titulo, mensagem, tipo_notificacao=None, contr
     return html
 
 
-def enviar_email(destinatarios, assunto, corpo_html, corpo_texto=None):
-    try:
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = assunto
-        msg["From"] = f'CONTRATO+ <{EMAIL_CONFIG["sender_email"]}>'
+# Marca dos trechos variáveis no layout compilado
+_MARCA_TEMPLATE = "\x00"
+_CAMPOS_TEMPLATE = ("assunto", "titulo", "mensagem")
+_CAMPOS_DETALHES = ("nome", "descricao", "data_inicio", "data_fim", "dias_restantes", "fundo_dias", "cor_dias")
 
-        if isinstance(destinatarios, list):
-            msg["To"] = ", ".join(destinatarios)
-            to_list = destinatarios
-        else:
-            msg["To"] = destinatarios
-            to_list = [destinatarios]
 
-        if corpo_texto:
-            msg.attach(MIMEText(corpo_texto, "plain"))
-        msg.attach(MIMEText(corpo_html, "html"))
+@lru_cache(maxsize=None)
+def compilar_template_email(tipo_notificacao, com_contrato):
+    """
+    Compila o layout uma vez por (tipo, com/sem contrato): gera o HTML com
+    marcas no lugar dos trechos variáveis e o quebra em partes fixas e
+    nomes de campos. Devolve (partes, posicoes), com posicoes = [(índice em
+    partes, campo)].
+    """
+    def marca(campo):
+        return f"{_MARCA_TEMPLATE}{campo}{_MARCA_TEMPLATE}"
 
-        server = smtplib.SMTP(EMAIL_CONFIG["smtp_server"], EMAIL_CONFIG["smtp_port"])
-        server.ehlo()
-        if EMAIL_CONFIG["use_tls"]:
-            server.starttls()
+    detalhes = {campo: marca(campo) for campo in _CAMPOS_DETALHES} if com_contrato else None
+    html = layout_email(*(marca(c) for c in _CAMPOS_TEMPLATE), tipo_notificacao=tipo_notificacao, detalhes=detalhes)
+    partes = html.split(_MARCA_TEMPLATE)
+    # split deixa os nomes dos campos nas posições ímpares
+    return tuple(partes), tuple((i, partes[i]) for i in range(1, len(partes), 2))
 
-        server.login(EMAIL_CONFIG["sender_email"], EMAIL_CONFIG["sender_password"])
-        server.send_message(msg)
-        server.quit()
 
-        logger.info(f"Email enviado para {to_list}")
-        return True
-    except Exception as e:
-        logger.error(f"Erro ao enviar email: {str(e)}")
-        return False
+def renderizar_template_email(template, valores):
+    partes, posicoes = template
+    saida = list(partes)
+    for i, campo in posicoes:
+        saida[i] = str(valores[campo])
+    return "".join(saida)
 
 
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if "usuario_id" not in session:
+def criar_template_email(assunto, titulo, mensagem, tipo_notificacao=None, contrato=None):
+    valores = {"assunto": assunto, "titulo": titulo, "mensagem": mensagem}
+    if contrato:
+        valores.update(detalhes_contrato_email(contrato))
+    return renderizar_template_email(compilar_template_email(tipo_notificacao, bool(contrato)), valores)
+
+
+# ========== SMTP ==========
+class _SessaoSMTP:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.enviadas = 0
+        self.usada_em = time.monotonic()
+
+
+class PoolSMTP:
+    """
+    Sessões SMTP autenticadas reaproveitadas entre envios.
+
+    - no máximo config["conexoes_max"] sessões abertas ao mesmo tempo
+    - sessões ociosas são testadas com NOOP antes do uso e reabertas se o
+      servidor tiver derrubado a conexão
+    - cada sessão envia até config["mensagens_por_sessao"] mensagens
+    - envios limitados a config["envios_por_segundo"] neste servidor
+
+    Sem sender_password o login é pulado, o que permite apontar o pool
+    para um servidor local de testes (ex.: aiosmtpd).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._ociosas = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(config["conexoes_max"])
+        self._taxa_lock = threading.Lock()
+        self._proximo_envio = 0.0
+
+    def _conectar(self):
+        inicio = time.perf_counter()
+        smtp = smtplib.SMTP(self.config["smtp_server"], self.config["smtp_port"], timeout=self.config["timeout_s"])
+        smtp.ehlo()
+        if self.config["use_tls"]:
+            smtp.starttls()
+            smtp.ehlo()
+        if self.config.get("sender_password"):
+            smtp.login(self.config["sender_email"], self.config["sender_password"])
+        metricas.observar("contratomais_smtp_conexao_segundos", time.perf_counter() - inicio)
+        return _SessaoSMTP(smtp)
+
+    def _fechar(self, sessao):
+        try:
+            sessao.smtp.quit()
+        except Exception:
+            sessao.smtp.close()
+
+    def _descartar(self, sessao):
+        if sessao is not None:
+            sessao.smtp.close()
+        return None
+
+    def _obter(self):
+        while True:
+            try:
+                sessao = self._ociosas.get_nowait()
+            except queue.Empty:
+                return self._conectar()
+
+            ociosa = time.monotonic() - sessao.usada_em
+            if ociosa > self.config["ociosa_max_s"]:
+                self._fechar(sessao)
+                continue
+            if ociosa > self.config["verificar_apos_s"]:
+                try:
+                    if sessao.smtp.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP recusado")
+                except (smtplib.SMTPException, OSError):
+                    sessao.smtp.close()
+                    continue
+            return sessao
+
+    def _devolver(self, sessao):
+        sessao.usada_em = time.monotonic()
+        if sessao.enviadas >= self.config["mensagens_por_sessao"]:
+            self._fechar(sessao)
+        else:
+            self._ociosas.put(sessao)
+
+    def _aguardar_vez(self):
+        intervalo = 1.0 / self.config["envios_por_segundo"]
+        with self._taxa_lock:
+            agora = time.monotonic()
+            envio = max(agora, self._proximo_envio)
+            self._proximo_envio = envio + intervalo
+        if envio > agora:
+            time.sleep(envio - agora)
+
+    def enviar(self, mensagens):
+        """
+        Envia as mensagens (EmailMessage/MIME) numa mesma sessão, trocando de
+        sessão quando ela atinge o limite de mensagens. Retorna uma lista
+        com None (enviada) ou a mensagem de erro de cada uma.
+        """
+        resultados = []
+        self._vagas.acquire()
+        sessao = None
+        try:
+            for msg in mensagens:
+                self._aguardar_vez()
+                erro = None
+                for tentativa in range(2):
+                    try:
+                        if sessao is None:
+                            sessao = self._obter()
+                        inicio = time.perf_counter()
+                        resultado = "erro"
+                        try:
+                            sessao.smtp.send_message(msg)
+                            resultado = "ok"
+                        finally:
+                            metricas.observar(
+                                "contratomais_smtp_envio_segundos", time.perf_counter() - inicio, resultado=resultado
+                            )
+                        sessao.enviadas += 1
+                        erro = None
+                        break
+                    except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError) as e:
+                        # conexão caiu (ou não abriu): reabre e tenta a mesma
+                        # mensagem mais uma vez
+                        erro = str(e) or e.__class__.__name__
+                        sessao = self._descartar(sessao)
+                    except smtplib.SMTPException as e:
+                        # recusa do servidor para esta mensagem (tratada antes
+                        # de OSError, do qual SMTPException herda)
+                        erro = str(e) or e.__class__.__name__
+                        break
+                    except OSError as e:
+                        erro = str(e) or e.__class__.__name__
+                        sessao = self._descartar(sessao)
+                resultados.append(erro)
+
+                if sessao is None:
+                    # sem sessão com o servidor: o resto do lote fica para a
+                    # próxima tentativa
+                    resultados.extend([erro] * (len(mensagens) - len(resultados)))
+                    break
+                if sessao.enviadas >= self.config["mensagens_por_sessao"]:
+                    self._fechar(sessao)
+                    sessao = None
+        finally:
+            if sessao is not None:
+                self._devolver(sessao)
+            self._vagas.release()
+        return resultados
+
+    def fechar(self):
+        while True:
+            try:
+                self._fechar(self._ociosas.get_nowait())
+            except queue.Empty:
+                return
+
+
+_pool_smtp = None
+_pool_smtp_pid = None
+_pool_smtp_lock = threading.Lock()
+
+
+def obter_pool_smtp():
+    global _pool_smtp, _pool_smtp_pid
+    with _pool_smtp_lock:
+        if _pool_smtp_pid != os.getpid():
+            _pool_smtp = PoolSMTP(EMAIL_CONFIG)
+            _pool_smtp_pid = os.getpid()
+        return _pool_smtp
+
+
+def montar_mensagem_email(destinatarios, assunto, corpo_html, corpo_texto=None):
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = assunto
+    msg["From"] = f'CONTRATO+ <{EMAIL_CONFIG["sender_email"]}>'
+
+    if isinstance(destinatarios, list):
+        msg["To"] = ", ".join(destinatarios)
+    else:
+        msg["To"] = destinatarios
+
+    if corpo_texto:
+        msg.attach(MIMEText(corpo_texto, "plain"))
+    msg.attach(MIMEText(corpo_html, "html"))
+    return msg
+
+
+def enviar_emails_lote(mensagens):
+    return obter_pool_smtp().enviar(mensagens)
+
+
+def _enviar_email(destinatarios, assunto, corpo_html, corpo_texto=None):
+    msg = montar_mensagem_email(destinatarios, assunto, corpo_html, corpo_texto)
+    erro = enviar_emails_lote([msg])[0]
+    if erro:
+        raise smtplib.SMTPException(erro)
+
+    logger.info(f"Email enviado para {msg['To']}")
+
+
+def enviar_email(destinatarios, assunto, corpo_html, corpo_texto=None):
+    try:
+        _enviar_email(destinatarios, assunto, corpo_html, corpo_texto)
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao enviar email: {str(e)}")
+        return False
+
+
+# tipo -> (tipo_design, titulo, mensagem padrão com {nome} do contrato)
+CONTEUDO_NOTIFICACAO = {
+    "lembrete_diario": ("urgente", "Contrato vence amanhã", "O contrato <strong>{nome}</strong> está prestes a vencer."),
+    "lembrete_semanal": (
+        "aviso",
+        "Contrato próximo do vencimento",
+        "O contrato <strong>{nome}</strong> vencerá em 7 dias.",
+    ),
+    "lembrete_mensal": ("info", "Lembrete de contrato", "O contrato <strong>{nome}</strong> vencerá em 30 dias."),
+}
+MENSAGEM_NOTIFICACAO_PADRAO = "Notificação referente ao contrato <strong>{nome}</strong>."
+
+# Lembretes automáticos: tipo -> dias antes do vencimento
+LEMBRETES_AUTOMATICOS = {
+    "lembrete_diario": 1,
+    "lembrete_semanal": 7,
+    "lembrete_mensal": 30,
+}
+
+
+def conteudo_por_tipo(tipo, assunto, contrato):
+    # (tipo_design, titulo, mensagem padrão) de cada tipo de notificação
+    if tipo in CONTEUDO_NOTIFICACAO:
+        tipo_design, titulo, mensagem = CONTEUDO_NOTIFICACAO[tipo]
+    else:
+        tipo_design, titulo, mensagem = "info", assunto, MENSAGEM_NOTIFICACAO_PADRAO
+    return tipo_design, titulo, mensagem.format(nome=contrato["nome"])
+
+
+def montar_email_notificacao(notificacao, contrato, detalhes=None):
+    tipo_design, titulo, _ = conteudo_por_tipo(notificacao["tipo"], notificacao["assunto"], contrato)
+    assunto = notificacao["assunto"]
+    mensagem = notificacao["mensagem"]
+    detalhes = detalhes or detalhes_contrato_email(contrato)
+
+    html_content = renderizar_template_email(
+        compilar_template_email(tipo_design, True),
+        dict(detalhes, assunto=assunto, titulo=titulo, mensagem=mensagem),
+    )
+
+    texto_simples = f"""CONTRATO+ - {assunto}
+
+{titulo}
+
+{mensagem}
+
+Contrato: {contrato['nome']}
+Data de Término: {detalhes["data_fim"]}
+Status: {contrato['status']}
+
+Acesse: http://localhost:5000/dashboard.html
+"""
+    return html_content, texto_simples
+
+
+def montar_emails_lote(itens):
+    """
+    Renderiza um lote de (notificacao, contrato) de uma vez: um único
+    "agora" para todos e os trechos de cada contrato formatados uma só vez,
+    mesmo com várias notificações dele. Devolve, na ordem, (html, texto)
+    ou a exceção que impediu aquele email.
+    """
+    agora = datetime.utcnow()
+    detalhes_por_contrato = {}
+    resultados = []
+    for notificacao, contrato in itens:
+        try:
+            detalhes = detalhes_por_contrato.get(contrato["id"])
+            if detalhes is None:
+                detalhes = detalhes_por_contrato[contrato["id"]] = detalhes_contrato_email(contrato, agora)
+            resultados.append(montar_email_notificacao(notificacao, contrato, detalhes))
+        except Exception as e:
+            resultados.append(e)
+    return resultados
+
+
+def marcar_alteracao(conn, usuario_id):
+    # Chamada na mesma transação da escrita; o commit fica com o chamador.
+    # Retorna a nova versão (para publicar_evento após o commit).
+    return conn.execute(_SQL_MARCAR_ALTERACAO, (usuario_id,)).fetchone()[0]
+
+
+def obter_versao_dados(conn, usuario_id):
+    row = conn.execute("SELECT versao FROM usuario_versao WHERE usuario_id = ?", (usuario_id,)).fetchone()
+    return row["versao"] if row else 0
+
+
+# ========== ARMAZENAMENTO ==========
+# O app inteiro (rotas, fila de emails, jobs, CLI) lê e grava por um motor:
+# MotorSQLite (o padrão, um servidor) ou MotorPostgres (com
+# CONTRATOS_POSTGRES_URL, para vários nós atrás de um balanceador). Os dois
+# entregam conexões com a mesma interface da sqlite3 (execute com "?",
+# linhas por posição e por nome, commit/rollback), e o SQL é comum; o que
+# muda de um banco para outro (JSON, datas, prefixo sem caixa, lista de ids,
+# busca textual, locks, cursor de servidor, schema) fica nos métodos do
+# motor. Os métodos dos repositórios recebem a conexão e não fazem commit,
+# como as escritas do escritor (executar_escrita).
+class MotorSQLite:
+    nome = "sqlite"
+    # um escritor por vez no banco: o escritor do processo junta as escritas
+    # concorrentes numa transação (ver ESCRITAS AGRUPADAS)
+    escritas_agrupadas = True
+
+    def abrir(self, somente_leitura=False):
+        return abrir_conexao(somente_leitura)
+
+    def obter(self, somente_leitura=False):
+        return _obter_conexao_do_pool(somente_leitura)
+
+    def devolver(self, conn, somente_leitura=False):
+        _devolver_conexao_ao_pool(conn, somente_leitura)
+
+    def ociosas(self):
+        # conexões paradas no pool deste processo, por pool
+        if _pool_pid != os.getpid():
+            return {"escrita": 0, "leitura": 0}
+        return {"escrita": _pool_conexoes.qsize(), "leitura": _pool_leitura.qsize()}
+
+    @contextmanager
+    def conexao(self):
+        # commit ao sair sem erro; com erro, o que não foi commitado se perde
+        conn = abrir_conexao()
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def cursor_tuplas(self, conn):
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return cursor
+
+    def json_objeto(self, pares):
+        return f"json_object({', '.join(pares)})"
+
+    def dias_restantes(self, prefixo=""):
+        # expressão e o parâmetro que ela consome
+        return _SQL_DIAS_RESTANTES.format(p=prefixo), epoch_agora(inicio_dia_utc())
+
+    def agora(self):
+        return "CURRENT_TIMESTAMP"
+
+    def prefixo_sem_caixa(self, coluna, prefixo):
+        return (
+            f"{coluna} >= ? COLLATE NOCASE AND {coluna} < ? COLLATE NOCASE",
+            [prefixo, prefixo + "\U0010ffff"],
+        )
+
+    def em_lista(self, coluna, ids):
+        return f"{coluna} IN (SELECT value FROM json_each(?))", json.dumps(list(ids))
+
+    def travar_linhas(self, pular_travadas=False):
+        # a transação de escrita (BEGIN IMMEDIATE) já é exclusiva
+        return ""
+
+    def busca_textual(self, termos, usuario_id):
+        # (origem, filtro, ordem, parâmetros de origem e filtro): origem
+        # junta o contrato "c" ao índice, o filtro casa os termos e a ordem
+        # põe os mais relevantes antes (nome pesa mais que a descrição)
+        return (
+            "contrato_fts JOIN contrato c ON c.id = contrato_fts.rowid",
+            "contrato_fts MATCH ?",
+            "bm25(contrato_fts, 10.0, 1.0, 0.0)",
+            [montar_consulta_fts(termos, usuario_id)],
+        )
+
+    def blocos(self, sql, params, tamanho):
+        # Conexão própria, aberta só quando o gerador é consumido: a do pool
+        # volta no teardown, antes de o streaming acabar. Gera os nomes das
+        # colunas e depois listas de até `tamanho` linhas.
+        with self.conexao() as conn:
+            cursor = conn.execute(sql, params)
+            yield [c[0] for c in cursor.description]
+            while True:
+                linhas = cursor.fetchmany(tamanho)
+                if not linhas:
+                    return
+                yield linhas
+
+    def tentar_trava(self, nome):
+        # flock não bloqueante num arquivo ao lado do banco; o descritor
+        # devolvido fica aberto (e a trava com este processo) até ele
+        # terminar. Sem fcntl, cada processo fica com a sua.
+        if fcntl is None:
+            return True
+        trava = open(os.path.join(os.path.dirname(DATABASE), f"{nome}.lock"), "a")
+        try:
+            fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            trava.close()
+            return None
+        return trava
+
+    def abrir_arquivo(self, conn):
+        # Histórico arquivado num banco à parte (RETENCAO_CONFIG["arquivo"]),
+        # anexado como "arquivo"
+        conn.execute("ATTACH DATABASE ? AS arquivo", (RETENCAO_CONFIG["arquivo"],))
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS arquivo.lote_notificacoes (
+                id INTEGER PRIMARY KEY,
+                arquivado_em TIMESTAMP NOT NULL,
+                quantidade INTEGER NOT NULL,
+                dados BLOB NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS arquivo.notificacao_arquivada (
+                id INTEGER PRIMARY KEY,
+                usuario_id INTEGER,
+                contrato_id INTEGER NOT NULL,
+                criado_em TIMESTAMP,
+                lote_id INTEGER NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS arquivo.idx_arquivada_usuario ON notificacao_arquivada(usuario_id, criado_em)"
+        )
+        conn.commit()
+
+    def fechar_arquivo(self, conn):
+        conn.execute("DETACH DATABASE arquivo")
+
+    def compactar(self, conn, completo=False):
+        compactar_banco(conn, completo)
+
+    def criar_schema(self):
+        return migrar_banco()
+
+    def resetar(self):
+        resetar_banco_completo()
+
+
+# Trocados ao passar o SQL do app para o psycopg: literais (copiados, com o
+# "%" dobrado), marcadores "?" e ":nome" e "%" soltos
+_SQL_POSTGRES_TOKENS = re.compile(r"'(?:[^']|'')*'|\?|(?<![:\w]):[A-Za-z_]\w*|%")
+
+# Instruções antes das quais o sqlite3 abre a transação sozinho
+_SQL_TRANSACAO_IMPLICITA = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+@lru_cache(maxsize=1024)
+def sql_postgres(sql, nomeados=False):
+    # SQL com marcadores do sqlite3 ("?", ou ":nome" com parâmetros em dict)
+    # no formato do psycopg
+    def trocar(m):
+        token = m.group()
+        if token.startswith("'"):
+            return token.replace("%", "%%")
+        if token == "?":
+            return "%s"
+        if token == "%":
+            return "%%"
+        return f"%({token[1:]})s" if nomeados else token
+
+    return _SQL_POSTGRES_TOKENS.sub(trocar, sql)
+
+
+class LinhaPostgres(tuple):
+    # Como a sqlite3.Row: acesso por posição ou pelo nome da coluna, e keys()
+    def __new__(cls, valores, colunas):
+        linha = super().__new__(cls, valores)
+        linha._colunas = colunas
+        return linha
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            chave = self._colunas[chave]
+        return super().__getitem__(chave)
+
+    def keys(self):
+        return list(self._colunas)
+
+
+def _linhas_postgres(cursor):
+    # row factory do psycopg que monta LinhaPostgres
+    colunas = {}
+    for i, coluna in enumerate(cursor.description or ()):
+        colunas.setdefault(coluna.name, i)
+    return lambda valores: LinhaPostgres(valores, colunas)
+
+
+class CursorPostgres(_MedicaoSQL):
+    # Cursor do psycopg com a interface e as métricas do CursorSQLite. Não
+    # precisa do _sqlite_bloqueante: sob o worker gevent o psycopg detecta o
+    # monkey-patch e espera o socket pelo hub.
+    def __init__(self, conexao, tuplas=False):
+        self.connection = conexao
+        self._cursor = conexao.bruta.cursor(row_factory=tuple_row if tuplas else _linhas_postgres)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def _enviar(self, metodo, sql, parametros):
+        if parametros:
+            return metodo(sql_postgres(sql, isinstance(parametros, dict)), parametros)
+        return metodo(sql)
+
+    def _plano(self, parametros):
+        # direto no psycopg: o EXPLAIN não entra nas métricas
+        cursor = self.connection.bruta.cursor()
+        self._enviar(cursor.execute, "EXPLAIN " + self._sql, parametros)
+        return [linha[0] for linha in cursor.fetchall()]
+
+    def execute(self, sql, parametros=()):
+        self._iniciar(sql)
+        inicio = time.perf_counter()
+        try:
+            self._enviar(self._cursor.execute, self.connection._preparar(sql), parametros)
+            return self
+        finally:
+            self._medir(inicio, parametros)
+            metricas.observar("contratomais_sql_consulta_segundos", self._tempo, operacao=_operacao_sql(sql))
+
+    def executemany(self, sql, parametros):
+        self._iniciar(sql)
+        inicio = time.perf_counter()
+        try:
+            self._cursor.executemany(sql_postgres(self.connection._preparar(sql)), parametros)
+            return self
+        finally:
+            self._medir(inicio)
+            metricas.observar("contratomais_sql_consulta_segundos", self._tempo, operacao=_operacao_sql(sql))
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.fetchone()
+        finally:
+            self._medir(inicio)
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.fetchmany(self._cursor.arraysize if size is None else size)
+        finally:
+            self._medir(inicio)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.fetchall()
+        finally:
+            self._medir(inicio)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class ConexaoPostgres:
+    """
+    Conexão do psycopg (em autocommit) com a interface da sqlite3 usada no
+    app. Como no sqlite3, a transação abre sozinha antes de um
+    INSERT/UPDATE/DELETE, ou com um BEGIN explícito ("BEGIN IMMEDIATE" vira
+    BEGIN: no PostgreSQL os locks são por linha), e vai até o commit ou o
+    rollback; consultas fora dela não seguram snapshot nem lock.
+    """
+
+    def __init__(self, bruta):
+        self.bruta = bruta
+
+    @property
+    def in_transaction(self):
+        return self.bruta.info.transaction_status != psycopg.pq.TransactionStatus.IDLE
+
+    def _preparar(self, sql):
+        operacao = _operacao_sql(sql)
+        if operacao == "BEGIN":
+            return "BEGIN"
+        if operacao in _SQL_TRANSACAO_IMPLICITA and not self.in_transaction:
+            self.bruta.execute("BEGIN")
+        return sql
+
+    def cursor(self, tuplas=False):
+        return CursorPostgres(self, tuplas)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def commit(self):
+        self.bruta.commit()
+
+    def rollback(self):
+        self.bruta.rollback()
+
+    def close(self):
+        self.bruta.close()
+
+
+# Acentos tirados na busca textual do PostgreSQL, no índice (translate) e
+# nos termos digitados
+_ACENTOS = ("áàâãäåéèêëíìîïóòôõöúùûüçñý", "aaaaaaeeeeiiiiooooouuuucny")
+_SEM_ACENTO = str.maketrans(*_ACENTOS)
+
+
+class MotorPostgres:
+    """
+    Motor PostgreSQL, com o pool de conexões do psycopg.
+
+    As datas ficam em TEXT (COLLATE "C") no mesmo formato do SQLite, para
+    respostas, cursores de paginação e comparações iguais nos dois motores.
+    Contadores do dashboard e por status são mantidos por triggers, como no
+    SQLite; a busca textual usa um índice GIN sobre tsvector. A fila de
+    emails reserva com SKIP LOCKED e tem um só dono no cluster (advisory
+    lock). Listagens grandes (exportação) usam cursor no servidor, lido em
+    blocos.
+    """
+
+    nome = "postgres"
+    # cada escrita na transação da própria requisição: aqui escritores não
+    # disputam um lock único, e um lote com linhas de vários usuários
+    # poderia entrar em deadlock com o lote de outro nó
+    escritas_agrupadas = False
+
+    _AGORA = "to_char(timezone('UTC', now()), 'YYYY-MM-DD HH24:MI:SS')"
+    _SEM_ACENTO = f"translate(lower({{}}), '{_ACENTOS[0]}', '{_ACENTOS[1]}')"
+    # Mesmo conjunto de índices do SQLite; os de uma coluna só (usuario_id,
+    # email) já são cobertos pelos compostos e pelo UNIQUE. Tudo com IF NOT
+    # EXISTS / OR REPLACE: criar_schema roda a cada subida.
+    SCHEMA = (
+        f"""
+        CREATE TABLE IF NOT EXISTS usuario (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            nome_completo TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            senha_hash TEXT NOT NULL,
+            criado_em TEXT COLLATE "C" DEFAULT {_AGORA}
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS contrato (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            nome TEXT NOT NULL,
+            descricao TEXT,
+            data_inicio TEXT COLLATE "C" NOT NULL,
+            data_fim TEXT COLLATE "C" NOT NULL,
+            status TEXT DEFAULT 'ativo',
+            criado_em TEXT COLLATE "C" DEFAULT {_AGORA},
+            atualizado_em TEXT COLLATE "C" DEFAULT {_AGORA},
+            usuario_id BIGINT NOT NULL REFERENCES usuario (id)
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS notificacao (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            contrato_id BIGINT NOT NULL REFERENCES contrato (id),
+            usuario_id BIGINT,
+            tipo TEXT NOT NULL,
+            assunto TEXT NOT NULL,
+            mensagem TEXT,
+            email_destino TEXT NOT NULL,
+            status TEXT DEFAULT 'pendente',
+            data_envio TEXT COLLATE "C",
+            criado_em TEXT COLLATE "C" DEFAULT {_AGORA},
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            proxima_tentativa TEXT COLLATE "C",
+            ultimo_erro TEXT,
+            chave_idempotencia TEXT
+        )
+        """,
+        # sem chave estrangeira: sobrevive ao reset (ver resetar)
+        """
+        CREATE TABLE IF NOT EXISTS usuario_versao (
+            usuario_id BIGINT PRIMARY KEY,
+            versao BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS contrato_status_contagem (
+            usuario_id BIGINT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (usuario_id, status)
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION ajustar_contagem_status() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE contrato_status_contagem SET total = total - 1
+                WHERE usuario_id = OLD.usuario_id AND status = OLD.status;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO contrato_status_contagem (usuario_id, status, total)
+                VALUES (NEW.usuario_id, NEW.status, 1)
+                ON CONFLICT (usuario_id, status) DO UPDATE SET total = contrato_status_contagem.total + 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_contrato_status ON contrato",
+        """
+        CREATE TRIGGER trg_contrato_status
+        AFTER INSERT OR DELETE OR UPDATE OF status, usuario_id ON contrato
+        FOR EACH ROW EXECUTE FUNCTION ajustar_contagem_status()
+        """,
+        # Contadores do dashboard, como no SQLite (ver ESTATISTICAS_CONFIG)
+        """
+        CREATE TABLE IF NOT EXISTS usuario_estatisticas (
+            usuario_id BIGINT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            ativos INTEGER NOT NULL DEFAULT 0,
+            vencidos INTEGER NOT NULL DEFAULT 0,
+            vencendo_7dias INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS estatisticas_referencia (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            instante TEXT COLLATE "C" NOT NULL,
+            limite_7dias TEXT COLLATE "C" NOT NULL
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION somar_estatisticas(
+            usuario BIGINT, situacao TEXT, vence TEXT, sinal INTEGER, instante TEXT, limite TEXT
+        ) RETURNS void AS $$
+            INSERT INTO usuario_estatisticas AS e (usuario_id, total, ativos, vencidos, vencendo_7dias)
+            VALUES (
+                usuario,
+                sinal,
+                CASE WHEN situacao = 'ativo' THEN sinal ELSE 0 END,
+                CASE WHEN situacao = 'ativo' AND vence COLLATE "C" < instante THEN sinal ELSE 0 END,
+                CASE WHEN situacao = 'ativo' AND vence COLLATE "C" BETWEEN instante AND limite THEN sinal ELSE 0 END
+            )
+            ON CONFLICT (usuario_id) DO UPDATE SET
+                total = e.total + excluded.total,
+                ativos = e.ativos + excluded.ativos,
+                vencidos = e.vencidos + excluded.vencidos,
+                vencendo_7dias = e.vencendo_7dias + excluded.vencendo_7dias
+        $$ LANGUAGE sql
+        """,
+        # FOR SHARE na referência: a escrita espera o job que a avança (FOR
+        # UPDATE em atualizar_estatisticas), para nunca ser contada numa
+        # faixa que ele já passou
+        """
+        CREATE OR REPLACE FUNCTION ajustar_estatisticas() RETURNS trigger AS $$
+        DECLARE
+            r estatisticas_referencia%ROWTYPE;
+        BEGIN
+            SELECT * INTO r FROM estatisticas_referencia WHERE id = 1 FOR SHARE;
+            IF NOT FOUND THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM somar_estatisticas(OLD.usuario_id, OLD.status, OLD.data_fim, -1, r.instante, r.limite_7dias);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM somar_estatisticas(NEW.usuario_id, NEW.status, NEW.data_fim, 1, r.instante, r.limite_7dias);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_contrato_estatisticas ON contrato",
+        """
+        CREATE TRIGGER trg_contrato_estatisticas
+        AFTER INSERT OR DELETE OR UPDATE OF status, data_fim, usuario_id ON contrato
+        FOR EACH ROW EXECUTE FUNCTION ajustar_estatisticas()
+        """,
+        # Busca textual: nome com peso A e descrição com peso B, sem acentos
+        # e sem caixa; o índice GIN é sobre a mesma expressão da consulta
+        f"""
+        CREATE OR REPLACE FUNCTION contrato_busca(nome TEXT, descricao TEXT) RETURNS tsvector AS $$
+            SELECT setweight(to_tsvector('simple', {_SEM_ACENTO.format("nome")}), 'A')
+                || setweight(to_tsvector('simple', {_SEM_ACENTO.format("coalesce(descricao, '')")}), 'B')
+        $$ LANGUAGE sql IMMUTABLE
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_contrato_busca ON contrato USING gin (contrato_busca(nome, descricao))",
+        # Retenção: o histórico arquivado fica no schema "arquivo" do mesmo
+        # banco (no SQLite, num arquivo anexado com esse nome)
+        """
+        CREATE TABLE IF NOT EXISTS notificacao_resumo (
+            contrato_id BIGINT NOT NULL,
+            tipo TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            primeira TEXT COLLATE "C",
+            ultima TEXT COLLATE "C",
+            PRIMARY KEY (contrato_id, tipo, status)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS manutencao (
+            tarefa TEXT PRIMARY KEY,
+            executada_em TEXT COLLATE "C" NOT NULL
+        )
+        """,
+        "CREATE SCHEMA IF NOT EXISTS arquivo",
+        """
+        CREATE TABLE IF NOT EXISTS arquivo.lote_notificacoes (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            arquivado_em TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            dados BYTEA NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS arquivo.notificacao_arquivada (
+            id BIGINT PRIMARY KEY,
+            usuario_id BIGINT,
+            contrato_id BIGINT NOT NULL,
+            criado_em TEXT COLLATE "C",
+            lote_id BIGINT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_arquivada_usuario ON arquivo.notificacao_arquivada (usuario_id, criado_em)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_data_fim ON contrato (data_fim)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_atualizado ON contrato (usuario_id, atualizado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_status_atualizado "
+        "ON contrato (usuario_id, status, atualizado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_data_fim ON contrato (usuario_id, data_fim)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_nome ON contrato (usuario_id, lower(nome) text_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS idx_contrato_usuario_status_data_fim ON contrato (usuario_id, status, data_fim)",
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_fila ON notificacao (proxima_tentativa) WHERE status = 'pendente'",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_notificacao_chave ON notificacao (chave_idempotencia) "
+        "WHERE chave_idempotencia IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_usuario_criado ON notificacao (usuario_id, criado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_usuario_status_criado "
+        "ON notificacao (usuario_id, status, criado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_usuario_tipo_criado ON notificacao (usuario_id, tipo, criado_em, id)",
+        "CREATE INDEX IF NOT EXISTS idx_notificacao_contrato_criado ON notificacao (contrato_id, criado_em, id)",
+    )
+
+    def __init__(self, url=None, pool_min=None, pool_max=None):
+        if psycopg is None:
+            raise RuntimeError("O motor PostgreSQL precisa do psycopg: pip install -r requirements-postgres.txt")
+        self.url = url or POSTGRES_CONFIG["url"]
+        self.pool_min = POSTGRES_CONFIG["pool_min"] if pool_min is None else pool_min
+        self.pool_max = POSTGRES_CONFIG["pool_max"] if pool_max is None else pool_max
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        # Aberto no primeiro uso em cada processo: os workers do gunicorn
+        # (fork) não herdam as conexões de quem importou o app
+        if self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool_pid != os.getpid():
+                    self._pool = ConnectionPool(
+                        self.url,
+                        min_size=self.pool_min,
+                        max_size=self.pool_max,
+                        kwargs={"autocommit": True},
+                        name="contratomais",
+                        open=True,
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def fechar(self):
+        if self._pool_pid == os.getpid():
+            self._pool.close()
+        self._pool = self._pool_pid = None
+
+    def abrir(self, somente_leitura=False):
+        # avulsa, fora do pool: para os workers de segundo plano e a CLI
+        return ConexaoPostgres(psycopg.connect(self.url, autocommit=True))
+
+    def obter(self, somente_leitura=False):
+        return ConexaoPostgres(self.pool.getconn())
+
+    def devolver(self, conn, somente_leitura=False):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except psycopg.Error:
+            # conexão perdida: o pool a descarta
+            logger.exception("Conexão descartada do pool")
+        self.pool.putconn(conn.bruta)
+
+    def ociosas(self):
+        if self._pool_pid != os.getpid():
+            return {"postgres": 0}
+        return {"postgres": self._pool.get_stats().get("pool_available", 0)}
+
+    @contextmanager
+    def conexao(self):
+        # commit ao sair sem erro, rollback com erro; a conexão volta ao pool
+        conn = self.obter()
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            self.devolver(conn)
+
+    def cursor_tuplas(self, conn):
+        return conn.cursor(tuplas=True)
+
+    def json_objeto(self, pares):
+        return f"json_build_object({', '.join(pares)})::text"
+
+    def dias_restantes(self, prefixo=""):
+        return (
+            f"floor((extract(epoch FROM {prefixo}data_fim::timestamp) - ?) / 86400)::integer",
+            epoch_agora(inicio_dia_utc()),
+        )
+
+    def agora(self):
+        return self._AGORA
+
+    def prefixo_sem_caixa(self, coluna, prefixo):
+        escapado = prefixo.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"lower({coluna}) LIKE ? ESCAPE '\\'", [escapado + "%"]
+
+    def em_lista(self, coluna, ids):
+        return f"{coluna} = ANY(?)", list(ids)
+
+    def travar_linhas(self, pular_travadas=False):
+        return "FOR UPDATE SKIP LOCKED" if pular_travadas else "FOR UPDATE"
+
+    def busca_textual(self, termos, usuario_id):
+        # Cada termo sem acento e por prefixo, todos obrigatórios; pesos do
+        # ts_rank na ordem {D, C, B, A}: descrição (B) vale 1/10 do nome (A)
+        consulta = " & ".join(f"{termo.lower().translate(_SEM_ACENTO)}:*" for termo in termos)
+        return (
+            "contrato c CROSS JOIN to_tsquery('simple', ?) AS q",
+            "contrato_busca(c.nome, c.descricao) @@ q",
+            "ts_rank('{0, 0, 0.1, 1}', contrato_busca(c.nome, c.descricao), q) DESC",
+            [consulta],
+        )
+
+    def blocos(self, sql, params, tamanho):
+        with self.conexao() as conn:
+            # cursor nomeado: as linhas ficam no servidor e vêm em blocos;
+            # só existe dentro de uma transação
+            conn.execute("BEGIN")
+            with conn.bruta.cursor(name="blocos", row_factory=tuple_row) as cursor:
+                cursor.itersize = tamanho
+                cursor.execute(sql_postgres(sql), params)
+                yield [c.name for c in cursor.description]
+                while True:
+                    linhas = cursor.fetchmany(tamanho)
+                    if not linhas:
+                        return
+                    yield linhas
+
+    def tentar_trava(self, nome):
+        # Advisory lock numa conexão própria, fora do pool, devolvida ao
+        # chamador: fica com este processo enquanto ela estiver aberta, e
+        # vale para todos os nós
+        conn = self.abrir()
+        if conn.execute("SELECT pg_try_advisory_lock(hashtext(?))", (f"contratomais_{nome}",)).fetchone()[0]:
+            return conn
+        conn.close()
+        return None
+
+    def abrir_arquivo(self, conn):
+        # o schema "arquivo" é criado com o resto (criar_schema)
+        pass
+
+    def fechar_arquivo(self, conn):
+        pass
+
+    def compactar(self, conn, completo=False):
+        # O autovacuum já devolve o espaço aos poucos; aqui só se adianta na
+        # tabela que acabou de perder as linhas arquivadas. FULL reescreve a
+        # tabela com lock exclusivo: só pela linha de comando.
+        conn.execute(f"VACUUM ({'FULL, ' if completo else ''}ANALYZE) notificacao")
+
+    def criar_schema(self):
+        instante, limite = _referencia_estatisticas(datetime.utcnow())
+        with self.conexao() as conn:
+            conn.execute("BEGIN")
+            # serializa criações concorrentes (vários nós subindo juntos)
+            conn.execute("SELECT pg_advisory_xact_lock(hashtext('contratomais_schema'))")
+            for sql in self.SCHEMA:
+                conn.execute(sql)
+            conn.execute(
+                """
+                INSERT INTO estatisticas_referencia (id, instante, limite_7dias) VALUES (1, ?, ?)
+                ON CONFLICT (id) DO NOTHING
+                """,
+                (instante, limite),
+            )
+            RepositorioUsuarios(self).garantir(
+                conn, "Administrador", "admin@contratomais.com", hash_senha("admin123")
+            )
+
+    def resetar(self):
+        # Como no SQLite: apaga todas as tabelas (e o histórico arquivado,
+        # já que os ids recomeçam) menos usuario_versao, cujas versões
+        # continuam crescendo, e recria tudo
+        with self.conexao() as conn:
+            conn.execute("BEGIN")
+            conn.execute("SELECT pg_advisory_xact_lock(hashtext('contratomais_schema'))")
+            tabelas = {
+                row[0]
+                for row in conn.execute("SELECT tablename FROM pg_tables WHERE schemaname = current_schema()")
+            }
+            apagar = [f'"{tabela}"' for tabela in sorted(tabelas - {"usuario_versao"})]
+            if apagar:
+                conn.execute(f"DROP TABLE {', '.join(apagar)} CASCADE")
+            conn.execute("DROP SCHEMA IF EXISTS arquivo CASCADE")
+            if "usuario_versao" in tabelas:
+                conn.execute("UPDATE usuario_versao SET versao = versao + 1")
+        self.criar_schema()
+
+
+# Incrementa usuario_versao numa escrita (ver marcar_alteracao)
+_SQL_MARCAR_ALTERACAO = """
+    INSERT INTO usuario_versao (usuario_id, versao) VALUES (?, 1)
+    ON CONFLICT (usuario_id) DO UPDATE SET versao = usuario_versao.versao + 1
+    RETURNING versao
+    """
+
+
+class _Repositorio:
+    def __init__(self, motor):
+        self.motor = motor
+
+    def _executar(self, conn, sql, params=()):
+        return conn.execute(sql, params)
+
+    def _marcar_alteracao(self, conn, usuario_id):
+        return self._executar(conn, _SQL_MARCAR_ALTERACAO, (usuario_id,)).fetchone()["versao"]
+
+
+class RepositorioUsuarios(_Repositorio):
+    def por_email(self, conn, email):
+        return self._executar(
+            conn, "SELECT id, nome_completo, email, senha_hash FROM usuario WHERE email = ?", (email,)
+        ).fetchone()
+
+    def por_id(self, conn, id):
+        return self._executar(
+            conn, "SELECT id, nome_completo, email, criado_em FROM usuario WHERE id = ?", (id,)
+        ).fetchone()
+
+    def garantir(self, conn, nome_completo, email, senha_hash):
+        # Cria o usuário se o email ainda não existir
+        self._executar(
+            conn,
+            "INSERT INTO usuario (nome_completo, email, senha_hash) VALUES (?, ?, ?) ON CONFLICT (email) DO NOTHING",
+            (nome_completo, email, senha_hash),
+        )
+
+
+# Campos devolvidos por inserir/atualizar, lidos do próprio RETURNING
+CAMPOS_CONTRATO_GRAVADO = ("id", "nome", "descricao", "data_inicio", "data_fim", "status", "dias_restantes")
+_RETURNING_CONTRATO = "RETURNING id, nome, descricao, data_inicio, data_fim, status"
+
+
+class RepositorioContratos(_Repositorio):
+    def json_contrato(self, campos, prefixo=""):
+        # Expressão que serializa os campos pedidos de cada linha no próprio
+        # banco, e os parâmetros dela (dias_restantes usa um)
+        pares = []
+        params = []
+        for campo in campos:
+            if campo == "dias_restantes":
+                expr, param = self.motor.dias_restantes(prefixo)
+                params.append(param)
+            else:
+                expr = prefixo + campo
+            pares.append(f"'{campo}', {expr}")
+        return self.motor.json_objeto(pares), params
+
+    def obter(self, conn, usuario_id, id):
+        return self._executar(
+            conn, "SELECT * FROM contrato WHERE id = ? AND usuario_id = ?", (id, usuario_id)
+        ).fetchone()
+
+    def listar(
+        self,
+        conn,
+        usuario_id,
+        campos=CAMPOS_CONTRATO,
+        status=None,
+        vence_de=None,
+        vence_ate=None,
+        vence_ate_inclusivo=True,
+        nome=None,
+        apos=None,
+        limite=None,
+    ):
+        """
+        Contratos do usuário, do mais recente para o mais antigo, como
+        tuplas (json, atualizado_em, id). apos é o (atualizado_em, id) do
+        último item da página anterior; nome filtra por prefixo, sem caixa.
+        """
+        json_sql, params = self.json_contrato(campos)
+        where = ["usuario_id = ?"]
+        params.append(usuario_id)
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if vence_de:
+            where.append("data_fim >= ?")
+            params.append(vence_de)
+        if vence_ate:
+            where.append("data_fim <= ?" if vence_ate_inclusivo else "data_fim < ?")
+            params.append(vence_ate)
+        if nome:
+            filtro, valores = self.motor.prefixo_sem_caixa("nome", nome)
+            where.append(filtro)
+            params.extend(valores)
+        if apos:
+            where.append("(atualizado_em, id) < (?, ?)")
+            params.extend(apos)
+        sql = f"""
+            SELECT {json_sql}, atualizado_em, id FROM contrato
+            WHERE {" AND ".join(where)}
+            ORDER BY atualizado_em DESC, id DESC
+            """
+        if limite is not None:
+            sql += " LIMIT ?"
+            params.append(limite)
+        return self.motor.cursor_tuplas(conn).execute(sql, params).fetchall()
+
+    def buscar(self, conn, usuario_id, termos, campos, limite, deslocamento=0, status=None):
+        # Busca textual (ver busca_textual do motor), dos mais relevantes
+        # para os menos, como tuplas (json,)
+        json_sql, params = self.json_contrato(campos, "c.")
+        origem, filtro, ordem, valores = self.motor.busca_textual(termos, usuario_id)
+        params.extend(valores)
+        where = [filtro, "c.usuario_id = ?"]
+        params.append(usuario_id)
+        if status:
+            where.append("c.status = ?")
+            params.append(status)
+        sql = f"""
+            SELECT {json_sql} FROM {origem}
+            WHERE {" AND ".join(where)}
+            ORDER BY {ordem}, c.id
+            LIMIT ? OFFSET ?
+            """
+        params += [limite, deslocamento]
+        return self.motor.cursor_tuplas(conn).execute(sql, params).fetchall()
+
+    def totais_por_status(self, conn, usuario_id):
+        # Contadores mantidos pelos triggers: uma linha por status, sem
+        # percorrer os contratos
+        por_status = self._executar(
+            conn,
+            "SELECT status, total FROM contrato_status_contagem WHERE usuario_id = ? AND total > 0",
+            (usuario_id,),
+        ).fetchall()
+        return {
+            "total": sum(r["total"] for r in por_status),
+            "por_status": {r["status"]: r["total"] for r in por_status},
+        }
+
+    def inserir(self, conn, usuario_id, nome, descricao, data_inicio, data_fim, status):
+        contrato = self._executar(
+            conn,
+            f"""
+            INSERT INTO contrato (nome, descricao, data_inicio, data_fim, status, usuario_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            {_RETURNING_CONTRATO}
+            """,
+            (nome, descricao, data_inicio, data_fim, status, usuario_id),
+        ).fetchall()[0]
+        return contrato, self._marcar_alteracao(conn, usuario_id)
+
+    def inserir_lote(self, conn, usuario_id, registros):
+        # registros: (nome, descricao, data_inicio, data_fim, status)
+        conn.cursor().executemany(
+            "INSERT INTO contrato (nome, descricao, data_inicio, data_fim, status, usuario_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [registro + (usuario_id,) for registro in registros],
+        )
+        return self._marcar_alteracao(conn, usuario_id)
+
+    def atualizar(self, conn, usuario_id, id, campos):
+        updates = [f"{campo} = ?" for campo in campos] + [f"atualizado_em = {self.motor.agora()}"]
+        linhas = self._executar(
+            conn,
+            f'UPDATE contrato SET {", ".join(updates)} WHERE id = ? AND usuario_id = ? {_RETURNING_CONTRATO}',
+            [*campos.values(), id, usuario_id],
+        ).fetchall()
+        if not linhas:
+            return None, None
+        return linhas[0], self._marcar_alteracao(conn, usuario_id)
+
+    def excluir(self, conn, usuario_id, id):
+        # notificações antes do contrato, por causa da chave estrangeira
+        self._executar(
+            conn,
+            "DELETE FROM notificacao WHERE contrato_id IN (SELECT id FROM contrato WHERE id = ? AND usuario_id = ?)",
+            (id, usuario_id),
+        )
+        excluido = self._executar(
+            conn, "DELETE FROM contrato WHERE id = ? AND usuario_id = ? RETURNING id", (id, usuario_id)
+        ).fetchall()
+        if not excluido:
+            return None
+        return self._marcar_alteracao(conn, usuario_id)
+
+    def exportar(self, usuario_id, status=None):
+        where = ["usuario_id = ?"]
+        params = [usuario_id]
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        sql = f"""
+            SELECT id, nome, descricao, data_inicio, data_fim, status, criado_em, atualizado_em
+            FROM contrato
+            WHERE {" AND ".join(where)}
+            ORDER BY id
+            """
+        return self.motor.blocos(sql, params, EXPORTACAO_CONFIG["linhas_por_bloco"])
+
+
+class RepositorioNotificacoes(_Repositorio):
+    _JSON = (
+        "'id', n.id",
+        "'contrato_id', n.contrato_id",
+        "'contrato_nome', c.nome",
+        "'tipo', n.tipo",
+        "'assunto', n.assunto",
+        "'mensagem', n.mensagem",
+        "'email_destino', n.email_destino",
+        "'status', n.status",
+        "'data_envio', n.data_envio",
+        "'criado_em', n.criado_em",
+    )
+
+    def listar(
+        self,
+        conn,
+        usuario_id,
+        status=None,
+        tipo=None,
+        contrato_id=None,
+        de=None,
+        ate=None,
+        ate_inclusivo=True,
+        apos=None,
+        limite=None,
+    ):
+        """
+        Histórico do usuário, da mais recente para a mais antiga, como
+        tuplas (json, criado_em, id); apos é o (criado_em, id) do último
+        item da página anterior.
+        """
+        where = ["n.usuario_id = ?"]
+        params = [usuario_id]
+        for coluna, valor in (("n.status", status), ("n.tipo", tipo), ("n.contrato_id", contrato_id)):
+            if valor:
+                where.append(f"{coluna} = ?")
+                params.append(valor)
+        if de:
+            where.append("n.criado_em >= ?")
+            params.append(de)
+        if ate:
+            where.append("n.criado_em <= ?" if ate_inclusivo else "n.criado_em < ?")
+            params.append(ate)
+        if apos:
+            where.append("(n.criado_em, n.id) < (?, ?)")
+            params.extend(apos)
+        sql = f"""
+            SELECT {self.motor.json_objeto(self._JSON)}, n.criado_em, n.id
+            FROM notificacao n
+            JOIN contrato c ON n.contrato_id = c.id
+            WHERE {" AND ".join(where)}
+            ORDER BY n.criado_em DESC, n.id DESC
+            """
+        if limite is not None:
+            sql += " LIMIT ?"
+            params.append(limite)
+        return self.motor.cursor_tuplas(conn).execute(sql, params).fetchall()
+
+    def totais_por_status(self, conn, usuario_id):
+        por_status = self._executar(
+            conn,
+            "SELECT status, COUNT(*) AS total FROM notificacao WHERE usuario_id = ? GROUP BY status",
+            (usuario_id,),
+        ).fetchall()
+        return {
+            "total": sum(r["total"] for r in por_status),
+            "por_status": {r["status"]: r["total"] for r in por_status},
+        }
+
+    def enfileirar(self, conn, usuario_id, contrato_id, tipo, assunto, mensagem, emails):
+        # Grava como pendente para a fila de envio; devolve (id, versao)
+        notificacao_id = self._executar(
+            conn,
+            """
+            INSERT INTO notificacao
+                (contrato_id, usuario_id, tipo, assunto, mensagem, email_destino, status, proxima_tentativa)
+            VALUES (?, ?, ?, ?, ?, ?, 'pendente', ?)
+            RETURNING id
+            """,
+            (contrato_id, usuario_id, tipo, assunto, mensagem, ",".join(emails), _agora_iso()),
+        ).fetchone()["id"]
+        return notificacao_id, self._marcar_alteracao(conn, usuario_id)
+
+    def _filtro_contratos(self, usuario_id, contrato_ids, status, vence_de, vence_ate, vence_ate_inclusivo):
+        where = ["c.usuario_id = ?"]
+        params = [usuario_id]
+        if contrato_ids is not None:
+            filtro, valor = self.motor.em_lista("c.id", contrato_ids)
+            where.append(filtro)
+            params.append(valor)
+        if status:
+            where.append("c.status = ?")
+            params.append(status)
+        if vence_de:
+            where.append("c.data_fim >= ?")
+            params.append(vence_de)
+        if vence_ate:
+            where.append("c.data_fim <= ?" if vence_ate_inclusivo else "c.data_fim < ?")
+            params.append(vence_ate)
+        return " AND ".join(where), params
+
+    def contar_contratos(
+        self, conn, usuario_id, contrato_ids=None, status=None, vence_de=None, vence_ate=None, vence_ate_inclusivo=True
+    ):
+        where, params = self._filtro_contratos(
+            usuario_id, contrato_ids, status, vence_de, vence_ate, vence_ate_inclusivo
+        )
+        linha = self._executar(conn, f"SELECT COUNT(*) AS total FROM contrato c WHERE {where}", params).fetchone()
+        return linha["total"]
+
+    def enfileirar_lote(
+        self,
+        conn,
+        usuario_id,
+        tipo,
+        assunto,
+        mensagem,
+        modelo,
+        emails,
+        contrato_ids=None,
+        status=None,
+        vence_de=None,
+        vence_ate=None,
+        vence_ate_inclusivo=True,
+    ):
+        """
+        Uma notificação pendente para cada contrato do usuário selecionado
+        (por ids ou pelo filtro), num único INSERT ... SELECT. Sem mensagem,
+        usa o modelo com "{nome}" trocado pelo nome de cada contrato.
+        Devolve as linhas (id, contrato_id) e a versão (None se nada entrou).
+        """
+        where, params = self._filtro_contratos(
+            usuario_id, contrato_ids, status, vence_de, vence_ate, vence_ate_inclusivo
+        )
+        antes, depois = modelo.split("{nome}")
+        inseridas = self._executar(
+            conn,
+            f"""
+            INSERT INTO notificacao
+                (contrato_id, usuario_id, tipo, assunto, mensagem, email_destino, status, proxima_tentativa)
+            SELECT c.id, c.usuario_id, ?, ?, COALESCE(?, ? || c.nome || ?), ?, 'pendente', ?
+            FROM contrato c
+            WHERE {where}
+            ORDER BY c.id
+            RETURNING id, contrato_id
+            """,
+            [tipo, assunto, mensagem or None, antes, depois, ",".join(emails), _agora_iso()] + params,
+        ).fetchall()
+        return inseridas, (self._marcar_alteracao(conn, usuario_id) if inseridas else None)
+
+    def exportar(self, usuario_id):
+        sql = """
+            SELECT
+                n.id, n.contrato_id, c.nome AS contrato_nome, n.tipo, n.assunto, n.mensagem,
+                n.email_destino, n.status, n.tentativas, n.ultimo_erro, n.data_envio, n.criado_em
+            FROM notificacao n
+            JOIN contrato c ON n.contrato_id = c.id
+            WHERE n.usuario_id = ?
+            ORDER BY n.criado_em, n.id
+            """
+        return self.motor.blocos(sql, [usuario_id], EXPORTACAO_CONFIG["linhas_por_bloco"])
+
+
+# Motor e repositórios do app: PostgreSQL se CONTRATOS_POSTGRES_URL estiver
+# definida, senão o SQLite em DATABASE
+motor = MotorPostgres() if POSTGRES_CONFIG["url"] else MotorSQLite()
+repo_usuarios = RepositorioUsuarios(motor)
+repo_contratos = RepositorioContratos(motor)
+repo_notificacoes = RepositorioNotificacoes(motor)
+
+
+# ========== ESCRITAS AGRUPADAS ==========
+class _Escrita:
+    # estado: "fila" -> "gravando" (pega pelo escritor) ou "cancelada" (quem
+    # pediu desistiu antes disso); a troca é feita sob _escritas_estado_lock
+    __slots__ = ("funcao", "args", "resultado", "erro", "pronta", "estado")
+
+    def __init__(self, funcao, args):
+        self.funcao = funcao
+        self.args = args
+        self.resultado = None
+        self.erro = None
+        self.pronta = threading.Event()
+        self.estado = "fila"
+
+
+_escritas = queue.Queue()
+_escritas_estado_lock = threading.Lock()
+_escritor_pid = None
+_escritor_lock = threading.Lock()
+
+
+def _separar_canceladas(lote):
+    # A partir daqui quem pediu não pode mais desistir: espera o commit
+    with _escritas_estado_lock:
+        for escrita in lote:
+            if escrita.estado == "fila":
+                escrita.estado = "gravando"
+    return [escrita for escrita in lote if escrita.estado == "gravando"]
+
+
+def _gravar_lote(conn, lote):
+    # Uma transação para o lote; cada escrita num savepoint, para que o erro
+    # de uma desfaça só ela
+    conn.execute("BEGIN IMMEDIATE")
+    for escrita in lote:
+        conn.execute("SAVEPOINT escrita")
+        try:
+            escrita.resultado = escrita.funcao(conn, *escrita.args)
+            conn.execute("RELEASE escrita")
+        except Exception as e:
+            conn.execute("ROLLBACK TO escrita")
+            conn.execute("RELEASE escrita")
+            escrita.erro = e
+    conn.commit()
+
+
+def _worker_escritor(fila):
+    conn = None
+    banco = None
+    while True:
+        lote = [fila.get()]
+        prazo = time.monotonic() + ESCRITA_CONFIG["janela_s"]
+        while len(lote) < ESCRITA_CONFIG["lote_max"]:
+            try:
+                lote.append(fila.get(timeout=max(0.0, prazo - time.monotonic())))
+            except queue.Empty:
+                break
+
+        lote = _separar_canceladas(lote)
+        if not lote:
+            continue
+        try:
+            if conn is None or banco != DATABASE:
+                if conn is not None:
+                    conn.close()
+                conn, banco = motor.abrir(), DATABASE
+            _gravar_lote(conn, lote)
+            metricas.observar(
+                "contratomais_escritas_por_lote", len(lote), buckets=METRICAS_CONFIG["buckets_consultas"]
+            )
+        except Exception as e:
+            # falhou o BEGIN ou o COMMIT: nada do lote foi gravado
+            logger.error(f"Erro ao gravar lote de escritas: {str(e)}")
+            for escrita in lote:
+                escrita.resultado = None
+                escrita.erro = e
+            try:
+                conn.rollback()
+            except Exception:
+                conn = None
+        finally:
+            for escrita in lote:
+                escrita.pronta.set()
+
+
+def iniciar_escritor():
+    global _escritas, _escritor_pid
+    with _escritor_lock:
+        if _escritor_pid == os.getpid():
+            return
+        # após o fork, a fila herdada não tem mais quem a consuma
+        _escritas = queue.Queue()
+        _escritor_pid = os.getpid()
+        threading.Thread(target=_worker_escritor, args=(_escritas,), name="escritor", daemon=True).start()
+
+
+def executar_escrita(funcao, *args):
+    """
+    Executa funcao(conn, *args) na transação do escritor do processo, junto
+    com as escritas concorrentes, e devolve o resultado dela (ou levanta o
+    erro dela). A função não faz commit; o que ela gravou já está commitado
+    quando executar_escrita retorna.
+    """
+    if not ESCRITA_CONFIG["habilitado"] or not motor.escritas_agrupadas:
+        conn = get_db_connection()
+        try:
+            resultado = funcao(conn, *args)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return resultado
+
+    iniciar_escritor()
+    escrita = _Escrita(funcao, args)
+    _escritas.put(escrita)
+    # o escritor também espera o lock do SQLite até DB_CONFIG["timeout"].
+    # Vencido o prazo, a escrita só é abandonada se ainda estiver na fila;
+    # se o escritor já a pegou, o resultado (commit ou erro) é esperado,
+    # para nunca responder erro de algo que acabou gravado.
+    if not escrita.pronta.wait(DB_CONFIG["timeout"] * 2):
+        with _escritas_estado_lock:
+            if escrita.estado == "fila":
+                escrita.estado = "cancelada"
+        if escrita.estado == "cancelada":
+            raise TimeoutError("Escrita não concluída no prazo")
+        escrita.pronta.wait()
+    if escrita.erro is not None:
+        raise escrita.erro
+    return escrita.resultado
+
+
+# ========== EVENTOS (SSE) ==========
+# Cada stream aberto em /api/stream é uma fila em memória. As rotas de escrita
+# publicam direto nas filas do próprio processo; alterações feitas em outros
+# workers chegam por uma única thread por processo que acompanha
+# usuario_versao, em vez de uma consulta por conexão aberta.
+_assinantes = {}
+_versoes_conhecidas = {}
+_assinantes_lock = threading.Lock()
+_observador_pid = None
+
+
+def publicar_evento(usuario_id, versao, recurso=None, acao=None, id=None):
+    evento = {"versao": versao, "recurso": recurso, "acao": acao, "id": id}
+    with _assinantes_lock:
+        filas = _assinantes.get(usuario_id)
+        if not filas or versao <= _versoes_conhecidas.get(usuario_id, 0):
+            return
+        _versoes_conhecidas[usuario_id] = versao
+        filas = list(filas)
+    for fila in filas:
+        fila.put(evento)
+
+
+def _assinar_eventos(usuario_id, versao):
+    fila = queue.Queue()
+    with _assinantes_lock:
+        if usuario_id not in _assinantes:
+            _assinantes[usuario_id] = set()
+            _versoes_conhecidas[usuario_id] = versao
+        _assinantes[usuario_id].add(fila)
+    _iniciar_observador_versoes()
+    return fila
+
+
+def _cancelar_assinatura(usuario_id, fila):
+    with _assinantes_lock:
+        filas = _assinantes.get(usuario_id)
+        if filas is not None:
+            filas.discard(fila)
+            if not filas:
+                del _assinantes[usuario_id]
+                _versoes_conhecidas.pop(usuario_id, None)
+
+
+def _observar_versoes():
+    conn = None
+    while True:
+        time.sleep(SSE_CONFIG["verificacao_s"])
+        with _assinantes_lock:
+            usuarios = list(_assinantes)
+        if not usuarios:
+            continue
+        try:
+            conn = conn or motor.abrir()
+            marcadores = ", ".join("?" * len(usuarios))
+            versoes = conn.execute(
+                f"SELECT usuario_id, versao FROM usuario_versao WHERE usuario_id IN ({marcadores})",
+                usuarios,
+            ).fetchall()
+        except Exception as e:
+            logger.warning(f"Falha ao verificar versões: {str(e)}")
+            conn = _reciclar_conexao(conn)
+            continue
+        for row in versoes:
+            publicar_evento(row["usuario_id"], row["versao"])
+
+
+def _iniciar_observador_versoes():
+    global _observador_pid
+    with _assinantes_lock:
+        if _observador_pid == os.getpid():
+            return
+        _observador_pid = os.getpid()
+    threading.Thread(target=_observar_versoes, name="observador-versoes", daemon=True).start()
+
+
+# ========== FILA DE EMAILS ==========
+_fila_email_sinal = threading.Event()
+_fila_email_pid = None
+_fila_email_lock = threading.Lock()
+_fila_email_trava = None
+
+
+def _agora_iso(deslocamento_s=0):
+    return (datetime.utcnow() + timedelta(seconds=deslocamento_s)).isoformat(timespec="seconds")
+
+
+def _reservar_notificacoes(conn):
+    agora = _agora_iso()
+    # SKIP LOCKED no PostgreSQL: dois processos nunca reservam a mesma
+    notificacoes = conn.execute(
+        f"""
+        UPDATE notificacao
+        SET tentativas = tentativas + 1, proxima_tentativa = ?
+        WHERE id IN (
+            SELECT id FROM notificacao
+            WHERE status = 'pendente' AND proxima_tentativa <= ?
+            ORDER BY proxima_tentativa
+            LIMIT ?
+            {motor.travar_linhas(pular_travadas=True)}
+        )
+        RETURNING *
+        """,
+        (_agora_iso(FILA_EMAIL_CONFIG["reserva_s"]), agora, FILA_EMAIL_CONFIG["lote"]),
+    ).fetchall()
+    conn.commit()
+    return notificacoes
+
+
+def _registrar_resultado(conn, notificacao, erro):
+    if erro is None:
+        conn.execute(
+            "UPDATE notificacao SET status = 'enviado', data_envio = ?, ultimo_erro = NULL WHERE id = ?",
+            (_agora_iso(), notificacao["id"]),
+        )
+    elif notificacao["tentativas"] >= FILA_EMAIL_CONFIG["max_tentativas"]:
+        conn.execute(
+            "UPDATE notificacao SET status = 'erro', ultimo_erro = ? WHERE id = ?",
+            (erro, notificacao["id"]),
+        )
+    else:
+        espera = min(
+            FILA_EMAIL_CONFIG["backoff_base_s"] * 2 ** (notificacao["tentativas"] - 1),
+            FILA_EMAIL_CONFIG["backoff_max_s"],
+        )
+        conn.execute(
+            "UPDATE notificacao SET proxima_tentativa = ?, ultimo_erro = ? WHERE id = ?",
+            (_agora_iso(espera), erro, notificacao["id"]),
+        )
+
+
+def processar_notificacoes(conn, notificacoes):
+    # Renderiza o lote, envia tudo pelas sessões do pool SMTP e grava os
+    # resultados numa única transação.
+    ids_contratos = sorted({n["contrato_id"] for n in notificacoes})
+    marcadores = ", ".join("?" * len(ids_contratos))
+    contratos = {
+        c["id"]: c
+        for c in conn.execute(f"SELECT * FROM contrato WHERE id IN ({marcadores})", ids_contratos).fetchall()
+    }
+
+    erros = {}
+    itens = []
+    for notificacao in notificacoes:
+        contrato = contratos.get(notificacao["contrato_id"])
+        if contrato:
+            itens.append((notificacao, contrato))
+        else:
+            erros[notificacao["id"]] = "Contrato não encontrado"
+
+    envios = []
+    mensagens = []
+    for (notificacao, _), email in zip(itens, montar_emails_lote(itens)):
+        try:
+            if isinstance(email, Exception):
+                raise email
+            html_content, texto_simples = email
+            mensagens.append(
+                montar_mensagem_email(
+                    notificacao["email_destino"].split(","), notificacao["assunto"], html_content, texto_simples
+                )
+            )
+            envios.append(notificacao)
+        except Exception as e:
+            erros[notificacao["id"]] = str(e)
+
+    if mensagens:
+        try:
+            resultados = enviar_emails_lote(mensagens)
+        except Exception as e:
+            resultados = [str(e)] * len(mensagens)
+        for notificacao, erro in zip(envios, resultados):
+            erros[notificacao["id"]] = erro
+
+    usuarios = set()
+    for notificacao in notificacoes:
+        erro = erros.get(notificacao["id"])
+        if erro:
+            logger.error(
+                f"Erro ao enviar notificação {notificacao['id']} (tentativa {notificacao['tentativas']}): {erro}"
+            )
+        _registrar_resultado(conn, notificacao, erro)
+        contrato = contratos.get(notificacao["contrato_id"])
+        if contrato:
+            usuarios.add(contrato["usuario_id"])
+
+    versoes = {usuario_id: marcar_alteracao(conn, usuario_id) for usuario_id in usuarios}
+    conn.commit()
+    for usuario_id, versao in versoes.items():
+        publicar_evento(usuario_id, versao, "notificacao", "atualizada")
+
+
+def drenar_fila_email(conn):
+    # Envia tudo o que estiver vencido na fila; retorna quantas processou.
+    processadas = 0
+    while True:
+        notificacoes = _reservar_notificacoes(conn)
+        if not notificacoes:
+            return processadas
+        processar_notificacoes(conn, notificacoes)
+        processadas += len(notificacoes)
+
+
+def _worker_fila_email():
+    conn = None
+    while True:
+        try:
+            conn = conn or motor.abrir()
+            drenar_fila_email(conn)
+        except Exception:
+            logger.exception("Erro no worker da fila de emails")
+            conn = _reciclar_conexao(conn)
+        _fila_email_sinal.wait(FILA_EMAIL_CONFIG["intervalo_s"])
+        _fila_email_sinal.clear()
+
+
+def _tentar_trava_fila_email():
+    # Trava do motor (ver tentar_trava), guardada enquanto o processo viver
+    global _fila_email_trava
+    trava = motor.tentar_trava(FILA_EMAIL_CONFIG["trava"])
+    if trava is None:
+        return False
+    _fila_email_trava = trava
+    return True
+
+
+def _subir_workers_fila_email(workers):
+    logger.info(f"Fila de emails: processo {os.getpid()} assumiu o envio")
+    for i in range(workers):
+        threading.Thread(target=_worker_fila_email, name=f"fila-email-{i}", daemon=True).start()
+
+
+def _disputar_fila_email(workers):
+    while not _tentar_trava_fila_email():
+        time.sleep(FILA_EMAIL_CONFIG["intervalo_s"])
+    _subir_workers_fila_email(workers)
+
+
+def iniciar_fila_email(workers=None):
+    """
+    Sobe os workers da fila neste processo se ele conseguir a trava da fila;
+    senão fica tentando em segundo plano, para assumir se o dono morrer.
+    Notificações gravadas por outro processo são pegas na próxima volta do
+    dono (até FILA_EMAIL_CONFIG["intervalo_s"]).
+    """
+    global _fila_email_pid
+    workers = FILA_EMAIL_CONFIG["workers"] if workers is None else workers
+    if workers <= 0:
+        return
+    with _fila_email_lock:
+        if _fila_email_pid == os.getpid():
+            return
+        _fila_email_pid = os.getpid()
+    if _tentar_trava_fila_email():
+        _subir_workers_fila_email(workers)
+    else:
+        threading.Thread(target=_disputar_fila_email, args=(workers,), name="fila-email-trava", daemon=True).start()
+
+
+def avisar_fila_email():
+    # Só acorda os workers deste processo. Se a trava está com outro worker
+    # do gunicorn, a notificação espera a próxima volta do dono (até
+    # FILA_EMAIL_CONFIG["intervalo_s"]).
+    iniciar_fila_email()
+    _fila_email_sinal.set()
+
+
+# ========== LEMBRETES AUTOMÁTICOS ==========
+def gerar_lembretes(conn, hoje=None):
+    """
+    Enfileira os lembretes dos contratos ativos que vencem daqui a 1, 7 ou
+    30 dias (LEMBRETES_AUTOMATICOS), endereçados ao dono do contrato.
+
+    Tudo num único INSERT ... SELECT por faixa de data_fim (usa
+    idx_contrato_data_fim). A chave contrato:tipo:dia torna a execução
+    idempotente: rodar de novo no mesmo dia não duplica lembretes.
+    Retorna {tipo: quantidade enfileirada}.
+    """
+    hoje = hoje or datetime.utcnow().date()
+    agora = _agora_iso()
+
+    limiares = []
+    params = []
+    for tipo, dias in LEMBRETES_AUTOMATICOS.items():
+        _, titulo, mensagem = CONTEUDO_NOTIFICACAO[tipo]
+        antes, depois = mensagem.split("{nome}")
+        vencimento = hoje + timedelta(days=dias)
+        limiares.append("(?, ?, ?, ?, ?, ?)")
+        params.extend(
+            [
+                tipo,
+                vencimento.isoformat(),
+                (vencimento + timedelta(days=1)).isoformat(),
+                f"{titulo} - CONTRATO+",
+                antes,
+                depois,
+            ]
+        )
+
+    inseridos = conn.execute(
+        f"""
+        WITH limiar(tipo, vence_de, vence_ate, assunto, antes, depois) AS (VALUES {", ".join(limiares)})
+        INSERT INTO notificacao
+            (contrato_id, usuario_id, tipo, assunto, mensagem, email_destino, status, proxima_tentativa,
+             chave_idempotencia)
+        SELECT c.id, c.usuario_id, l.tipo, l.assunto, l.antes || c.nome || l.depois, u.email, 'pendente', ?,
+               c.id || ':' || l.tipo || ':' || ?
+        FROM limiar l
+        JOIN contrato c ON c.data_fim >= l.vence_de AND c.data_fim < l.vence_ate
+        JOIN usuario u ON u.id = c.usuario_id
+        WHERE c.status = 'ativo'
+        ON CONFLICT DO NOTHING
+        RETURNING usuario_id, tipo
+        """,
+        params + [agora, hoje.isoformat()],
+    ).fetchall()
+
+    if inseridos:
+        filtro, valor = motor.em_lista("id", sorted({row["usuario_id"] for row in inseridos}))
+        conn.execute(
+            f"""
+            INSERT INTO usuario_versao (usuario_id, versao)
+            SELECT id, 1 FROM usuario WHERE {filtro}
+            ON CONFLICT(usuario_id) DO UPDATE SET versao = usuario_versao.versao + 1
+            """,
+            (valor,),
+        )
+    conn.commit()
+
+    resumo = {tipo: 0 for tipo in LEMBRETES_AUTOMATICOS}
+    for row in inseridos:
+        resumo[row["tipo"]] += 1
+    return resumo
+
+
+# ========== ESTATÍSTICAS ==========
+# Cache por processo: usuario_id -> (versão dos dados, dia UTC, stats). Fica
+# válido até a próxima escrita do usuário ou até o job de estatísticas mover
+# algum contrato dele de faixa (a versão muda, em qualquer worker), ou até a
+# virada do dia.
+_cache_stats = {}
+
+
+def _referencia_estatisticas(agora):
+    return agora.strftime(FORMATO_DATA), (agora + timedelta(days=7)).strftime(FORMATO_DATA)
+
+
+def recalcular_estatisticas(conn, agora=None):
+    # Recontagem completa (criação da tabela ou job parado por mais de 7 dias).
+    # Roda na transação do chamador; o commit fica com ele.
+    instante, limite = _referencia_estatisticas(agora or datetime.utcnow())
+    # a referência primeiro: os triggers esperam a recontagem terminar
+    conn.execute(f"SELECT id FROM estatisticas_referencia {motor.travar_linhas()}")
+    conn.execute("DELETE FROM usuario_estatisticas")
+    conn.execute(
+        """
+        INSERT INTO usuario_estatisticas (usuario_id, total, ativos, vencidos, vencendo_7dias)
+        SELECT
+            usuario_id,
+            COUNT(*),
+            SUM(CASE WHEN status = 'ativo' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'ativo' AND data_fim < ? THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'ativo' AND data_fim BETWEEN ? AND ? THEN 1 ELSE 0 END)
+        FROM contrato
+        GROUP BY usuario_id
+        """,
+        (instante, instante, limite),
+    )
+    conn.execute(
+        """
+        INSERT INTO estatisticas_referencia (id, instante, limite_7dias) VALUES (1, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET instante = excluded.instante, limite_7dias = excluded.limite_7dias
+        """,
+        (instante, limite),
+    )
+    conn.execute("UPDATE usuario_versao SET versao = versao + 1")
+
+
+def atualizar_estatisticas(conn, agora=None):
+    """
+    Avança a referência das faixas de vencimento até agora, movendo só os
+    contratos que cruzaram um limite desde a última execução: os que venceram
+    saem de vencendo_7dias e entram em vencidos, e os que passaram a vencer
+    em até 7 dias entram em vencendo_7dias. Os usuários afetados têm a versão
+    dos dados incrementada (ETag, cache e SSE). Retorna quantos usuários
+    foram atualizados.
+    """
+    agora = agora or datetime.utcnow()
+    instante, limite = _referencia_estatisticas(agora)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ref = conn.execute(
+            f"SELECT instante, limite_7dias FROM estatisticas_referencia {motor.travar_linhas()}"
+        ).fetchone()
+        if ref is None or not ref["instante"] <= instante <= ref["limite_7dias"]:
+            recalcular_estatisticas(conn, agora)
+            conn.commit()
+            return conn.execute("SELECT COUNT(*) FROM usuario_estatisticas").fetchone()[0]
+
+        afetados = conn.execute(
+            """
+            WITH movimento AS (
+                SELECT
+                    usuario_id,
+                    SUM(CASE WHEN data_fim >= :antigo AND data_fim < :novo THEN 1 ELSE 0 END) AS venceram,
+                    SUM(CASE WHEN data_fim > :antigo_7 AND data_fim <= :novo_7 THEN 1 ELSE 0 END) AS entraram
+                FROM contrato
+                WHERE status = 'ativo'
+                AND (
+                    (data_fim >= :antigo AND data_fim < :novo)
+                    OR (data_fim > :antigo_7 AND data_fim <= :novo_7)
+                )
+                GROUP BY usuario_id
+            )
+            UPDATE usuario_estatisticas SET
+                vencidos = vencidos + m.venceram,
+                vencendo_7dias = vencendo_7dias - m.venceram + m.entraram
+            FROM movimento m
+            WHERE usuario_estatisticas.usuario_id = m.usuario_id
+            RETURNING usuario_estatisticas.usuario_id
+            """,
+            {"antigo": ref["instante"], "novo": instante, "antigo_7": ref["limite_7dias"], "novo_7": limite},
+        ).fetchall()
+
+        conn.execute(
+            "UPDATE estatisticas_referencia SET instante = ?, limite_7dias = ? WHERE id = 1",
+            (instante, limite),
+        )
+        for row in afetados:
+            marcar_alteracao(conn, row["usuario_id"])
+        conn.commit()
+        return len(afetados)
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _worker_estatisticas():
+    conn = None
+    while True:
+        time.sleep(ESTATISTICAS_CONFIG["intervalo_s"])
+        try:
+            conn = conn or motor.abrir()
+            # com vários workers do gunicorn, só um precisa avançar a referência
+            ref = conn.execute("SELECT instante FROM estatisticas_referencia").fetchone()
+            if ref and datetime.utcnow() - datetime.fromisoformat(ref["instante"]) < timedelta(
+                seconds=ESTATISTICAS_CONFIG["intervalo_s"] / 2
+            ):
+                continue
+            atualizar_estatisticas(conn)
+        except Exception:
+            logger.exception("Erro ao atualizar estatísticas")
+            conn = _reciclar_conexao(conn)
+
+
+_estatisticas_pid = None
+_estatisticas_lock = threading.Lock()
+
+
+def iniciar_atualizador_estatisticas():
+    global _estatisticas_pid
+    with _estatisticas_lock:
+        if _estatisticas_pid == os.getpid() or ESTATISTICAS_CONFIG["intervalo_s"] <= 0:
+            return
+        _estatisticas_pid = os.getpid()
+    threading.Thread(target=_worker_estatisticas, name="estatisticas", daemon=True).start()
+
+
+def calcular_stats_dashboard(conn, usuario_id):
+    agora = datetime.utcnow()
+
+    # Contadores mantidos incrementalmente: leitura O(1) por usuário
+    contagens = conn.execute(
+        "SELECT total, ativos, vencidos, vencendo_7dias FROM usuario_estatisticas WHERE usuario_id = ?",
+        (usuario_id,),
+    ).fetchone() or {"total": 0, "ativos": 0, "vencidos": 0, "vencendo_7dias": 0}
+
+    contratos_recentes = conn.execute(
+        """
+        SELECT id, nome, data_inicio, data_fim, status, atualizado_em
+        FROM contrato
+        WHERE usuario_id = ?
+        ORDER BY atualizado_em DESC, id DESC
+        LIMIT 6
+        """,
+        (usuario_id,),
+    ).fetchall()
+
+    return {
+        "total_contratos": contagens["total"],
+        "contratos_ativos": contagens["ativos"],
+        "contratos_vencendo_7dias": contagens["vencendo_7dias"],
+        "contratos_vencidos": contagens["vencidos"],
+        "contratos_recentes": [
+            contrato_para_dict(
+                c, ("id", "nome", "data_inicio", "data_fim", "status", "dias_restantes", "atualizado_em"), agora
+            )
+            for c in contratos_recentes
+        ],
+        "atualizado_em": agora.isoformat(),
+    }
+
+
+def etag_condicional(f):
+    # GET condicional: o ETag depende só da versão dos dados do usuário, da
+    # URL e do dia (UTC), já que dias_restantes e os contadores de vencimento
+    # mudam com o tempo. Com If-None-Match igual, responde 304 sem executar a
+    # rota.
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        usuario_id = session["usuario_id"]
+        versao = obter_versao_dados(get_db_connection(), usuario_id)
+        chave = f"{request.full_path}|{usuario_id}|{versao}|{datetime.utcnow().date().isoformat()}"
+        etag = hashlib.sha1(chave.encode()).hexdigest()
+
+        if request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+        else:
+            resp = app.make_response(f(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+
+        resp.set_etag(etag, weak=True)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+
+    return decorated_function
+
+
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if "usuario_id" not in session:
             return jsonify({"authenticated": False, "message": "Não autenticado"}), 401
         return f(*args, **kwargs)
 
     return decorated_function
 
 
+# ========== RETENÇÃO DE NOTIFICAÇÕES ==========
+def reservar_tarefa(conn, tarefa, intervalo_s):
+    # Marca a tarefa como executada agora se a última execução (de qualquer
+    # worker) tem mais de intervalo_s; devolve False se outro já a fez.
+    agora = datetime.utcnow()
+    reservada = conn.execute(
+        """
+        INSERT INTO manutencao (tarefa, executada_em) VALUES (?, ?)
+        ON CONFLICT(tarefa) DO UPDATE SET executada_em = excluded.executada_em
+        WHERE manutencao.executada_em < ?
+        RETURNING tarefa
+        """,
+        (tarefa, agora.isoformat(timespec="seconds"), (agora - timedelta(seconds=intervalo_s)).isoformat(timespec="seconds")),
+    ).fetchone()
+    conn.commit()
+    return reservada is not None
+
+
+def arquivar_notificacoes(conn, dias=None):
+    """
+    Move para o arquivo (ver RETENCAO_CONFIG) as notificações enviadas/com erro criadas
+    há mais de `dias`, em lotes curtos: cada lote vira um NDJSON comprimido
+    (zlib) no arquivo e só depois sai da tabela quente, na mesma transação
+    que soma as contagens em notificacao_resumo. Entre lotes o lock de
+    escrita é solto, para não travar os workers web.
+
+    Pode ser interrompido e repetido sem duplicar nada: linhas que já estão
+    no arquivo só são removidas. Retorna quantas saíram da tabela quente.
+    """
+    dias = RETENCAO_CONFIG["dias"] if dias is None else dias
+    limite = (datetime.utcnow() - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S")
+    motor.abrir_arquivo(conn)
+    removidas = 0
+    try:
+        while True:
+            linhas = conn.execute(
+                """
+                SELECT * FROM notificacao
+                WHERE criado_em < ? AND status != 'pendente'
+                ORDER BY id
+                LIMIT ?
+                """,
+                (limite, RETENCAO_CONFIG["lote"]),
+            ).fetchall()
+            if not linhas:
+                break
+            filtro, ids = motor.em_lista("id", [linha["id"] for linha in linhas])
+
+            ja_arquivadas = {
+                row[0] for row in conn.execute(f"SELECT id FROM arquivo.notificacao_arquivada WHERE {filtro}", (ids,))
+            }
+            novas = [linha for linha in linhas if linha["id"] not in ja_arquivadas]
+            if novas:
+                dados = zlib.compress(
+                    "".join(json.dumps(dict(linha), ensure_ascii=False) + "\n" for linha in novas).encode(), 9
+                )
+                conn.execute("BEGIN IMMEDIATE")
+                lote_id = conn.execute(
+                    "INSERT INTO arquivo.lote_notificacoes (arquivado_em, quantidade, dados) VALUES (?, ?, ?) "
+                    "RETURNING id",
+                    (_agora_iso(), len(novas), dados),
+                ).fetchone()[0]
+                conn.executemany(
+                    """
+                    INSERT INTO arquivo.notificacao_arquivada (id, usuario_id, contrato_id, criado_em, lote_id)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    [(l["id"], l["usuario_id"], l["contrato_id"], l["criado_em"], lote_id) for l in novas],
+                )
+                conn.commit()
+
+            conn.execute("BEGIN IMMEDIATE")
+            if RETENCAO_CONFIG["resumo"]:
+                conn.execute(
+                    f"""
+                    INSERT INTO notificacao_resumo AS r (contrato_id, tipo, status, total, primeira, ultima)
+                    SELECT contrato_id, tipo, status, COUNT(*), MIN(criado_em), MAX(criado_em)
+                    FROM notificacao
+                    WHERE {filtro}
+                    GROUP BY contrato_id, tipo, status
+                    ON CONFLICT(contrato_id, tipo, status) DO UPDATE SET
+                        total = r.total + excluded.total,
+                        primeira = CASE WHEN excluded.primeira < r.primeira THEN excluded.primeira ELSE r.primeira END,
+                        ultima = CASE WHEN excluded.ultima > r.ultima THEN excluded.ultima ELSE r.ultima END
+                    """,
+                    (ids,),
+                )
+            removidas += conn.execute(f"DELETE FROM notificacao WHERE {filtro}", (ids,)).rowcount
+            conn.commit()
+            time.sleep(RETENCAO_CONFIG["pausa_s"])
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        motor.fechar_arquivo(conn)
+    return removidas
+
+
+def compactar_banco(conn, completo=False):
+    # Motor SQLite (ver compactar): devolve ao disco as páginas livres e
+    # atualiza as estatísticas do planejador. O VACUUM completo trava o
+    # banco: só pela linha de comando, uma vez, para converter bancos
+    # antigos para auto_vacuum incremental.
+    if completo:
+        conn.execute("VACUUM")
+    else:
+        conn.execute("PRAGMA incremental_vacuum").fetchall()
+    conn.execute("PRAGMA optimize")
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+
+
+def _worker_retencao():
+    conn = None
+    while True:
+        try:
+            conn = conn or motor.abrir()
+            if reservar_tarefa(conn, "retencao", RETENCAO_CONFIG["intervalo_s"]):
+                removidas = arquivar_notificacoes(conn)
+                motor.compactar(conn)
+                logger.info(f"Retenção: {removidas} notificação(ões) arquivada(s)")
+        except Exception:
+            logger.exception("Erro ao arquivar notificações")
+            conn = _reciclar_conexao(conn)
+        time.sleep(min(RETENCAO_CONFIG["intervalo_s"], 600))
+
+
+_retencao_pid = None
+_retencao_lock = threading.Lock()
+
+
+def iniciar_retencao():
+    global _retencao_pid
+    with _retencao_lock:
+        if _retencao_pid == os.getpid() or RETENCAO_CONFIG["intervalo_s"] <= 0:
+            return
+        _retencao_pid = os.getpid()
+    threading.Thread(target=_worker_retencao, name="retencao", daemon=True).start()
+
+
+# ========== EXPORTAÇÃO ==========
+def _gerar_exportacao(blocos, formato):
+    # blocos vem do repositório (motor.blocos): os nomes das colunas e depois
+    # listas de linhas. Só um bloco de linhas fica em memória por vez.
+    colunas = next(blocos)
+    if formato == "csv":
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        buffer.write("\ufeff")  # BOM para o Excel reconhecer UTF-8
+        escritor.writerow(colunas)
+    for linhas in blocos:
+        if formato == "csv":
+            escritor.writerows(linhas)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            yield "".join(
+                json.dumps(dict(zip(colunas, linha)), ensure_ascii=False) + "\n" for linha in linhas
+            ).encode()
+    if formato == "csv" and buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _comprimir_gzip(blocos):
+    compressor = zlib.compressobj(EXPORTACAO_CONFIG["nivel_gzip"], zlib.DEFLATED, 31)
+    for bloco in blocos:
+        dados = compressor.compress(bloco)
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def resposta_exportacao(blocos, nome_base):
+    """
+    Resposta em streaming de uma listagem do repositório (gerador de
+    blocos, ainda não iniciado) como CSV ou NDJSON (?formato=), comprimida
+    com gzip quando o cliente aceita (Accept-Encoding) e não pediu ?gzip=0.
+    A memória usada não depende do número de linhas.
+    """
+    formato = request.args.get("formato", "csv")
+    if formato not in ("csv", "ndjson"):
+        return jsonify({"success": False, "message": "Formato deve ser csv ou ndjson"}), 400
+
+    corpo = _gerar_exportacao(blocos, formato)
+    resposta = Response(
+        corpo,
+        mimetype="text/csv" if formato == "csv" else "application/x-ndjson",
+    )
+    if request.args.get("gzip") != "0" and "gzip" in request.accept_encodings:
+        resposta.response = _comprimir_gzip(corpo)
+        resposta.headers["Content-Encoding"] = "gzip"
+    resposta.headers["Vary"] = "Accept-Encoding"
+    resposta.headers["Cache-Control"] = "no-store"
+    resposta.headers["X-Accel-Buffering"] = "no"
+    resposta.headers["Content-Disposition"] = (
+        f'attachment; filename="{nome_base}-{datetime.utcnow().strftime("%Y%m%d-%H%M%S")}.{formato}"'
+    )
+    return resposta
+
+
+# ========== COMPRESSÃO DAS RESPOSTAS ==========
+@app.after_request
+def comprimir_resposta(resposta):
+    # Respostas em streaming (SSE, exportações) e as que já vêm comprimidas
+    # (assets) passam direto
+    if (
+        resposta.direct_passthrough
+        or resposta.is_streamed
+        or resposta.status_code < 200
+        or resposta.status_code in (204, 304)
+        or "Content-Encoding" in resposta.headers
+        or resposta.mimetype not in COMPRESSAO_CONFIG["tipos"]
+    ):
+        return resposta
+
+    if brotli is not None and request.accept_encodings["br"]:
+        codificacao = "br"
+    elif request.accept_encodings["gzip"]:
+        codificacao = "gzip"
+    else:
+        return resposta
+
+    dados = resposta.get_data()
+    if len(dados) < COMPRESSAO_CONFIG["tamanho_min"]:
+        return resposta
+
+    if codificacao == "br":
+        dados = brotli.compress(dados, quality=COMPRESSAO_CONFIG["qualidade_brotli"])
+    else:
+        dados = gzip.compress(dados, COMPRESSAO_CONFIG["nivel_gzip"], mtime=0)
+    resposta.set_data(dados)
+    resposta.headers["Content-Encoding"] = codificacao
+    resposta.vary.add("Accept-Encoding")
+    return resposta
+
+
+# ========== ASSETS ESTÁTICOS ==========
+# Arquivos que ganham nome com hash (config.<hash>.js) e cache imutável; as
+# páginas HTML são reescritas para apontar para eles
+ASSETS_VERSIONADOS = (".js", ".css")
+ASSETS_COMPRIMIVEIS = (".html", ".js", ".css", ".json", ".svg", ".txt")
+ASSETS_CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+
+
+def indexar_assets(diretorio):
+    """
+    Lê public/ uma única vez e monta o índice em memória servido por
+    servir_asset: conteúdo original e variantes gzip/brotli já comprimidas,
+    hash do conteúdo (ETag) e, para .js/.css, o nome com hash. Devolve
+    {caminho: asset}, com os nomes com hash apontando para o mesmo asset.
+    """
+    arquivos = {}
+    for raiz, _, nomes in os.walk(diretorio):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            relativo = os.path.relpath(caminho, diretorio).replace(os.sep, "/")
+            with open(caminho, "rb") as f:
+                arquivos[relativo] = f.read()
+
+    versionados = {}
+    for relativo, conteudo in arquivos.items():
+        base, extensao = os.path.splitext(relativo)
+        if extensao in ASSETS_VERSIONADOS:
+            versionados[relativo] = f"{base}.{hashlib.sha256(conteudo).hexdigest()[:10]}{extensao}"
+
+    indice = {}
+    for relativo, conteudo in arquivos.items():
+        extensao = os.path.splitext(relativo)[1]
+        if extensao == ".html" and versionados:
+            texto = conteudo.decode("utf-8")
+            for original, com_hash in versionados.items():
+                texto = re.sub(rf'(src|href)="/?{re.escape(original)}"', rf'\1="{com_hash}"', texto)
+            conteudo = texto.encode("utf-8")
+
+        variantes = {"identity": conteudo}
+        if extensao in ASSETS_COMPRIMIVEIS and len(conteudo) > 512:
+            variantes["gzip"] = gzip.compress(conteudo, 9, mtime=0)
+            if brotli is not None:
+                variantes["br"] = brotli.compress(conteudo, quality=11)
+            variantes = {k: v for k, v in variantes.items() if k == "identity" or len(v) < len(conteudo)}
+
+        asset = {
+            "variantes": variantes,
+            "hash": hashlib.sha256(conteudo).hexdigest()[:20],
+            "mimetype": mimetypes.guess_type(relativo)[0] or "application/octet-stream",
+        }
+        indice[relativo] = dict(asset, imutavel=False)
+        if relativo in versionados:
+            indice[versionados[relativo]] = dict(asset, imutavel=True)
+    return indice
+
+
+# Montado no primeiro request de cada processo, não no import: o brotli
+# 11 custa segundos, e o subprocesso "flask migrar" nem serve arquivos
+_assets = None
+_assets_lock = threading.Lock()
+
+
+def obter_assets():
+    global _assets
+    if _assets is None:
+        with _assets_lock:
+            if _assets is None:
+                _assets = indexar_assets(PUBLIC_DIR)
+    return _assets
+
+
+def servir_asset(caminho):
+    asset = obter_assets().get(caminho)
+    if asset is None:
+        return "Arquivo não encontrado", 404
+
+    codificacao = "identity"
+    for opcao in ("br", "gzip"):
+        if opcao in asset["variantes"] and request.accept_encodings[opcao]:
+            codificacao = opcao
+            break
+    etag = f'{asset["hash"]}-{codificacao}'
+
+    cabecalhos = {
+        "ETag": f'"{etag}"',
+        "Vary": "Accept-Encoding",
+        # HTML e nomes sem hash sempre revalidam (304 pelo ETag)
+        "Cache-Control": ASSETS_CACHE_IMUTAVEL if asset["imutavel"] else "no-cache",
+    }
+    # cada codificação tem seu ETag: um 304 só vale para a mesma variante
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=cabecalhos)
+
+    if codificacao != "identity":
+        cabecalhos["Content-Encoding"] = codificacao
+    return Response(asset["variantes"][codificacao], mimetype=asset["mimetype"], headers=cabecalhos)
+
+
 # ========== ROTAS HTML ==========
 @app.route("/")
 def index():
-    return send_from_directory(PUBLIC_DIR, "index.html")
+    return servir_asset("index.html")
 
 
 @app.route("/dashboard.html")
 def dashboard():
-    return send_from_directory(PUBLIC_DIR, "dashboard.html")
+    return servir_asset("dashboard.html")
 
 
 @app.route("/contratos.html")
 def contratos():
-    return send_from_directory(PUBLIC_DIR, "contratos.html")
+    return servir_asset("contratos.html")
 
 
 @app.route("/notificacoes.html")
 def notificacoes():
-    return send_from_directory(PUBLIC_DIR, "notificacoes.html")
+    return servir_asset("notificacoes.html")
 
 
 @app.route("/configuracoes.html")
 def configuracoes():
-    return send_from_directory(PUBLIC_DIR, "configuracoes.html")
+    return servir_asset("configuracoes.html")
 
 
 @app.route("/<path:filename>")
 def serve_file(filename):
-    file_path = os.path.join(PUBLIC_DIR, filename)
-    if not os.path.exists(file_path):
-        return "Arquivo não encontrado", 404
-    return send_from_directory(PUBLIC_DIR, filename)
+    return servir_asset(filename)
 
 
 # ========== API - AUTH ==========
@@ -354,12 +3985,7 @@ def admin_login():
         if not senha:
             return jsonify({"success": False, "message": "Senha obrigatória"}), 400
 
-        conn = get_db_connection()
-        admin = conn.execute(
-            "SELECT id, nome_completo, email, senha_hash FROM usuario WHERE email = ?",
-            ("admin@contratomais.com",),
-        ).fetchone()
-        conn.close()
+        admin = repo_usuarios.por_email(get_db_connection(), "admin@contratomais.com")
 
         if not admin:
             return jsonify({"success": False, "message": "Usuário admin não encontrado"}), 500
@@ -416,14 +4042,10 @@ def check_auth():
 # ========== API - USUÁRIO ==========
 @app.route("/api/usuario", methods=["GET"])
 @login_required
+@somente_leitura
 def get_usuario():
     try:
-        conn = get_db_connection()
-        usuario = conn.execute(
-            "SELECT id, nome_completo, email, criado_em FROM usuario WHERE id = ?",
-            (session["usuario_id"],),
-        ).fetchone()
-        conn.close()
+        usuario = repo_usuarios.por_id(get_db_connection(), session["usuario_id"])
 
         if not usuario:
             return jsonify({"success": False, "message": "Usuário não encontrado"}), 404
@@ -451,7 +4073,7 @@ def system_reset():
     """
     Reset total do sistema:
     - exige code = 19192425
-    - apaga o banco inteiro (arquivo sqlite) e recria tabelas (inclui admin)
+    - apaga o banco inteiro (todas as tabelas) e recria tabelas (inclui admin)
     - encerra a sessão atual
     """
     try:
@@ -465,7 +4087,7 @@ def system_reset():
         session.clear()
 
         # reset literal do banco
-        resetar_banco_completo()
+        motor.resetar()
 
         return jsonify({"success": True, "message": "Sistema resetado com sucesso"})
     except Exception as e:
@@ -476,129 +4098,197 @@ def system_reset():
 # ========== API - CONTRATOS ==========
 @app.route("/api/contratos", methods=["GET"])
 @login_required
+@somente_leitura
+@etag_condicional
 def listar_contratos():
+    """
+    Lista os contratos do usuário, do mais recente para o mais antigo.
+
+    Parâmetros opcionais (query string):
+    - limit / cursor: paginação por (atualizado_em, id); a resposta traz
+      next_cursor enquanto houver mais páginas
+    - fields: campos retornados, separados por vírgula
+    - status, vence_de, vence_ate (janela sobre data_fim), nome (prefixo)
+    - totais=1: inclui a contagem de contratos por status
+    """
     try:
         usuario_id = session["usuario_id"]
-        conn = get_db_connection()
+        args = request.args
 
-        contratos = conn.execute(
-            """
-            SELECT * FROM contrato
-            WHERE usuario_id = ?
-            ORDER BY atualizado_em DESC, id DESC
-            """,
-            (usuario_id,),
-        ).fetchall()
+        try:
+            campos = CAMPOS_CONTRATO
+            if args.get("fields"):
+                campos = tuple(c.strip() for c in args["fields"].split(",") if c.strip())
+                invalidos = [c for c in campos if c not in CAMPOS_CONTRATO]
+                if invalidos or not campos:
+                    raise ValueError(f"Campos inválidos: {', '.join(invalidos)}")
+
+            paginado = "limit" in args or "cursor" in args
+            limite = None
+            if paginado:
+                limite = args.get("limit", LIMITE_PAGINA_PADRAO, type=int)
+                if limite is None or not 1 <= limite <= LIMITE_PAGINA_MAX:
+                    raise ValueError(f"limit deve estar entre 1 e {LIMITE_PAGINA_MAX}")
+
+            filtros = {"status": args.get("status"), "nome": (args.get("nome") or "").strip()}
+            if args.get("vence_de"):
+                filtros["vence_de"], _ = ler_limite_data(args["vence_de"])
+            if args.get("vence_ate"):
+                filtros["vence_ate"], filtros["vence_ate_inclusivo"] = ler_limite_data(args["vence_ate"], fim=True)
+            if args.get("cursor"):
+                filtros["apos"] = decodificar_cursor(args["cursor"])
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        conn.close()
+        conn = get_db_connection()
+        contratos = repo_contratos.listar(
+            conn, usuario_id, campos, limite=None if limite is None else limite + 1, **filtros
+        )
 
-        contratos_json = []
-        for contrato in contratos:
-            contratos_json.append(
-                {
-                    "id": contrato["id"],
-                    "nome": contrato["nome"],
-                    "descricao": contrato["descricao"],
-                    "data_inicio": contrato["data_inicio"],
-                    "data_fim": contrato["data_fim"],
-                    "status": contrato["status"],
-                    "criado_em": contrato["criado_em"],
-                    "atualizado_em": contrato["atualizado_em"],
-                    "dias_restantes": calcular_dias_restantes(contrato["data_fim"]),
-                }
-            )
+        next_cursor = None
+        if limite is not None and len(contratos) > limite:
+            contratos = contratos[:limite]
+            _, atualizado_em, ultimo_id = contratos[-1]
+            next_cursor = codificar_cursor(atualizado_em, ultimo_id)
 
-        return jsonify({"success": True, "contratos": contratos_json})
+        extras = {"next_cursor": next_cursor}
+        if args.get("totais") == "1":
+            extras["totais"] = repo_contratos.totais_por_status(conn, usuario_id)
+
+        return resposta_lista_json("contratos", (c[0] for c in contratos), **extras)
     except Exception as e:
         logger.error(f"Erro ao listar contratos: {str(e)}")
         return jsonify({"success": False, "message": "Erro ao listar contratos"}), 500
 
 
-@app.route("/api/contratos/<int:id>", methods=["GET"])
+@app.route("/api/contratos/search", methods=["GET"])
 @login_required
-def obter_contrato(id):
+@somente_leitura
+@etag_condicional
+def buscar_contratos():
+    """
+    Busca textual em nome e descrição, por relevância (com peso maior para
+    o nome), casando prefixos e ignorando acentos.
+
+    Parâmetros: q (obrigatório), limit, cursor (deslocamento devolvido em
+    next_cursor), fields, status e totais=1, como em /api/contratos.
+    """
     try:
         usuario_id = session["usuario_id"]
+        args = request.args
+
+        try:
+            termos = termos_busca(args.get("q", ""))
+            if not termos:
+                raise ValueError("Informe o texto da busca (q)")
+
+            campos = CAMPOS_CONTRATO
+            if args.get("fields"):
+                campos = tuple(c.strip() for c in args["fields"].split(",") if c.strip())
+                invalidos = [c for c in campos if c not in CAMPOS_CONTRATO]
+                if invalidos or not campos:
+                    raise ValueError(f"Campos inválidos: {', '.join(invalidos)}")
+
+            limite = args.get("limit", LIMITE_PAGINA_PADRAO, type=int)
+            if limite is None or not 1 <= limite <= LIMITE_PAGINA_MAX:
+                raise ValueError(f"limit deve estar entre 1 e {LIMITE_PAGINA_MAX}")
+            deslocamento = args.get("cursor", 0, type=int)
+            if deslocamento is None or deslocamento < 0:
+                raise ValueError("Cursor inválido")
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
         conn = get_db_connection()
+        contratos = repo_contratos.buscar(
+            conn, usuario_id, termos, campos, limite + 1, deslocamento, args.get("status")
+        )
 
-        contrato = conn.execute(
-            "SELECT * FROM contrato WHERE id = ? AND usuario_id = ?",
-            (id, usuario_id),
-        ).fetchone()
-        conn.close()
+        next_cursor = None
+        if len(contratos) > limite:
+            contratos = contratos[:limite]
+            next_cursor = str(deslocamento + limite)
+
+        extras = {"next_cursor": next_cursor}
+        if args.get("totais") == "1":
+            extras["totais"] = repo_contratos.totais_por_status(conn, usuario_id)
+
+        return resposta_lista_json("contratos", (c[0] for c in contratos), **extras)
+    except Exception as e:
+        logger.error(f"Erro ao buscar contratos: {str(e)}")
+        return jsonify({"success": False, "message": "Erro ao buscar contratos"}), 500
+
+
+@app.route("/api/contratos/<int:id>", methods=["GET"])
+@login_required
+@somente_leitura
+def obter_contrato(id):
+    try:
+        contrato = repo_contratos.obter(get_db_connection(), session["usuario_id"], id)
 
         if not contrato:
             return jsonify({"success": False, "message": "Contrato não encontrado"}), 404
 
-        return jsonify(
-            {
-                "success": True,
-                "contrato": {
-                    "id": contrato["id"],
-                    "nome": contrato["nome"],
-                    "descricao": contrato["descricao"],
-                    "data_inicio": contrato["data_inicio"],
-                    "data_fim": contrato["data_fim"],
-                    "status": contrato["status"],
-                    "criado_em": contrato["criado_em"],
-                    "atualizado_em": contrato["atualizado_em"],
-                    "dias_restantes": calcular_dias_restantes(contrato["data_fim"]),
-                },
-            }
-        )
+        return jsonify({"success": True, "contrato": contrato_para_dict(contrato)})
     except Exception as e:
         logger.error(f"Erro ao obter contrato: {str(e)}")
         return jsonify({"success": False, "message": "Erro ao obter contrato"}), 500
 
 
+def validar_contrato(dados, parcial=False):
+    """
+    Valida e normaliza os campos de um contrato, do POST, do PUT (parcial=True,
+    só os campos enviados) ou de uma linha da importação em massa. Devolve os
+    campos na ordem de CAMPOS_CONTRATO_EDITAVEIS; levanta ValueError com a
+    mensagem para o cliente.
+    """
+    if not parcial:
+        for campo in ("nome", "data_inicio", "data_fim"):
+            if not str(dados.get(campo) or "").strip():
+                raise ValueError(f"Campo {campo} é obrigatório")
+        dados = dict(
+            dados, descricao=dados.get("descricao") or "", status=str(dados.get("status") or "").strip() or "ativo"
+        )
+
+    campos = {}
+    for campo in CAMPOS_CONTRATO_EDITAVEIS:
+        if campo not in dados:
+            continue
+        valor = dados[campo]
+        if campo == "nome":
+            valor = str(valor or "").strip()
+            if not valor:
+                raise ValueError("Campo nome é obrigatório")
+        elif campo == "descricao":
+            valor = str(valor or "")
+        elif campo == "status":
+            valor = str(valor or "").strip()
+            if valor not in STATUS_CONTRATO:
+                raise ValueError(f"Status inválido: {valor}")
+        else:
+            valor = normalizar_data(valor)
+        campos[campo] = valor
+    return campos
+
+
 @app.route("/api/contratos", methods=["POST"])
 @login_required
 def criar_contrato():
     try:
         usuario_id = session["usuario_id"]
-        data = request.json or {}
-
-        for field in ["nome", "data_inicio", "data_fim"]:
-            if not data.get(field):
-                return jsonify({"success": False, "message": f"Campo {field} é obrigatório"}), 400
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            INSERT INTO contrato (nome, descricao, data_inicio, data_fim, status, usuario_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                data["nome"],
-                data.get("descricao", ""),
-                data["data_inicio"],
-                data["data_fim"],
-                data.get("status", "ativo"),
-                usuario_id,
-            ),
-        )
 
-        contrato_id = cursor.lastrowid
-        conn.commit()
+        try:
+            campos = validar_contrato(request.json or {})
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        contrato = conn.execute("SELECT * FROM contrato WHERE id = ?", (contrato_id,)).fetchone()
-        conn.close()
+        contrato, versao = executar_escrita(repo_contratos.inserir, usuario_id, *campos.values())
+        publicar_evento(usuario_id, versao, "contrato", "criado", contrato["id"])
 
         return jsonify(
             {
                 "success": True,
                 "message": "Contrato criado com sucesso",
-                "contrato": {
-                    "id": contrato["id"],
-                    "nome": contrato["nome"],
-                    "descricao": contrato["descricao"],
-                    "data_inicio": contrato["data_inicio"],
-                    "data_fim": contrato["data_fim"],
-                    "status": contrato["status"],
-                    "dias_restantes": calcular_dias_restantes(contrato["data_fim"]),
-                },
+                "contrato": contrato_para_dict(contrato, CAMPOS_CONTRATO_GRAVADO),
             }
         )
     except Exception as e:
@@ -606,54 +4296,135 @@ def criar_contrato():
         return jsonify({"success": False, "message": "Erro ao criar contrato"}), 500
 
 
-@app.route("/api/contratos/<int:id>", methods=["PUT"])
+def _ler_registros_importacao(stream, formato):
+    # Gera (linha, registro) sem carregar o corpo inteiro; registro é None
+    # quando a linha não pôde ser lida, com a mensagem no lugar
+    texto = io.TextIOWrapper(io.BufferedReader(stream), encoding="utf-8-sig", newline="")
+    if formato == "csv":
+        leitor = csv.DictReader(texto)
+        faltando = {"nome", "data_inicio", "data_fim"} - set(leitor.fieldnames or ())
+        if faltando:
+            raise ValueError(f"Cabeçalho CSV sem as colunas: {', '.join(sorted(faltando))}")
+        for registro in leitor:
+            yield leitor.line_num, registro, None
+    else:
+        for linha, bruto in enumerate(texto, 1):
+            if not bruto.strip():
+                continue
+            try:
+                registro = json.loads(bruto)
+            except ValueError:
+                yield linha, None, "JSON inválido"
+                continue
+            if not isinstance(registro, dict):
+                yield linha, None, "Cada linha deve ser um objeto JSON"
+                continue
+            yield linha, registro, None
+
+
+@app.route("/api/contratos/bulk", methods=["POST"])
 @login_required
-def atualizar_contrato(id):
+def importar_contratos():
+    """
+    Importa contratos em massa a partir de CSV (cabeçalho com nome,
+    descricao, data_inicio, data_fim, status) ou JSONL (um objeto por
+    linha), lidos do corpo da requisição em streaming.
+
+    O formato vem de ?formato=csv|jsonl ou do Content-Type. Cada linha passa
+    pelo mesmo validar_contrato do POST; as válidas são gravadas pelo
+    escritor (executar_escrita) em blocos de IMPORTACAO_CONFIG["lote"], e as
+    inválidas voltam no relatório "erros" com o número da linha.
+    """
+    usuario_id = session["usuario_id"]
+    formato = request.args.get("formato")
+    if not formato:
+        tipo = request.mimetype or ""
+        formato = "csv" if tipo in ("text/csv", "application/csv") else "jsonl"
+    if formato not in ("csv", "jsonl"):
+        return jsonify({"success": False, "message": "Formato deve ser csv ou jsonl"}), 400
+
+    lote = []
+    erros = []
+    rejeitados = 0
+    importados = 0
+    versao = None
+
+    def gravar():
+        nonlocal importados, versao
+        versao = executar_escrita(repo_contratos.inserir_lote, usuario_id, lote)
+        importados += len(lote)
+        lote.clear()
+
     try:
-        usuario_id = session["usuario_id"]
-        data = request.json or {}
+        for linha, registro, erro in _ler_registros_importacao(request.stream, formato):
+            if registro is not None:
+                try:
+                    lote.append(tuple(validar_contrato(registro).values()))
+                except ValueError as e:
+                    erro = str(e)
+            if erro:
+                rejeitados += 1
+                if len(erros) < IMPORTACAO_CONFIG["erros_max"]:
+                    erros.append({"linha": linha, "erro": erro})
+            elif len(lote) >= IMPORTACAO_CONFIG["lote"]:
+                gravar()
+        if lote:
+            gravar()
+    except (ValueError, csv.Error) as e:
+        # cabeçalho ausente, CSV malformado ou corpo fora de UTF-8: o que já
+        # foi gravado fica, e o relatório diz até onde chegou
+        if importados == 0:
+            return jsonify({"success": False, "message": str(e)}), 400
+        erros.append({"linha": None, "erro": str(e)})
+    except Exception as e:
+        logger.error(f"Erro ao importar contratos: {str(e)}")
+        return jsonify({"success": False, "message": "Erro ao importar contratos", "importados": importados}), 500
+    finally:
+        if versao is not None:
+            publicar_evento(usuario_id, versao, "contrato", "importado")
 
-        conn = get_db_connection()
-        contrato = conn.execute(
-            "SELECT * FROM contrato WHERE id = ? AND usuario_id = ?",
-            (id, usuario_id),
-        ).fetchone()
+    return jsonify(
+        {
+            "success": True,
+            "message": f"{importados} contrato(s) importado(s)",
+            "importados": importados,
+            "rejeitados": rejeitados,
+            "erros": erros,
+            "erros_truncados": rejeitados > len(erros),
+        }
+    )
 
-        if not contrato:
-            conn.close()
-            return jsonify({"success": False, "message": "Contrato não encontrado"}), 404
 
-        updates = []
-        params = []
-        for campo in ["nome", "descricao", "data_inicio", "data_fim", "status"]:
-            if campo in data:
-                updates.append(f"{campo} = ?")
-                params.append(data[campo])
+@app.route("/api/contratos/export", methods=["GET"])
+@login_required
+def exportar_contratos():
+    """Exporta todos os contratos do usuário (opcionalmente por ?status=)."""
+    return resposta_exportacao(
+        repo_contratos.exportar(session["usuario_id"], request.args.get("status")), "contratos"
+    )
 
-        updates.append("atualizado_em = CURRENT_TIMESTAMP")
 
-        query = f'UPDATE contrato SET {", ".join(updates)} WHERE id = ? AND usuario_id = ?'
-        params.extend([id, usuario_id])
+@app.route("/api/contratos/<int:id>", methods=["PUT"])
+@login_required
+def atualizar_contrato(id):
+    try:
+        usuario_id = session["usuario_id"]
 
-        conn.execute(query, params)
-        conn.commit()
+        try:
+            campos = validar_contrato(request.json or {}, parcial=True)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        contrato = conn.execute("SELECT * FROM contrato WHERE id = ?", (id,)).fetchone()
-        conn.close()
+        contrato, versao = executar_escrita(repo_contratos.atualizar, usuario_id, id, campos)
+        if contrato is None:
+            return jsonify({"success": False, "message": "Contrato não encontrado"}), 404
+        publicar_evento(usuario_id, versao, "contrato", "atualizado", id)
 
         return jsonify(
             {
                 "success": True,
                 "message": "Contrato atualizado com sucesso",
-                "contrato": {
-                    "id": contrato["id"],
-                    "nome": contrato["nome"],
-                    "descricao": contrato["descricao"],
-                    "data_inicio": contrato["data_inicio"],
-                    "data_fim": contrato["data_fim"],
-                    "status": contrato["status"],
-                    "dias_restantes": calcular_dias_restantes(contrato["data_fim"]),
-                },
+                "contrato": contrato_para_dict(contrato, CAMPOS_CONTRATO_GRAVADO),
             }
         )
     except Exception as e:
@@ -666,21 +4437,10 @@ def atualizar_contrato(id):
 def excluir_contrato(id):
     try:
         usuario_id = session["usuario_id"]
-        conn = get_db_connection()
-
-        contrato = conn.execute(
-            "SELECT * FROM contrato WHERE id = ? AND usuario_id = ?",
-            (id, usuario_id),
-        ).fetchone()
-
-        if not contrato:
-            conn.close()
+        versao = executar_escrita(repo_contratos.excluir, usuario_id, id)
+        if versao is None:
             return jsonify({"success": False, "message": "Contrato não encontrado"}), 404
-
-        conn.execute("DELETE FROM notificacao WHERE contrato_id = ?", (id,))
-        conn.execute("DELETE FROM contrato WHERE id = ? AND usuario_id = ?", (id, usuario_id))
-        conn.commit()
-        conn.close()
+        publicar_evento(usuario_id, versao, "contrato", "excluido", id)
 
         return jsonify({"success": True, "message": "Contrato excluído com sucesso"})
     except Exception as e:
@@ -691,47 +4451,91 @@ def excluir_contrato(id):
 # ========== API - NOTIFICAÇÕES ==========
 @app.route("/api/notificacoes", methods=["GET"])
 @login_required
+@somente_leitura
+@etag_condicional
 def listar_notificacoes():
+    """
+    Histórico de notificações do usuário, da mais recente para a mais antiga.
+
+    Parâmetros opcionais (query string):
+    - limit / cursor: paginação por (criado_em, id), com next_cursor
+    - status, tipo, contrato_id, de / ate (janela sobre criado_em)
+    - totais=1: inclui a contagem de notificações por status
+    """
     try:
         usuario_id = session["usuario_id"]
-        conn = get_db_connection()
+        args = request.args
 
-        notificacoes = conn.execute(
-            """
-            SELECT n.*, c.nome as contrato_nome
-            FROM notificacao n
-            JOIN contrato c ON n.contrato_id = c.id
-            WHERE c.usuario_id = ?
-            ORDER BY n.criado_em DESC
-            """,
-            (usuario_id,),
-        ).fetchall()
+        try:
+            paginado = "limit" in args or "cursor" in args
+            limite = None
+            if paginado:
+                limite = args.get("limit", LIMITE_PAGINA_PADRAO, type=int)
+                if limite is None or not 1 <= limite <= LIMITE_PAGINA_MAX:
+                    raise ValueError(f"limit deve estar entre 1 e {LIMITE_PAGINA_MAX}")
+
+            filtros = {"status": args.get("status"), "tipo": args.get("tipo")}
+            if args.get("contrato_id"):
+                filtros["contrato_id"] = args.get("contrato_id", type=int)
+                if filtros["contrato_id"] is None:
+                    raise ValueError("contrato_id inválido")
+
+            # criado_em vem de CURRENT_TIMESTAMP (AAAA-MM-DD HH:MM:SS)
+            if args.get("de"):
+                inicio, _ = ler_limite_data(args["de"])
+                filtros["de"] = inicio.replace("T", " ")
+            if args.get("ate"):
+                fim, filtros["ate_inclusivo"] = ler_limite_data(args["ate"], fim=True)
+                filtros["ate"] = fim.replace("T", " ")
+
+            if args.get("cursor"):
+                filtros["apos"] = decodificar_cursor(args["cursor"])
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        conn.close()
+        conn = get_db_connection()
+        notificacoes = repo_notificacoes.listar(
+            conn, usuario_id, limite=None if limite is None else limite + 1, **filtros
+        )
 
-        notificacoes_json = []
-        for notif in notificacoes:
-            notificacoes_json.append(
-                {
-                    "id": notif["id"],
-                    "contrato_id": notif["contrato_id"],
-                    "contrato_nome": notif["contrato_nome"],
-                    "tipo": notif["tipo"],
-                    "assunto": notif["assunto"],
-                    "mensagem": notif["mensagem"],
-                    "email_destino": notif["email_destino"],
-                    "status": notif["status"],
-                    "data_envio": notif["data_envio"],
-                    "criado_em": notif["criado_em"],
-                }
-            )
+        next_cursor = None
+        if limite is not None and len(notificacoes) > limite:
+            notificacoes = notificacoes[:limite]
+            _, criado_em, ultimo_id = notificacoes[-1]
+            next_cursor = codificar_cursor(criado_em, ultimo_id)
+
+        extras = {"next_cursor": next_cursor}
+        if args.get("totais") == "1":
+            extras["totais"] = repo_notificacoes.totais_por_status(conn, usuario_id)
 
-        return jsonify({"success": True, "notificacoes": notificacoes_json})
+        return resposta_lista_json("notificacoes", (n[0] for n in notificacoes), **extras)
     except Exception as e:
         logger.error(f"Erro ao listar notificações: {str(e)}")
         return jsonify({"success": False, "message": "Erro ao listar notificações"}), 500
 
 
+@app.route("/api/notificacoes/export", methods=["GET"])
+@login_required
+def exportar_notificacoes():
+    """Exporta o histórico completo de notificações do usuário."""
+    return resposta_exportacao(repo_notificacoes.exportar(session["usuario_id"]), "notificacoes")
+
+
+def ler_emails(emails):
+    # Aceita lista ou string separada por vírgulas
+    if isinstance(emails, str):
+        emails_list = [email.strip() for email in emails.split(",") if email.strip()]
+    elif isinstance(emails, list):
+        emails_list = [str(e).strip() for e in emails if str(e).strip()]
+    else:
+        raise ValueError("Formato de emails inválido")
+
+    for email in emails_list:
+        if "@" not in email or "." not in email:
+            raise ValueError(f"Email inválido: {email}")
+    return emails_list
+
+
 @app.route("/api/contratos/<int:contrato_id>/notificar", methods=["POST"])
 @login_required
 def enviar_notificacao(contrato_id):
@@ -740,13 +4544,9 @@ def enviar_notificacao(contrato_id):
         data = request.json or {}
 
         conn = get_db_connection()
-        contrato = conn.execute(
-            "SELECT * FROM contrato WHERE id = ? AND usuario_id = ?",
-            (contrato_id, usuario_id),
-        ).fetchone()
+        contrato = repo_contratos.obter(conn, usuario_id, contrato_id)
 
         if not contrato:
-            conn.close()
             return jsonify({"success": False, "message": "Contrato não encontrado"}), 404
 
         emails = data.get("emails")
@@ -755,185 +4555,271 @@ def enviar_notificacao(contrato_id):
         mensagem_customizada = data.get("mensagem_customizada")
 
         if not emails or not tipo:
-            conn.close()
             return jsonify({"success": False, "message": "Emails e tipo são obrigatórios"}), 400
 
-        if isinstance(emails, str):
-            emails_list = [email.strip() for email in emails.split(",") if email.strip()]
-        elif isinstance(emails, list):
-            emails_list = [e.strip() for e in emails if str(e).strip()]
-        else:
-            conn.close()
-            return jsonify({"success": False, "message": "Formato de emails inválido"}), 400
-
-        for email in emails_list:
-            if "@" not in email or "." not in email:
-                conn.close()
-                return jsonify({"success": False, "message": f"Email inválido: {email}"}), 400
-
-        if tipo == "lembrete_diario":
-            tipo_design = "urgente"
-            titulo = "Contrato vence amanhã"
-            mensagem = mensagem_customizada or f"O contrato <strong>{contrato['nome']}</strong> está prestes a vencer."
-        elif tipo == "lembrete_semanal":
-            tipo_design = "aviso"
-            titulo = "Contrato próximo do vencimento"
-            mensagem = mensagem_customizada or f"O contrato <strong>{contrato['nome']}</strong> vencerá em 7 dias."
-        elif tipo == "lembrete_mensal":
-            tipo_design = "info"
-            titulo = "Lembrete de contrato"
-            mensagem = mensagem_customizada or f"O contrato <strong>{contrato['nome']}</strong> vencerá em 30 dias."
-        else:
-            tipo_design = "info"
-            titulo = assunto
-            mensagem = mensagem_customizada or f"Notificação referente ao contrato <strong>{contrato['nome']}</strong>."
+        try:
+            emails_list = ler_emails(emails)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        html_content = criar_template_email(
-            assunto=assunto,
-            titulo=titulo,
-            mensagem=mensagem,
-            tipo_notificacao=tipo_design,
-            contrato=contrato,
+        _, _, mensagem_padrao = conteudo_por_tipo(tipo, assunto, contrato)
+        mensagem = mensagem_customizada or mensagem_padrao
+
+        notificacao_id, versao = repo_notificacoes.enfileirar(
+            conn, usuario_id, contrato_id, tipo, assunto, mensagem, emails_list
         )
+        conn.commit()
+        publicar_evento(usuario_id, versao, "notificacao", "criada", notificacao_id)
+        avisar_fila_email()
 
-        data_fim_formatada = formatar_data_brasil(contrato["data_fim"])
-        texto_simples = f"""CONTRATO+ - {assunto}
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "message": f"Notificação enfileirada para {len(emails_list)} email(s)",
+                    "notificacao_id": notificacao_id,
+                    "status": "pendente",
+                    "destinatarios": len(emails_list),
+                }
+            ),
+            202,
+        )
 
-{titulo}
+    except Exception as e:
+        logger.error(f"Erro ao enviar notificação: {str(e)}")
+        return jsonify({"success": False, "message": f"Erro ao enviar notificação: {str(e)}"}), 500
 
-{mensagem}
 
-Contrato: {contrato['nome']}
-Data de Término: {data_fim_formatada}
-Status: {contrato['status']}
+@app.route("/api/notificacoes/batch", methods=["POST"])
+@login_required
+def enviar_notificacoes_lote():
+    """
+    Enfileira a mesma notificação para vários contratos de uma vez.
+
+    Corpo: tipo, emails, assunto e mensagem_customizada como em
+    /api/contratos/<id>/notificar, mais os contratos em contrato_ids (lista)
+    ou filtro ({status, vence_de, vence_ate}). A posse é conferida e todas
+    as linhas são gravadas num único INSERT ... SELECT; a renderização e o
+    envio ficam com a fila, que monta e manda o lote pelas sessões SMTP
+    compartilhadas. Responde com o resultado por contrato.
+    """
+    try:
+        usuario_id = session["usuario_id"]
+        data = request.json or {}
 
-Acesse: http://localhost:5000/dashboard.html
-"""
+        tipo = data.get("tipo")
+        assunto = data.get("assunto", "Notificação de Contrato - CONTRATO+")
+        mensagem_customizada = data.get("mensagem_customizada")
+        contrato_ids = data.get("contrato_ids")
+        filtro = data.get("filtro")
 
-        enviado = enviar_email(emails_list, assunto, html_content, texto_simples)
+        if not data.get("emails") or not tipo:
+            return jsonify({"success": False, "message": "Emails e tipo são obrigatórios"}), 400
+        if (contrato_ids is None) == (filtro is None):
+            return jsonify({"success": False, "message": "Informe contrato_ids ou filtro"}), 400
 
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO notificacao (contrato_id, tipo, assunto, mensagem, email_destino, status, data_envio)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                contrato_id,
-                tipo,
-                assunto,
-                mensagem,
-                ",".join(emails_list),
-                "enviado" if enviado else "erro",
-                datetime.utcnow().isoformat() if enviado else None,
-            ),
-        )
-        conn.commit()
-        conn.close()
+        selecao = {}
+        try:
+            emails_list = ler_emails(data["emails"])
+            if contrato_ids is not None:
+                if not isinstance(contrato_ids, list) or not all(isinstance(i, int) for i in contrato_ids):
+                    raise ValueError("contrato_ids deve ser uma lista de ids")
+                contrato_ids = list(dict.fromkeys(contrato_ids))
+                if not 1 <= len(contrato_ids) <= NOTIFICACOES_LOTE_MAX:
+                    raise ValueError(f"Informe de 1 a {NOTIFICACOES_LOTE_MAX} contratos")
+                selecao["contrato_ids"] = contrato_ids
+            else:
+                if not isinstance(filtro, dict):
+                    raise ValueError("filtro deve ser um objeto")
+                selecao["status"] = filtro.get("status")
+                if filtro.get("vence_de"):
+                    selecao["vence_de"], _ = ler_limite_data(filtro["vence_de"])
+                if filtro.get("vence_ate"):
+                    selecao["vence_ate"], selecao["vence_ate_inclusivo"] = ler_limite_data(
+                        filtro["vence_ate"], fim=True
+                    )
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        # mesma mensagem padrão de conteudo_por_tipo, montada no SQL com o
+        # nome de cada contrato
+        if tipo in CONTEUDO_NOTIFICACAO:
+            modelo = CONTEUDO_NOTIFICACAO[tipo][2]
+        else:
+            modelo = MENSAGEM_NOTIFICACAO_PADRAO
 
-        if enviado:
-            return jsonify(
+        conn = get_db_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if filtro is not None:
+                total = repo_notificacoes.contar_contratos(conn, usuario_id, **selecao)
+                if total > NOTIFICACOES_LOTE_MAX:
+                    conn.rollback()
+                    return (
+                        jsonify(
+                            {
+                                "success": False,
+                                "message": f"O filtro seleciona {total} contratos (máximo {NOTIFICACOES_LOTE_MAX})",
+                            }
+                        ),
+                        400,
+                    )
+
+            inseridas, versao = repo_notificacoes.enfileirar_lote(
+                conn, usuario_id, tipo, assunto, mensagem_customizada, modelo, emails_list, **selecao
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if inseridas:
+            publicar_evento(usuario_id, versao, "notificacao", "criada")
+            avisar_fila_email()
+
+        resultados = [
+            {"contrato_id": n["contrato_id"], "notificacao_id": n["id"], "status": "pendente"}
+            for n in sorted(inseridas, key=lambda n: n["contrato_id"])
+        ]
+        if contrato_ids is not None:
+            encontrados = {n["contrato_id"] for n in inseridas}
+            resultados += [
+                {"contrato_id": id, "status": "erro", "message": "Contrato não encontrado"}
+                for id in contrato_ids
+                if id not in encontrados
+            ]
+
+        return (
+            jsonify(
                 {
-                    "success": True,
-                    "message": f"Notificação enviada para {len(emails_list)} email(s)",
-                    "enviados": len(emails_list),
+                    "success": bool(inseridas),
+                    "message": f"{len(inseridas)} notificação(ões) enfileirada(s) para {len(emails_list)} email(s) cada",
+                    "enfileiradas": len(inseridas),
+                    "destinatarios": len(emails_list),
+                    "resultados": resultados,
                 }
-            )
-
-        return jsonify({"success": False, "message": "Erro ao enviar notificação"}), 500
+            ),
+            202 if inseridas else 404,
+        )
 
     except Exception as e:
-        logger.error(f"Erro ao enviar notificação: {str(e)}")
-        return jsonify({"success": False, "message": f"Erro ao enviar notificação: {str(e)}"}), 500
+        logger.error(f"Erro ao enviar notificações em lote: {str(e)}")
+        return jsonify({"success": False, "message": f"Erro ao enviar notificações em lote: {str(e)}"}), 500
 
 
 # ========== API - DASHBOARD ==========
 @app.route("/api/dashboard/stats", methods=["GET"])
 @login_required
+@somente_leitura
+@etag_condicional
 def get_dashboard_stats():
     try:
         usuario_id = session["usuario_id"]
         conn = get_db_connection()
 
-        total_contratos = conn.execute(
-            "SELECT COUNT(*) as total FROM contrato WHERE usuario_id = ?",
-            (usuario_id,),
-        ).fetchone()["total"]
+        versao = obter_versao_dados(conn, usuario_id)
+        hoje = datetime.utcnow().date()
+        em_cache = _cache_stats.get(usuario_id)
+        if em_cache and em_cache[0] == versao and em_cache[1] == hoje:
+            return jsonify({"success": True, "stats": em_cache[2]})
 
-        contratos_ativos = conn.execute(
-            'SELECT COUNT(*) as total FROM contrato WHERE usuario_id = ? AND status = "ativo"',
-            (usuario_id,),
-        ).fetchone()["total"]
+        stats = calcular_stats_dashboard(conn, usuario_id)
 
-        hoje_dt = datetime.now()
-        hoje = hoje_dt.strftime("%Y-%m-%d %H:%M:%S")
+        if len(_cache_stats) >= STATS_CACHE_MAX:
+            _cache_stats.pop(next(iter(_cache_stats)), None)
+        _cache_stats[usuario_id] = (versao, hoje, stats)
 
-        data_limite_7 = (hoje_dt + timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
-        contratos_proximos_7 = conn.execute(
-            """
-            SELECT COUNT(*) as total
-            FROM contrato
-            WHERE usuario_id = ?
-            AND status = "ativo"
-            AND data_fim BETWEEN ? AND ?
-            """,
-            (usuario_id, hoje, data_limite_7),
-        ).fetchone()["total"]
+        return jsonify({"success": True, "stats": stats})
+    except Exception as e:
+        logger.error(f"Erro ao obter estatísticas: {str(e)}")
+        return jsonify({"success": False, "message": "Erro ao obter estatísticas"}), 500
 
-        contratos_vencidos = conn.execute(
-            """
-            SELECT COUNT(*) as total
-            FROM contrato
-            WHERE usuario_id = ?
-            AND data_fim < ?
-            AND status = "ativo"
-            """,
-            (usuario_id, hoje),
-        ).fetchone()["total"]
 
-        contratos_recentes = conn.execute(
-            """
-            SELECT id, nome, data_inicio, data_fim, status, atualizado_em
-            FROM contrato
-            WHERE usuario_id = ?
-            ORDER BY atualizado_em DESC, id DESC
-            LIMIT 6
-            """,
-            (usuario_id,),
-        ).fetchall()
+# ========== API - EVENTOS ==========
+@app.route("/api/stream", methods=["GET"])
+@login_required
+def stream_eventos():
+    """
+    Server-Sent Events com as alterações dos dados do usuário.
 
-        conn.close()
+    Eventos:
+    - pronto: conexão aberta (o cliente deve recarregar o que exibe)
+    - alteracao: {"versao", "recurso", "acao", "id"}; recurso/acao/id vêm
+      nulos quando a alteração foi feita em outro worker
 
-        recentes_json = []
-        for c in contratos_recentes:
-            recentes_json.append(
-                {
-                    "id": c["id"],
-                    "nome": c["nome"],
-                    "data_inicio": c["data_inicio"],
-                    "data_fim": c["data_fim"],
-                    "status": c["status"],
-                    "dias_restantes": calcular_dias_restantes(c["data_fim"]),
-                    "atualizado_em": c["atualizado_em"],
-                }
-            )
+    Pensado para workers assíncronos (gevent, ver gunicorn.conf.py): cada
+    conexão ociosa é só uma fila em memória.
+    """
+    usuario_id = session["usuario_id"]
+    versao = obter_versao_dados(get_db_connection(), usuario_id)
+    fila = _assinar_eventos(usuario_id, versao)
 
-        return jsonify(
-            {
-                "success": True,
-                "stats": {
-                    "total_contratos": total_contratos,
-                    "contratos_ativos": contratos_ativos,
-                    "contratos_vencendo_7dias": contratos_proximos_7,
-                    "contratos_vencidos": contratos_vencidos,
-                    "contratos_recentes": recentes_json,
-                    "atualizado_em": datetime.now().isoformat(),
-                },
-            }
-        )
+    def gerar():
+        try:
+            yield f"retry: 5000\nevent: pronto\ndata: {json.dumps({'versao': versao})}\n\n"
+            fim = time.monotonic() + SSE_CONFIG["duracao_max_s"]
+            while time.monotonic() < fim:
+                try:
+                    evento = fila.get(timeout=SSE_CONFIG["heartbeat_s"])
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield f"id: {evento['versao']}\nevent: alteracao\ndata: {json.dumps(evento)}\n\n"
+        finally:
+            _cancelar_assinatura(usuario_id, fila)
+
+    resp = Response(gerar(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+# ========== API - MÉTRICAS ==========
+def medidores_instantaneos():
+    agora = _agora_iso()
+    conn = get_db_connection()
+    fila = conn.execute(
+        """
+        SELECT
+            COUNT(*) AS pendentes,
+            COUNT(CASE WHEN proxima_tentativa <= ? THEN 1 END) AS prontas,
+            MIN(CASE WHEN proxima_tentativa <= ? THEN proxima_tentativa END) AS mais_antiga
+        FROM notificacao
+        WHERE status = 'pendente'
+        """,
+        (agora, agora),
+    ).fetchone()
+    atraso = 0.0
+    if fila["mais_antiga"]:
+        atraso = (datetime.fromisoformat(agora) - datetime.fromisoformat(fila["mais_antiga"])).total_seconds()
+
+    with _assinantes_lock:
+        assinantes = sum(len(filas) for filas in _assinantes.values())
+
+    return (
+        ("contratomais_fila_email_pendentes", fila["pendentes"], ()),
+        ("contratomais_fila_email_prontas", fila["prontas"], ()),
+        ("contratomais_fila_email_atraso_segundos", atraso, ()),
+        ("contratomais_sse_assinantes", assinantes, ()),
+    ) + tuple(
+        ("contratomais_db_pool_ociosas", ociosas, (("pool", pool),)) for pool, ociosas in motor.ociosas().items()
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def exportar_metricas():
+    token = METRICAS_CONFIG["token"]
+    if not token:
+        # sem token configurado as métricas ficam fechadas, não abertas
+        return Response("Defina METRICAS_TOKEN para expor as métricas\n", status=403, mimetype="text/plain")
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return Response("Não autorizado\n", status=401, mimetype="text/plain")
+    try:
+        medidores = medidores_instantaneos()
     except Exception as e:
-        logger.error(f"Erro ao obter estatísticas: {str(e)}")
-        return jsonify({"success": False, "message": "Erro ao obter estatísticas"}), 500
+        logger.error(f"Erro ao ler métricas instantâneas: {str(e)}")
+        medidores = ()
+    return Response(metricas.exportar(medidores), mimetype="text/plain; version=0.0.4")
 
 
 # ========== API - TESTE ==========
@@ -950,12 +4836,166 @@ def teste_conexao():
     )
 
 
+@app.cli.command("migrar")
+@click.option("--status", is_flag=True, help="Só lista as migrações e quando foram aplicadas.")
+def comando_migrar(status):
+    """Aplica as migrações pendentes do schema."""
+    if motor.nome == "postgres":
+        # no PostgreSQL o schema é criado por inteiro, de forma idempotente
+        if status:
+            raise click.ClickException("--status só se aplica ao motor SQLite")
+        motor.criar_schema()
+        click.echo("Schema do PostgreSQL em dia")
+        return
+    if status:
+        conn = abrir_conexao()
+        try:
+            aplicadas = versoes_aplicadas(conn)
+        finally:
+            conn.close()
+        for versao, nome, _ in MIGRACOES:
+            click.echo(f"{versao:03d}_{nome:<24} {aplicadas.get(versao) or 'pendente'}")
+        return
+    novas = migrar_banco()
+    click.echo(f"{len(novas)} migração(ões) aplicada(s)" if novas else "Banco já está na última versão")
+
+
+@app.cli.command("fila-email")
+def comando_fila_email():
+    """Drena a fila de emails continuamente (para rodar com EMAIL_WORKERS=0 na web)."""
+    iniciar_fila_email(workers=max(FILA_EMAIL_CONFIG["workers"], 1))
+    while True:
+        time.sleep(3600)
+
+
+@app.cli.command("estatisticas")
+@click.option("--recalcular", is_flag=True, help="Recontagem completa em vez da atualização incremental.")
+def comando_estatisticas(recalcular):
+    """Atualiza os contadores do dashboard (usuario_estatisticas)."""
+    conn = motor.abrir()
+    try:
+        if recalcular:
+            conn.execute("BEGIN IMMEDIATE")
+            recalcular_estatisticas(conn)
+            conn.commit()
+            logger.info("Estatísticas recalculadas")
+        else:
+            logger.info(f"Estatísticas atualizadas: {atualizar_estatisticas(conn)} usuário(s)")
+    finally:
+        conn.close()
+
+
+@app.cli.command("retencao")
+@click.option("--dias", type=int, default=None, help="Idade mínima, em dias (padrão: RETENCAO_CONFIG).")
+@click.option("--vacuum", is_flag=True, help="VACUUM completo no fim (trava o banco ou a tabela durante a execução).")
+def comando_retencao(dias, vacuum):
+    """Arquiva notificações antigas e compacta o banco."""
+    conn = motor.abrir()
+    try:
+        removidas = arquivar_notificacoes(conn, dias)
+        motor.compactar(conn, completo=vacuum)
+        logger.info(f"Retenção: {removidas} notificação(ões) arquivada(s)")
+    finally:
+        conn.close()
+
+
+@app.cli.command("benchmark-templates")
+@click.option("--quantidade", default=5000, show_default=True, help="Emails renderizados por rodada.")
+@click.option("--rodadas", default=5, show_default=True)
+def comando_benchmark_templates(quantidade, rodadas):
+    """Compara o layout montado por inteiro a cada email com o compilado em lote."""
+    tipos = list(CONTEUDO_NOTIFICACAO) + ["informativo"]
+    agora = datetime.utcnow()
+    itens = []
+    contratos = [
+        {
+            "id": id,
+            "nome": f"Contrato {id}",
+            "descricao": "Prestação de serviços" if id % 3 else None,
+            "data_inicio": (agora - timedelta(days=200)).strftime(FORMATO_DATA),
+            "data_fim": (agora + timedelta(days=id % 60, hours=1)).strftime(FORMATO_DATA),
+            "status": "ativo",
+        }
+        for id in range(500)
+    ]
+    for i in range(quantidade):
+        contrato = contratos[i % len(contratos)]
+        tipo = tipos[i % len(tipos)]
+        notificacao = {"tipo": tipo, "assunto": f"Aviso {tipo}", "mensagem": f"Mensagem {i}"}
+        itens.append((notificacao, contrato))
+
+    def direto():
+        # como era antes da compilação: layout inteiro e datas convertidas com
+        # datetime a cada email
+        saida = []
+        for notificacao, contrato in itens:
+            tipo_design, titulo, _ = conteudo_por_tipo(notificacao["tipo"], notificacao["assunto"], contrato)
+            dias = calcular_dias_restantes(contrato["data_fim"])
+            detalhes = {
+                "nome": contrato["nome"],
+                "descricao": contrato["descricao"] or "Não informada",
+                "data_inicio": datetime.fromisoformat(contrato["data_inicio"]).strftime("%d/%m/%Y %H:%M"),
+                "data_fim": datetime.fromisoformat(contrato["data_fim"]).strftime("%d/%m/%Y %H:%M"),
+                "dias_restantes": dias,
+                "fundo_dias": "#fee2e2" if dias < 7 else "#fef3c7" if dias < 30 else "#d1fae5",
+                "cor_dias": "#991b1b" if dias < 7 else "#92400e" if dias < 30 else "#065f46",
+            }
+            saida.append(
+                layout_email(notificacao["assunto"], titulo, notificacao["mensagem"], tipo_design, detalhes)
+            )
+        return saida
+
+    def compilado():
+        return [html for html, _ in montar_emails_lote(itens)]
+
+    if direto() != compilado():
+        raise click.ClickException("Os dois caminhos geraram HTML diferente")
+
+    for nome, funcao in (("direto", direto), ("compilado", compilado)):
+        tempos = []
+        for _ in range(rodadas):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+        melhor = min(tempos)
+        click.echo(f"{nome:>10}: {melhor * 1000:8.1f} ms  ({quantidade / melhor:,.0f} emails/s)")
+
+
+@app.cli.command("lembretes")
+@click.option("--data", "data_ref", default=None, help="Dia de referência (AAAA-MM-DD); padrão: hoje (UTC).")
+@click.option("--enviar", is_flag=True, help="Drena a fila de emails neste processo após enfileirar.")
+@click.option("--intervalo", type=int, default=0, help="Repete a cada N minutos em vez de rodar uma vez.")
+def comando_lembretes(data_ref, enviar, intervalo):
+    """Enfileira os lembretes diário/semanal/mensal dos contratos (agendar via cron ou --intervalo)."""
+    while True:
+        hoje = datetime.strptime(data_ref, "%Y-%m-%d").date() if data_ref else None
+        conn = motor.abrir()
+        try:
+            inicio = time.monotonic()
+            resumo = gerar_lembretes(conn, hoje)
+            logger.info(f"Lembretes enfileirados em {time.monotonic() - inicio:.2f}s: {resumo}")
+            if enviar:
+                logger.info(f"Notificações enviadas: {drenar_fila_email(conn)}")
+        finally:
+            conn.close()
+
+        if not intervalo:
+            return
+        time.sleep(intervalo * 60)
+
+
 if __name__ == "__main__":
     try:
         os.makedirs(DATA_DIR, exist_ok=True)
-        criar_tabelas()
+        motor.criar_schema()
     except Exception as e:
         logger.exception("Falha ao inicializar banco: %s", e)
 
+    # com o reloader do modo debug, só o processo filho atende requisições
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        iniciar_fila_email()
+        iniciar_atualizador_estatisticas()
+        iniciar_retencao()
+
     print("Servidor iniciado em: http://localhost:5000")
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=True, threaded=True)
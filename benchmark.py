@@ -0,0 +1,854 @@
+"""
+Benchmarks do CONTRATO+.
+
+    python benchmark.py popular --escala 100k
+    python benchmark.py carga --modo cliente --duracao 30 --concorrencia 8
+    python benchmark.py carga --modo gunicorn --workers 4 --saida depois.json
+    python benchmark.py micro --saida micro.json
+    python benchmark.py comparar antes.json depois.json
+
+Os comandos usam um banco próprio (data/benchmark/contratos.db por padrão,
+ver --banco) e um servidor SMTP falso local, então podem rodar na mesma
+máquina do servidor de desenvolvimento sem tocar nos dados reais. O
+resultado sai em JSON (latências p50/p95/p99, vazão, RSS) para comparar
+uma rodada com a outra.
+"""
+import gzip
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+
+try:
+    import brotli
+except ImportError:  # opcional, como no app: sem ele o cliente pede só gzip
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BANCO_PADRAO = os.path.join(BASE_DIR, "data", "benchmark", "contratos.db")
+
+ESCALAS = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+SENHA_ADMIN = "admin123"
+EMAIL_DESTINO = "destino@benchmark.local"
+
+PALAVRAS = (
+    "manutenção", "limpeza", "segurança", "aluguel", "software", "licença", "consultoria", "transporte",
+    "energia", "internet", "telefonia", "auditoria", "seguro", "frota", "obras", "reforma", "jardinagem",
+    "vigilância", "catering", "impressão", "treinamento", "suporte", "hospedagem", "marketing",
+)
+
+# Tráfego de uma aba aberta do frontend: a cada ciclo o dashboard e a lista
+# de contratos são consultados (setInterval de 5 s, com o ETag da resposta
+# anterior, como faz o navegador); as demais operações acontecem em parte
+# dos ciclos, com a probabilidade indicada.
+OPERACOES_POR_CICLO = (
+    ("notificacoes", 0.20),
+    ("buscar", 0.15),
+    ("criar", 0.10),
+    ("atualizar", 0.15),
+    ("excluir", 0.05),
+    ("notificar", 0.05),
+)
+
+
+def ler_escala(valor):
+    valor = valor.strip().lower()
+    if valor in ESCALAS:
+        return ESCALAS[valor]
+    try:
+        return int(valor)
+    except ValueError:
+        raise click.BadParameter(f"use {', '.join(ESCALAS)} ou um número de contratos")
+
+
+def configurar_ambiente(banco, smtp_porta=None, extra=None):
+    # Precisa acontecer antes do "import app": as configurações são lidas
+    # na importação
+    ambiente = {
+        "CONTRATOS_DB": banco,
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_porta or 0),
+        "SMTP_TLS": "0",
+        "SMTP_SENHA": "",
+        "SMTP_ENVIOS_POR_SEGUNDO": "100000",
+    }
+    ambiente.update(extra or {})
+    os.environ.update(ambiente)
+    return ambiente
+
+
+def importar_app(banco, smtp_porta=None, extra=None):
+    configurar_ambiente(banco, smtp_porta, extra)
+    sys.path.insert(0, BASE_DIR)
+    import app
+
+    return app
+
+
+def versao_codigo():
+    try:
+        saida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        alterado = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR, capture_output=True, text=True
+        ).stdout.strip()
+        return saida + ("-alterado" if alterado else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentil(ordenados, p):
+    # nearest-rank
+    if not ordenados:
+        return None
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+def resumir_latencias(amostras_ms, duracao_s):
+    ordenados = sorted(amostras_ms)
+    return {
+        "requisicoes": len(ordenados),
+        "throughput_rps": round(len(ordenados) / duracao_s, 2) if duracao_s else None,
+        "p50_ms": _arredondar(percentil(ordenados, 50)),
+        "p95_ms": _arredondar(percentil(ordenados, 95)),
+        "p99_ms": _arredondar(percentil(ordenados, 99)),
+        "max_ms": _arredondar(ordenados[-1] if ordenados else None),
+        "media_ms": _arredondar(sum(ordenados) / len(ordenados) if ordenados else None),
+    }
+
+
+def _arredondar(valor):
+    return None if valor is None else round(valor, 3)
+
+
+def emitir(resultado, saida):
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if saida:
+        with open(saida, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto + "\n")
+        click.echo(f"Resultado gravado em {saida}", err=True)
+    else:
+        click.echo(texto)
+
+
+# ========== MEMÓRIA ==========
+def rss_kib(pid):
+    try:
+        with open(f"/proc/{pid}/status") as arquivo:
+            for linha in arquivo:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def processos_filhos(pid):
+    filhos = []
+    try:
+        nomes = os.listdir("/proc")
+    except OSError:
+        return filhos
+    for nome in nomes:
+        if not nome.isdigit():
+            continue
+        try:
+            with open(f"/proc/{nome}/stat") as arquivo:
+                # o nome do processo vem entre parênteses e pode ter espaços
+                campos = arquivo.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(campos[1]) == pid:
+            filhos.append(int(nome))
+    return filhos
+
+
+class MonitorMemoria:
+    """Amostra o RSS (processo + filhos diretos, ex.: workers do gunicorn)."""
+
+    def __init__(self, pid, intervalo_s=0.5):
+        self.pid = pid
+        self.intervalo_s = intervalo_s
+        self.maximo = 0
+        self.ultimo = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, daemon=True)
+
+    def medir(self):
+        total = rss_kib(self.pid) + sum(rss_kib(filho) for filho in processos_filhos(self.pid))
+        self.ultimo = total
+        self.maximo = max(self.maximo, total)
+        return total
+
+    def _rodar(self):
+        while not self._parar.wait(self.intervalo_s):
+            self.medir()
+
+    def __enter__(self):
+        self.medir()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+        self.medir()
+
+    def resumo(self):
+        return {"max_kib": self.maximo, "final_kib": self.ultimo}
+
+
+# ========== SMTP FALSO ==========
+class _SessaoSMTPFalsa(socketserver.StreamRequestHandler):
+    def handle(self):
+        servidor = self.server
+        self.wfile.write(b"220 benchmark ESMTP\r\n")
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha[:4].upper()
+            if comando == b"EHLO":
+                self.wfile.write(b"250-benchmark\r\n250-8BITMIME\r\n250 SIZE 26214400\r\n")
+            elif comando == b"DATA":
+                self.wfile.write(b"354 fim com <CRLF>.<CRLF>\r\n")
+                while True:
+                    linha = self.rfile.readline()
+                    if not linha or linha == b".\r\n":
+                        break
+                if servidor.latencia_s:
+                    time.sleep(servidor.latencia_s)
+                with servidor.lock:
+                    servidor.mensagens += 1
+                self.wfile.write(b"250 OK\r\n")
+            elif comando == b"QUIT":
+                self.wfile.write(b"221 tchau\r\n")
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP
+                self.wfile.write(b"250 OK\r\n")
+
+
+class ServidorSMTPFalso(socketserver.ThreadingTCPServer):
+    """Aceita tudo e só conta as mensagens; latencia_ms simula um servidor real."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latencia_ms=0):
+        super().__init__(("127.0.0.1", 0), _SessaoSMTPFalsa)
+        self.latencia_s = latencia_ms / 1000
+        self.mensagens = 0
+        self.lock = threading.Lock()
+        self.porta = self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+# ========== POPULAR O BANCO ==========
+def popular_banco(app, contratos, usuarios, notificacoes_por_contrato, semente, lote=10_000):
+    rng = random.Random(semente)
+    banco = app.DATABASE
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(banco + sufixo):
+            os.remove(banco + sufixo)
+    if os.path.exists(app.RETENCAO_CONFIG["arquivo"]):
+        os.remove(app.RETENCAO_CONFIG["arquivo"])
+    app.migrar_banco()
+
+    agora = datetime.utcnow().replace(microsecond=0)
+    conn = app.abrir_conexao()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        senha_hash = app.hash_senha(SENHA_ADMIN)
+        conn.executemany(
+            "INSERT INTO usuario (nome_completo, email, senha_hash) VALUES (?, ?, ?)",
+            ((f"Usuário {i}", f"usuario{i}@benchmark.local", senha_hash) for i in range(2, usuarios + 1)),
+        )
+        conn.commit()
+
+        status = ("ativo", "concluido", "inativo", "pendente")
+        pesos_status = (70, 10, 10, 10)
+
+        def linhas_contrato(inicio, fim):
+            for i in range(inicio, fim):
+                data_inicio = agora - timedelta(days=rng.randint(0, 720), seconds=rng.randint(0, 86399))
+                data_fim = data_inicio + timedelta(days=rng.randint(30, 1100))
+                criado = data_inicio.strftime("%Y-%m-%d %H:%M:%S")
+                yield (
+                    f"Contrato {i} {rng.choice(PALAVRAS)}",
+                    " ".join(rng.choices(PALAVRAS, k=rng.randint(3, 12))),
+                    data_inicio.strftime(app.FORMATO_DATA),
+                    data_fim.strftime(app.FORMATO_DATA),
+                    rng.choices(status, pesos_status)[0],
+                    criado,
+                    criado,
+                    i % usuarios + 1,
+                )
+
+        for inicio in range(0, contratos, lote):
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                """
+                INSERT INTO contrato
+                    (nome, descricao, data_inicio, data_fim, status, criado_em, atualizado_em, usuario_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                linhas_contrato(inicio, min(inicio + lote, contratos)),
+            )
+            conn.commit()
+
+        # Histórico dentro da janela de retenção, para o job de arquivo não
+        # rodar no meio da medição
+        janela_dias = max(1, min(90, app.RETENCAO_CONFIG["dias"] - 1))
+        total_notificacoes = int(contratos * notificacoes_por_contrato)
+        tipos = list(app.CONTEUDO_NOTIFICACAO)
+
+        def linhas_notificacao(inicio, fim):
+            for _ in range(inicio, fim):
+                contrato_id = rng.randint(1, contratos)
+                criado = (agora - timedelta(seconds=rng.randint(60, janela_dias * 86400))).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                )
+                tipo = rng.choice(tipos)
+                enviado = rng.random() < 0.9
+                yield (
+                    contrato_id,
+                    (contrato_id - 1) % usuarios + 1,
+                    tipo,
+                    f"Aviso {tipo}",
+                    "Mensagem gerada pelo benchmark",
+                    EMAIL_DESTINO,
+                    "enviado" if enviado else "erro",
+                    criado if enviado else None,
+                    criado,
+                    criado,
+                )
+
+        for inicio in range(0, total_notificacoes, lote):
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                """
+                INSERT INTO notificacao
+                    (contrato_id, usuario_id, tipo, assunto, mensagem, email_destino, status, data_envio,
+                     criado_em, proxima_tentativa)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                linhas_notificacao(inicio, min(inicio + lote, total_notificacoes)),
+            )
+            conn.commit()
+
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return total_notificacoes
+    finally:
+        conn.close()
+
+
+def contar_escala(banco):
+    import sqlite3
+
+    conn = sqlite3.connect(banco)
+    try:
+        return {
+            tabela: conn.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+            for tabela in ("usuario", "contrato", "notificacao")
+        }
+    finally:
+        conn.close()
+
+
+# ========== CLIENTES ==========
+class ClienteFlask:
+    """Requisições pelo test client do Flask, no próprio processo."""
+
+    def __init__(self, app):
+        self._cliente = app.app.test_client()
+
+    def requisitar(self, metodo, caminho, corpo=None, cabecalhos=None):
+        resposta = self._cliente.open(caminho, method=metodo, json=corpo, headers=cabecalhos or {})
+        dados = resposta.get_data()
+        return resposta.status_code, resposta.headers.get("ETag"), dados
+
+
+class ClienteHTTP:
+    """Conexão keep-alive com o gunicorn, guardando o cookie de sessão."""
+
+    def __init__(self, porta):
+        self.porta = porta
+        self._conexao = None
+        self._cookie = None
+
+    def requisitar(self, metodo, caminho, corpo=None, cabecalhos=None):
+        cabecalhos = dict(cabecalhos or {})
+        # como o navegador: a resposta vem comprimida e é descomprimida aqui
+        cabecalhos["Accept-Encoding"] = "br, gzip" if brotli is not None else "gzip"
+        if self._cookie:
+            cabecalhos["Cookie"] = self._cookie
+        dados = None
+        if corpo is not None:
+            dados = json.dumps(corpo).encode()
+            cabecalhos["Content-Type"] = "application/json"
+        for tentativa in range(2):
+            if self._conexao is None:
+                self._conexao = http.client.HTTPConnection("127.0.0.1", self.porta, timeout=60)
+            try:
+                self._conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+                resposta = self._conexao.getresponse()
+                conteudo = resposta.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # o servidor fechou a conexão ociosa: reabre uma vez
+                self._conexao.close()
+                self._conexao = None
+                if tentativa:
+                    raise
+        codificacao = resposta.getheader("Content-Encoding")
+        if codificacao == "br":
+            conteudo = brotli.decompress(conteudo)
+        elif codificacao == "gzip":
+            conteudo = gzip.decompress(conteudo)
+        cookie = resposta.getheader("Set-Cookie")
+        if cookie:
+            self._cookie = cookie.split(";", 1)[0]
+        return resposta.status, resposta.getheader("ETag"), conteudo
+
+
+# ========== CARGA ==========
+class UsuarioVirtual:
+    def __init__(self, cliente, rng, resultados):
+        self.cliente = cliente
+        self.rng = rng
+        self.resultados = resultados
+        self.etags = {}
+        self.contratos = []
+        self.criados = []
+
+    def medir(self, operacao, metodo, caminho, corpo=None, cabecalhos=None, esperado=(200,)):
+        inicio = time.perf_counter()
+        try:
+            status, etag, dados = self.cliente.requisitar(metodo, caminho, corpo, cabecalhos)
+        except (http.client.HTTPException, OSError):
+            status, etag, dados = 0, None, b""
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        self.resultados.registrar(operacao, duracao_ms, status, status in esperado)
+        return status, etag, dados
+
+    def entrar(self):
+        status, _, _ = self.cliente.requisitar("POST", "/api/auth/admin-login", {"senha": SENHA_ADMIN})
+        if status != 200:
+            raise click.ClickException(f"Login falhou (HTTP {status})")
+        status, _, dados = self.cliente.requisitar("GET", "/api/contratos?fields=id&limit=500")
+        self.contratos = [c["id"] for c in json.loads(dados)["contratos"]] if status == 200 else []
+
+    def consultar(self, operacao, caminho):
+        # polling do frontend: If-None-Match com o ETag da última resposta
+        cabecalhos = {"If-None-Match": self.etags[caminho]} if caminho in self.etags else None
+        status, etag, _ = self.medir(operacao, "GET", caminho, cabecalhos=cabecalhos, esperado=(200, 304))
+        if etag:
+            self.etags[caminho] = etag
+
+    def _contrato_qualquer(self):
+        if self.criados and self.rng.random() < 0.5:
+            return self.rng.choice(self.criados)
+        return self.rng.choice(self.contratos) if self.contratos else None
+
+    def executar(self, operacao):
+        agora = datetime.utcnow()
+        if operacao == "notificacoes":
+            self.medir(operacao, "GET", "/api/notificacoes?limit=30")
+        elif operacao == "buscar":
+            self.medir(operacao, "GET", f"/api/contratos/search?q={self.rng.choice(PALAVRAS)[:4]}")
+        elif operacao == "criar":
+            corpo = {
+                "nome": f"Benchmark {self.rng.choice(PALAVRAS)}",
+                "descricao": " ".join(self.rng.choices(PALAVRAS, k=5)),
+                "data_inicio": agora.strftime("%Y-%m-%dT%H:%M"),
+                "data_fim": (agora + timedelta(days=self.rng.randint(1, 400))).strftime("%Y-%m-%dT%H:%M"),
+                "status": "ativo",
+            }
+            status, _, dados = self.medir(operacao, "POST", "/api/contratos", corpo, esperado=(200, 201))
+            if status in (200, 201):
+                self.criados.append(json.loads(dados)["contrato"]["id"])
+        elif operacao == "atualizar":
+            contrato_id = self._contrato_qualquer()
+            if contrato_id is not None:
+                corpo = {"descricao": " ".join(self.rng.choices(PALAVRAS, k=5))}
+                self.medir(operacao, "PUT", f"/api/contratos/{contrato_id}", corpo)
+        elif operacao == "excluir":
+            # só apaga o que este usuário virtual criou, para não esvaziar a
+            # massa de dados entre rodadas
+            if self.criados:
+                contrato_id = self.criados.pop(self.rng.randrange(len(self.criados)))
+                self.medir(operacao, "DELETE", f"/api/contratos/{contrato_id}")
+        elif operacao == "notificar":
+            contrato_id = self._contrato_qualquer()
+            if contrato_id is not None:
+                corpo = {"emails": EMAIL_DESTINO, "tipo": "informativo", "assunto": "Benchmark"}
+                self.medir(operacao, "POST", f"/api/contratos/{contrato_id}/notificar", corpo, esperado=(200, 201, 202))
+
+    def rodar(self, fim, intervalo_s):
+        while True:
+            inicio_ciclo = time.monotonic()
+            if inicio_ciclo >= fim:
+                return
+            self.consultar("dashboard_stats", "/api/dashboard/stats")
+            self.consultar("listar_contratos", "/api/contratos")
+            for operacao, probabilidade in OPERACOES_POR_CICLO:
+                if self.rng.random() < probabilidade:
+                    self.executar(operacao)
+            if intervalo_s:
+                espera = intervalo_s - (time.monotonic() - inicio_ciclo)
+                if espera > 0:
+                    time.sleep(min(espera, max(0.0, fim - time.monotonic())))
+
+
+class Resultados:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias = {}
+        self.erros = {}
+        self.status = {}
+        self.gravando = False
+
+    def registrar(self, operacao, duracao_ms, status, ok):
+        if not self.gravando:
+            return
+        with self.lock:
+            self.latencias.setdefault(operacao, []).append(duracao_ms)
+            self.status[str(status)] = self.status.get(str(status), 0) + 1
+            if not ok:
+                self.erros[operacao] = self.erros.get(operacao, 0) + 1
+
+    def resumo(self, duracao_s):
+        todas = [amostra for amostras in self.latencias.values() for amostra in amostras]
+        geral = resumir_latencias(todas, duracao_s)
+        geral["erros"] = sum(self.erros.values())
+        operacoes = {}
+        for operacao, amostras in sorted(self.latencias.items()):
+            operacoes[operacao] = resumir_latencias(amostras, duracao_s)
+            operacoes[operacao]["erros"] = self.erros.get(operacao, 0)
+        return {"geral": geral, "operacoes": operacoes, "status_http": dict(sorted(self.status.items()))}
+
+
+def executar_carga(criar_cliente, concorrencia, duracao_s, aquecimento_s, intervalo_s, semente):
+    resultados = Resultados()
+    usuarios = []
+    for i in range(concorrencia):
+        usuario = UsuarioVirtual(criar_cliente(), random.Random(semente + i), resultados)
+        usuario.entrar()
+        usuarios.append(usuario)
+
+    fim = time.monotonic() + aquecimento_s + duracao_s
+    threads = [threading.Thread(target=u.rodar, args=(fim, intervalo_s), daemon=True) for u in usuarios]
+    for thread in threads:
+        thread.start()
+    time.sleep(aquecimento_s)
+    resultados.gravando = True
+    inicio = time.monotonic()
+    for thread in threads:
+        thread.join()
+    resultados.gravando = False
+    return resultados.resumo(time.monotonic() - inicio)
+
+
+def aguardar_servidor(porta, processo, limite_s=60):
+    prazo = time.monotonic() + limite_s
+    while time.monotonic() < prazo:
+        if processo.poll() is not None:
+            raise click.ClickException(f"gunicorn terminou com código {processo.returncode}")
+        try:
+            conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=2)
+            conexao.request("GET", "/api/teste/conexao")
+            if conexao.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise click.ClickException("gunicorn não respondeu a tempo")
+
+
+def porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def aguardar_fila(app_ou_banco, smtp, limite_s):
+    # Espera os workers esvaziarem a fila criada pelas notificações da carga
+    import sqlite3
+
+    conn = sqlite3.connect(app_ou_banco, timeout=30)
+    try:
+        prazo = time.monotonic() + limite_s
+        while True:
+            pendentes = conn.execute("SELECT COUNT(*) FROM notificacao WHERE status = 'pendente'").fetchone()[0]
+            if pendentes == 0 or time.monotonic() >= prazo:
+                return {"mensagens_recebidas": smtp.mensagens, "pendentes_ao_fim": pendentes}
+            time.sleep(0.2)
+    finally:
+        conn.close()
+
+
+# ========== COMANDOS ==========
+@click.group()
+def cli():
+    """Massa de dados, carga e micro-benchmarks do CONTRATO+."""
+
+
+opcao_banco = click.option(
+    "--banco", default=BANCO_PADRAO, show_default=True, type=click.Path(dir_okay=False), help="Arquivo SQLite usado."
+)
+
+
+@cli.command("popular")
+@opcao_banco
+@click.option("--escala", default="10k", show_default=True, help="Contratos: 1k, 10k, 100k, 1m ou um número.")
+@click.option("--usuarios", type=int, help="Padrão: um usuário para cada 1000 contratos.")
+@click.option("--notificacoes-por-contrato", default=1.0, show_default=True)
+@click.option("--semente", default=42, show_default=True)
+@click.option("--saida", type=click.Path(dir_okay=False), help="Grava o JSON aqui em vez da saída padrão.")
+def comando_popular(banco, escala, usuarios, notificacoes_por_contrato, semente, saida):
+    """Recria o banco com usuários, contratos e notificações sintéticos."""
+    contratos = ler_escala(escala)
+    usuarios = usuarios or max(1, contratos // 1000)
+    os.makedirs(os.path.dirname(os.path.abspath(banco)), exist_ok=True)
+    app = importar_app(os.path.abspath(banco))
+
+    inicio = time.perf_counter()
+    popular_banco(app, contratos, usuarios, notificacoes_por_contrato, semente)
+    duracao = time.perf_counter() - inicio
+    emitir(
+        {
+            "comando": "popular",
+            "banco": banco,
+            "escala": contar_escala(banco),
+            "duracao_s": round(duracao, 2),
+            "tamanho_mib": round(os.path.getsize(banco) / 2**20, 1),
+        },
+        saida,
+    )
+
+
+@cli.command("carga")
+@opcao_banco
+@click.option("--modo", type=click.Choice(["cliente", "gunicorn"]), default="cliente", show_default=True)
+@click.option("--concorrencia", default=8, show_default=True, help="Usuários virtuais (uma thread cada).")
+@click.option("--duracao", default=30.0, show_default=True, help="Segundos medidos.")
+@click.option("--aquecimento", default=3.0, show_default=True, help="Segundos descartados no início.")
+@click.option(
+    "--intervalo",
+    default=0.0,
+    show_default=True,
+    help="Segundos entre ciclos de cada usuário virtual (5 = aba aberta do frontend; 0 = sem pausa).",
+)
+@click.option("--workers", default=2, show_default=True, help="Workers do gunicorn (--modo gunicorn).")
+@click.option("--worker-class", default="gevent", show_default=True, help="Tipo de worker do gunicorn.")
+@click.option("--email-workers", default=2, show_default=True, help="Workers da fila de emails por processo.")
+@click.option("--smtp-latencia-ms", default=0.0, show_default=True, help="Atraso do SMTP falso por mensagem.")
+@click.option("--semente", default=42, show_default=True)
+@click.option("--saida", type=click.Path(dir_okay=False), help="Grava o JSON aqui em vez da saída padrão.")
+def comando_carga(
+    banco,
+    modo,
+    concorrencia,
+    duracao,
+    aquecimento,
+    intervalo,
+    workers,
+    worker_class,
+    email_workers,
+    smtp_latencia_ms,
+    semente,
+    saida,
+):
+    """Reproduz o tráfego do frontend e mede latência, vazão e memória."""
+    banco = os.path.abspath(banco)
+    if not os.path.exists(banco):
+        raise click.ClickException(f"{banco} não existe; rode 'python benchmark.py popular' antes")
+
+    parametros = {
+        "modo": modo,
+        "concorrencia": concorrencia,
+        "duracao_s": duracao,
+        "aquecimento_s": aquecimento,
+        "intervalo_s": intervalo,
+        "email_workers": email_workers,
+        "smtp_latencia_ms": smtp_latencia_ms,
+        "semente": semente,
+    }
+    extra = {"EMAIL_WORKERS": str(email_workers)}
+
+    with ServidorSMTPFalso(smtp_latencia_ms) as smtp:
+        if modo == "cliente":
+            app = importar_app(banco, smtp.porta, extra)
+            app.iniciar_fila_email()
+            with MonitorMemoria(os.getpid()) as memoria:
+                carga = executar_carga(
+                    lambda: ClienteFlask(app), concorrencia, duracao, aquecimento, intervalo, semente
+                )
+        else:
+            parametros.update({"workers": workers, "worker_class": worker_class})
+            porta = porta_livre()
+            ambiente = dict(os.environ)
+            ambiente.update(configurar_ambiente(banco, smtp.porta, extra))
+            processo = subprocess.Popen(
+                [
+                    sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app",
+                    "--bind", f"127.0.0.1:{porta}", "--workers", str(workers), "--worker-class", worker_class,
+                ],
+                cwd=BASE_DIR,
+                env=ambiente,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                aguardar_servidor(porta, processo)
+                with MonitorMemoria(processo.pid) as memoria:
+                    carga = executar_carga(
+                        lambda: ClienteHTTP(porta), concorrencia, duracao, aquecimento, intervalo, semente
+                    )
+                    fila = aguardar_fila(banco, smtp, limite_s=30)
+            finally:
+                processo.send_signal(signal.SIGTERM)
+                try:
+                    processo.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    processo.kill()
+
+        if modo == "cliente":
+            fila = aguardar_fila(banco, smtp, limite_s=30)
+
+    emitir(
+        {
+            "comando": "carga",
+            "versao": versao_codigo(),
+            "data": datetime.utcnow().isoformat(timespec="seconds"),
+            "banco": banco,
+            "escala": contar_escala(banco),
+            "parametros": parametros,
+            **carga,
+            "rss": memoria.resumo(),
+            "smtp": fila,
+        },
+        saida,
+    )
+
+
+@cli.command("micro")
+@opcao_banco
+@click.option("--repeticoes", default=200, show_default=True)
+@click.option("--saida", type=click.Path(dir_okay=False), help="Grava o JSON aqui em vez da saída padrão.")
+def comando_micro(banco, repeticoes, saida):
+    """Mede funções e endpoints isolados, numa thread, sobre o banco populado."""
+    banco = os.path.abspath(banco)
+    if not os.path.exists(banco):
+        raise click.ClickException(f"{banco} não existe; rode 'python benchmark.py popular' antes")
+    app = importar_app(banco, extra={"EMAIL_WORKERS": "0"})
+
+    cliente = app.app.test_client()
+    cliente.post("/api/auth/admin-login", json={"senha": SENHA_ADMIN})
+
+    conn = app.abrir_conexao()
+    usuario_id = conn.execute("SELECT id FROM usuario WHERE email = ?", ("admin@contratomais.com",)).fetchone()[0]
+    itens = [
+        (
+            {"tipo": notificacao["tipo"], "assunto": notificacao["assunto"], "mensagem": notificacao["mensagem"]},
+            dict(contrato),
+        )
+        for notificacao, contrato in (
+            (linha, conn.execute("SELECT * FROM contrato WHERE id = ?", (linha["contrato_id"],)).fetchone())
+            for linha in conn.execute("SELECT * FROM notificacao ORDER BY id LIMIT 100").fetchall()
+        )
+        if contrato is not None
+    ]
+
+    def endpoint(caminho):
+        return lambda: cliente.get(caminho).get_data()
+
+    casos = {
+        "GET /api/contratos": endpoint("/api/contratos"),
+        "GET /api/contratos?limit=50": endpoint("/api/contratos?limit=50"),
+        "GET /api/contratos/search": endpoint(f"/api/contratos/search?q={PALAVRAS[0][:4]}"),
+        "GET /api/dashboard/stats": endpoint("/api/dashboard/stats"),
+        "GET /api/notificacoes?limit=30": endpoint("/api/notificacoes?limit=30"),
+        "calcular_stats_dashboard": lambda: app.calcular_stats_dashboard(conn, usuario_id),
+        "montar_emails_lote (100)": lambda: app.montar_emails_lote(itens),
+        "normalizar_data": lambda: app.normalizar_data("2025-03-01T10:30"),
+    }
+
+    resultados = {}
+    with MonitorMemoria(os.getpid()) as memoria:
+        for nome, funcao in casos.items():
+            with app.app.app_context():
+                funcao()  # aquecimento (caches, páginas do SQLite)
+                amostras = []
+                for _ in range(repeticoes):
+                    inicio = time.perf_counter()
+                    funcao()
+                    amostras.append((time.perf_counter() - inicio) * 1000)
+            resultados[nome] = resumir_latencias(amostras, sum(amostras) / 1000)
+    conn.close()
+
+    emitir(
+        {
+            "comando": "micro",
+            "versao": versao_codigo(),
+            "data": datetime.utcnow().isoformat(timespec="seconds"),
+            "banco": banco,
+            "escala": contar_escala(banco),
+            "repeticoes": repeticoes,
+            "casos": resultados,
+            "rss": memoria.resumo(),
+        },
+        saida,
+    )
+
+
+@cli.command("comparar")
+@click.argument("antes", type=click.File())
+@click.argument("depois", type=click.File())
+def comando_comparar(antes, depois):
+    """Diferença de p50/p95/p99 e vazão entre dois resultados (carga ou micro)."""
+    antes, depois = json.load(antes), json.load(depois)
+    chave = "casos" if "casos" in depois else "operacoes"
+    linhas_antes = dict(antes.get(chave, {}))
+    linhas_depois = dict(depois.get(chave, {}))
+    if chave == "operacoes":
+        linhas_antes["(geral)"] = antes["geral"]
+        linhas_depois["(geral)"] = depois["geral"]
+
+    click.echo(f"{'':32} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18} {'req/s':>18}")
+    for nome in sorted(set(linhas_antes) & set(linhas_depois)):
+        a, d = linhas_antes[nome], linhas_depois[nome]
+        colunas = []
+        for campo in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if a.get(campo) and d.get(campo) is not None:
+                variacao = (d[campo] - a[campo]) / a[campo] * 100
+                colunas.append(f"{d[campo]:>10.2f} {variacao:+6.1f}%")
+            else:
+                colunas.append(f"{'-':>18}")
+        click.echo(f"{nome[:32]:32} " + " ".join(colunas))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,63 @@
+# Configuração do gunicorn: gunicorn app:app
+#
+# O worker gevent atende cada conexão com uma greenlet, então milhares de
+# streams SSE ociosos (/api/stream) não prendem uma thread cada. Para usar
+# outro tipo de worker, defina GUNICORN_WORKER_CLASS (ex.: gthread).
+#
+# O sqlite3 não coopera com o gevent: uma consulta esperando lock (até o
+# busy_timeout, 30 s) pararia o worker inteiro. Sob gevent o app manda cada
+# chamada ao SQLite para o threadpool do hub (_sqlite_bloqueante), com até
+# SQLITE_THREADS_GEVENT threads por worker; o custo é uma troca de thread
+# por chamada, e com todas ocupadas as demais consultas esperam vez. Com o
+# motor PostgreSQL isso não é preciso: o psycopg detecta o monkey-patch do
+# gevent e espera o socket pelo hub.
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 4000))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))  # só usado pelo gthread
+timeout = 60
+keepalive = 5
+
+
+def _migrar():
+    # Em outro processo: o master nunca importa o app, senão os workers
+    # criados depois de um HUP herdariam o módulo já carregado (código e
+    # assets de antes do deploy)
+    subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "app", "migrar"],
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+def on_starting(server):
+    # migra o banco uma vez antes de subir os workers; se falhar, o
+    # gunicorn não sobe
+    _migrar()
+
+
+def on_reload(server):
+    # HUP (deploy sem parar o serviço): aplica as migrações do código novo
+    # antes de trocar os workers. Se falhar, os workers novos sobem assim
+    # mesmo (derrubar o master tiraria o serviço do ar); o erro fica no log.
+    try:
+        _migrar()
+    except subprocess.CalledProcessError as e:
+        server.log.error(f"Migração falhou no reload: {e}")
+
+
+def post_worker_init(worker):
+    # sobe os workers da fila de emails em cada processo, para drenar o que
+    # ficou pendente mesmo antes da primeira notificação nova, e os jobs que
+    # mantêm os contadores do dashboard em dia e arquivam o histórico antigo
+    from app import iniciar_atualizador_estatisticas, iniciar_fila_email, iniciar_retencao
+
+    iniciar_fila_email()
+    iniciar_atualizador_estatisticas()
+    iniciar_retencao()
@@ -0,0 +1,31 @@
+import os
+import queue
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# a fila de emails não sobe sozinha nos testes; quem precisa dela a inicia
+os.environ.setdefault("EMAIL_WORKERS", "0")
+
+
+@pytest.fixture
+def mod(tmp_path, monkeypatch):
+    import app as m
+
+    monkeypatch.setattr(m, "DATABASE", str(tmp_path / "contratos.db"))
+    m._pool_conexoes = queue.LifoQueue()
+    m._pool_leitura = queue.LifoQueue()
+    m._cache_stats.clear()
+    m.migrar_banco()
+    m.app.config["TESTING"] = True
+    return m
+
+
+@pytest.fixture
+def client(mod):
+    c = mod.app.test_client()
+    r = c.post("/api/auth/admin-login", json={"senha": "admin123"})
+    assert r.status_code == 200
+    return c
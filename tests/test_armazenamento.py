@@ -0,0 +1,176 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+# Banco de teste: CONTRATOS_POSTGRES_URL_TESTE, ou um servidor local do
+# pgserver; sem nenhum dos dois os testes do motor PostgreSQL são pulados
+pytest.importorskip("psycopg")
+
+
+@pytest.fixture(scope="module")
+def url_postgres(tmp_path_factory):
+    url = os.environ.get("CONTRATOS_POSTGRES_URL_TESTE")
+    if url:
+        yield url
+        return
+    pgserver = pytest.importorskip("pgserver")
+    servidor = pgserver.get_server(str(tmp_path_factory.mktemp("pg")), cleanup_mode="stop")
+    servidor.psql("CREATE DATABASE contratos_teste;")
+    yield servidor.get_uri("contratos_teste")
+    servidor.cleanup()
+
+
+@pytest.fixture
+def pg(mod, url_postgres, monkeypatch):
+    # o app inteiro sobre o PostgreSQL, como com CONTRATOS_POSTGRES_URL
+    motor = mod.MotorPostgres(url_postgres, pool_min=1, pool_max=4)
+    motor.resetar()
+    monkeypatch.setattr(mod, "motor", motor)
+    monkeypatch.setattr(mod, "repo_usuarios", mod.RepositorioUsuarios(motor))
+    monkeypatch.setattr(mod, "repo_contratos", mod.RepositorioContratos(motor))
+    monkeypatch.setattr(mod, "repo_notificacoes", mod.RepositorioNotificacoes(motor))
+    yield motor
+    motor.fechar()
+
+
+def _cenario(mod, motor):
+    contratos, notificacoes = mod.RepositorioContratos(motor), mod.RepositorioNotificacoes(motor)
+    saida = {}
+    with motor.conexao() as conn:
+        u = mod.RepositorioUsuarios(motor).por_email(conn, "admin@contratomais.com")["id"]
+        ids = []
+        for nome, status, fim in (
+            ("Alfa", "ativo", "2030-01-10T10:00:00"),
+            ("alfinete", "pendente", "2031-05-01T00:00:00"),
+            ("Beta_1", "ativo", "2029-03-03T12:00:00"),
+            ("100% certo", "concluido", "2028-01-01T00:00:00"),
+        ):
+            ids.append(contratos.inserir(conn, u, nome, "d", "2026-01-01T00:00:00", fim, status)[0]["id"])
+        contratos.inserir_lote(
+            conn, u, [(f"Lote {i}", "", "2026-01-01T00:00:00", "2027-01-01T00:00:00", "ativo") for i in range(5)]
+        )
+        saida["atualizado"] = dict(contratos.atualizar(conn, u, ids[2], {"status": "inativo", "nome": "Beta_2"})[0])
+        assert contratos.atualizar(conn, u, 99999, {"nome": "x"}) == (None, None)
+        conn.commit()
+
+        def nomes(**filtros):
+            return sorted(json.loads(j)["nome"] for j, _, _ in contratos.listar(conn, u, ("nome",), **filtros))
+
+        saida["totais"] = contratos.totais_por_status(conn, u)
+        saida["lista"] = sorted(
+            tuple(json.loads(j).values()) for j, _, _ in contratos.listar(conn, u, ("nome", "dias_restantes"))
+        )
+        saida["prefixos"] = (nomes(nome="ALF"), nomes(nome="100%"), nomes(nome="Beta_"))
+        saida["janela"] = nomes(
+            vence_de="2029-01-01T00:00:00", vence_ate="2030-01-10T10:00:00", vence_ate_inclusivo=False
+        )
+        saida["busca"] = [json.loads(j)["nome"] for j, in contratos.buscar(conn, u, ["alf"], ("nome",), 10)]
+
+        notificacoes.enfileirar(conn, u, ids[0], "aviso", "Assunto", "Msg", ["a@x.com", "b@x.com"])
+        inseridas, _ = notificacoes.enfileirar_lote(
+            conn, u, "urgente", "Lote", None, "Contrato {nome} vence", ["c@x.com"], contrato_ids=[ids[1], ids[3], 99999]
+        )
+        saida["lote"] = sorted(n["contrato_id"] for n in inseridas) == sorted([ids[1], ids[3]])
+        conn.commit()
+        saida["notificacoes"] = sorted(
+            (n["contrato_nome"], n["tipo"], n["mensagem"], n["email_destino"])
+            for n in (json.loads(j) for j, _, _ in notificacoes.listar(conn, u))
+        )
+        assert contratos.excluir(conn, u, ids[3]) is not None
+        conn.commit()
+        saida["apos_excluir"] = (contratos.totais_por_status(conn, u)["total"], notificacoes.totais_por_status(conn, u))
+    blocos = contratos.exportar(u, "ativo")
+    saida["exportar"] = (next(blocos), sorted(linha[1] for bloco in blocos for linha in bloco))
+    return saida
+
+
+def test_repositorios_iguais_nos_dois_motores(mod, pg):
+    no_postgres = _cenario(mod, pg)
+    pg.criar_schema()  # idempotente
+    assert no_postgres == _cenario(mod, mod.MotorSQLite())
+    assert no_postgres["prefixos"] == (["Alfa", "alfinete"], ["100% certo"], ["Beta_2"])
+    assert no_postgres["busca"] == ["Alfa", "alfinete"]
+
+
+def test_app_inteiro_no_postgres(pg, client, mod, monkeypatch):
+    assert client.post("/api/auth/admin-login", json={"senha": "admin123"}).status_code == 200
+    vence = (datetime.utcnow() + timedelta(days=7)).strftime("%Y-%m-%d")
+    r = client.post(
+        "/api/contratos",
+        json={"nome": "Manutenção predial", "descricao": "Elevadores", "data_inicio": "2026-01-01", "data_fim": vence},
+    )
+    assert r.json["success"], r.json
+    contrato_id = r.json["contrato"]["id"]
+    corpo = "nome,descricao,data_inicio,data_fim\n" + "".join(f"Limpeza {i},,2026-01-01,2030-01-01\n" for i in range(3))
+    assert client.post("/api/contratos/bulk", data=corpo, content_type="text/csv").json["importados"] == 3
+    assert client.put(f"/api/contratos/{contrato_id}", json={"descricao": "Elevadores e portões"}).status_code == 200
+
+    busca = client.get("/api/contratos/search?q=manutencao elev").json
+    assert [c["nome"] for c in busca["contratos"]] == ["Manutenção predial"]
+    assert [c["nome"] for c in client.get("/api/contratos/search?q=portoes").json["contratos"]] == [
+        "Manutenção predial"
+    ]
+
+    r = client.get("/api/dashboard/stats")
+    assert r.json["stats"]["total_contratos"] == 4 and r.json["stats"]["contratos_vencendo_7dias"] == 1, r.json
+    assert client.get("/api/dashboard/stats", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+    enviados = []
+    monkeypatch.setattr(
+        mod, "enviar_emails_lote", lambda mensagens: enviados.extend(mensagens) or [None] * len(mensagens)
+    )
+    r = client.post(
+        "/api/notificacoes/batch", json={"tipo": "aviso", "emails": "a@x.com", "filtro": {"status": "ativo"}}
+    )
+    assert r.json["enfileiradas"] == 4
+    with pg.conexao() as conn:
+        assert mod.gerar_lembretes(conn) == {"lembrete_diario": 0, "lembrete_semanal": 1, "lembrete_mensal": 0}
+        assert mod.gerar_lembretes(conn)["lembrete_semanal"] == 0
+        assert mod.drenar_fila_email(conn) == 5
+        assert mod.atualizar_estatisticas(conn, datetime.utcnow() + timedelta(days=8)) == 1
+        conn.execute("UPDATE notificacao SET criado_em = '2000-01-01 00:00:00'")
+        conn.commit()
+        assert mod.arquivar_notificacoes(conn) == 5
+        pg.compactar(conn)
+    assert client.get("/api/dashboard/stats").json["stats"]["contratos_vencidos"] == 1
+    assert len(enviados) == 5
+
+    exportado = client.get("/api/contratos/export?formato=csv").get_data(as_text=True).splitlines()
+    assert len(exportado) == 5 and exportado[0].lstrip("\ufeff").startswith("id,nome")
+    assert client.delete(f"/api/contratos/{contrato_id}").status_code == 200
+    assert client.post("/api/system/reset", json={"code": mod.RESET_CODE}).status_code == 200
+    with pg.conexao() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM contrato").fetchone()[0] == 0
+
+
+def test_fila_com_um_dono_por_cluster(pg, mod, url_postgres):
+    outro_no = mod.MotorPostgres(url_postgres, pool_min=1, pool_max=1)
+    dono = pg.tentar_trava("fila_email")
+    assert dono is not None and outro_no.tentar_trava("fila_email") is None
+    dono.close()
+    assert outro_no.tentar_trava("fila_email") is not None
+
+    agora = "2000-01-01T00:00:00"
+    with pg.conexao() as conn:
+        u = mod.repo_usuarios.por_email(conn, "admin@contratomais.com")["id"]
+        contrato = mod.repo_contratos.inserir(conn, u, "C", "", "2026-01-01T00:00:00", "2027-01-01T00:00:00", "ativo")[
+            0
+        ]
+        for i in range(4):
+            mod.repo_notificacoes.enfileirar(conn, u, contrato["id"], "aviso", "A", "M", [f"{i}@x.com"])
+        conn.execute("UPDATE notificacao SET proxima_tentativa = ?", (agora,))
+
+    # um nó com duas notificações presas na transação dele: o outro reserva
+    # as demais sem esperar
+    ocupado, livre = outro_no.abrir(), pg.abrir()
+    try:
+        ocupado.execute("BEGIN")
+        presas = {row["id"] for row in ocupado.execute("SELECT id FROM notificacao ORDER BY id LIMIT 2 FOR UPDATE")}
+        reservadas = {n["id"] for n in mod._reservar_notificacoes(livre)}
+        assert len(reservadas) == 2 and not reservadas & presas
+    finally:
+        ocupado.close()
+        livre.close()
+        outro_no.fechar()
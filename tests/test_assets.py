@@ -0,0 +1,31 @@
+import subprocess
+import sys
+
+from conftest import RAIZ
+
+
+def test_etag_compara_a_variante_exata(client):
+    r = client.get("/contratos.html", headers={"Accept-Encoding": "br, gzip"})
+    br = r.headers["ETag"]
+    gz = client.get("/contratos.html", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    assert br.endswith('-br"') and gz.endswith('-gzip"') and br != gz
+
+    def status(if_none_match, encoding="gzip"):
+        headers = {"Accept-Encoding": encoding, "If-None-Match": if_none_match}
+        return client.get("/contratos.html", headers=headers).status_code
+
+    assert status(gz) == 304
+    assert status(f'"outro", W/{gz}') == 304
+    assert status("*") == 304
+    # mesmo hash com outra codificação, prefixo ou o hash solto não bastam
+    assert status(br) == 200
+    assert status(gz[:-2] + '"') == 200
+    assert status(gz.split("-")[0] + '"') == 200
+
+
+def test_assets_montados_no_primeiro_request():
+    codigo = "import app; print(app._assets is None); app.obter_assets(); print(app._assets is not None)"
+    saida = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True
+    ).stdout.split()
+    assert saida == ["True", "True"]
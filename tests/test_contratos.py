@@ -0,0 +1,42 @@
+import json
+
+
+def test_post_e_importacao_validam_igual(client):
+    casos = [
+        ({"nome": "Mesmo dia", "data_inicio": "2026-01-01", "data_fim": "2026-01-01"}, None),
+        ({"nome": "Fim antes", "data_inicio": "2026-01-01", "data_fim": "2025-01-01"}, None),
+        ({"nome": "  ", "data_inicio": "2026-01-01", "data_fim": "2027-01-01"}, "Campo nome é obrigatório"),
+        ({"nome": "Data", "data_inicio": "ontem", "data_fim": "2027-01-01"}, "Data inválida: ontem"),
+        ({"nome": "Status", "data_inicio": "2026-01-01", "data_fim": "2027-01-01", "status": "x"}, "Status inválido: x"),
+    ]
+    for dados, erro in casos:
+        r = client.post("/api/contratos", json=dados)
+        assert (r.json["message"] if r.status_code == 400 else None) == erro, dados
+
+    corpo = "\n".join(json.dumps(dados) for dados, _ in casos)
+    r = client.post("/api/contratos/bulk?formato=jsonl", data=corpo).json
+    assert r["importados"] == 2
+    assert r["erros"] == [{"linha": i, "erro": erro} for i, (_, erro) in enumerate(casos, 1) if erro]
+
+    r = client.get("/api/contratos?totais=1").json
+    assert r["totais"]["total"] == 4
+    contrato_id = r["contratos"][0]["id"]
+    assert client.put(f"/api/contratos/{contrato_id}", json={"status": "x"}).json["message"] == "Status inválido: x"
+    assert client.put(f"/api/contratos/{contrato_id}", json={"status": "concluido"}).status_code == 200
+
+
+def test_importacao_grava_pelo_escritor(client, mod, monkeypatch):
+    monkeypatch.setitem(mod.IMPORTACAO_CONFIG, "lote", 3)
+    chamadas = []
+    executar_escrita = mod.executar_escrita
+
+    def contar(funcao, *args):
+        chamadas.append((funcao.__name__, len(args[1])))
+        return executar_escrita(funcao, *args)
+
+    monkeypatch.setattr(mod, "executar_escrita", contar)
+    corpo = "nome,data_inicio,data_fim\n" + "".join(f"C{i},2026-01-01,2027-01-01\n" for i in range(7))
+    r = client.post("/api/contratos/bulk", data=corpo, content_type="text/csv").json
+    assert r["importados"] == 7 and r["rejeitados"] == 0
+    assert chamadas == [("inserir_lote", 3), ("inserir_lote", 3), ("inserir_lote", 1)]
+    assert client.get("/api/contratos?totais=1").json["totais"]["por_status"] == {"ativo": 7}
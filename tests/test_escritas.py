@@ -0,0 +1,141 @@
+import threading
+import time
+
+
+def _inserir(conn, tarefa):
+    conn.execute("INSERT INTO manutencao (tarefa, executada_em) VALUES (?, 'x')", (tarefa,))
+    return tarefa
+
+
+def _falhar(conn, tarefa):
+    conn.execute("INSERT INTO manutencao (tarefa, executada_em) VALUES (?, 'x')", (tarefa,))
+    raise ValueError(f"falhou {tarefa}")
+
+
+def _tarefas(mod, padrao="%"):
+    conn = mod.abrir_conexao()
+    try:
+        return sorted(r[0] for r in conn.execute("SELECT tarefa FROM manutencao WHERE tarefa LIKE ?", (padrao,)))
+    finally:
+        conn.close()
+
+
+def _em_threads(alvo, argumentos):
+    resultados = {}
+
+    def rodar(arg):
+        try:
+            resultados[arg] = alvo(arg)
+        except Exception as e:
+            resultados[arg] = e
+
+    threads = [threading.Thread(target=rodar, args=(arg,)) for arg in argumentos]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultados
+
+
+def _segurar_escritor(mod):
+    # ocupa o escritor com uma escrita que espera o evento; o que chegar
+    # nesse meio tempo vai junto no lote seguinte
+    liberar = threading.Event()
+    comecou = threading.Event()
+    resultado = {}
+
+    def esperar(conn):
+        comecou.set()
+        liberar.wait(5)
+        return _inserir(conn, "segurando")
+
+    def rodar():
+        try:
+            resultado["valor"] = mod.executar_escrita(esperar)
+        except Exception as e:
+            resultado["valor"] = e
+
+    thread = threading.Thread(target=rodar)
+    thread.start()
+    assert comecou.wait(5)
+    thread.resultado = resultado
+    return liberar, thread
+
+
+def test_escritas_concorrentes(mod, monkeypatch):
+    lotes = []
+    gravar_lote = mod._gravar_lote
+
+    def registrar(conn, lote):
+        lotes.append(len(lote))
+        return gravar_lote(conn, lote)
+
+    monkeypatch.setattr(mod, "_gravar_lote", registrar)
+    resultados = _em_threads(lambda i: mod.executar_escrita(_inserir, f"t{i:03d}"), range(200))
+    assert resultados == {i: f"t{i:03d}" for i in range(200)}
+    assert _tarefas(mod, "t%") == [f"t{i:03d}" for i in range(200)]
+    assert sum(lotes) == 200 and max(lotes) <= mod.ESCRITA_CONFIG["lote_max"]
+
+
+def test_erro_de_uma_escrita_nao_derruba_o_lote(mod, monkeypatch):
+    lotes = []
+    gravar_lote = mod._gravar_lote
+
+    def registrar(conn, lote):
+        lotes.append(len(lote))
+        return gravar_lote(conn, lote)
+
+    monkeypatch.setattr(mod, "_gravar_lote", registrar)
+    liberar, segurando = _segurar_escritor(mod)
+    try:
+        threads = []
+        resultados = {}
+
+        def escrever(i):
+            funcao = _falhar if i % 3 == 0 else _inserir
+            try:
+                resultados[i] = mod.executar_escrita(funcao, f"e{i:02d}")
+            except ValueError as e:
+                resultados[i] = e
+
+        for i in range(12):
+            threads.append(threading.Thread(target=escrever, args=(i,)))
+            threads[-1].start()
+        limite = time.monotonic() + 5
+        while mod._escritas.qsize() < 12 and time.monotonic() < limite:
+            time.sleep(0.01)
+    finally:
+        liberar.set()
+    segurando.join()
+    for thread in threads:
+        thread.join()
+
+    assert lotes == [1, 12]  # as 12 gravadas numa só transação
+    for i in range(12):
+        if i % 3 == 0:
+            assert isinstance(resultados[i], ValueError) and str(resultados[i]) == f"falhou e{i:02d}"
+        else:
+            assert resultados[i] == f"e{i:02d}"
+    # o savepoint desfez só o INSERT das que falharam
+    assert _tarefas(mod, "e%") == [f"e{i:02d}" for i in range(12) if i % 3]
+
+
+def test_cancelada_na_fila_nao_grava(mod, monkeypatch):
+    monkeypatch.setitem(mod.DB_CONFIG, "timeout", 0.1)
+    liberar, segurando = _segurar_escritor(mod)
+    try:
+        inicio = time.monotonic()
+        try:
+            mod.executar_escrita(_inserir, "cancelada")
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("a escrita deveria ter vencido na fila")
+        assert time.monotonic() - inicio < 1
+    finally:
+        liberar.set()
+    # a que já estava gravando não é abandonada: espera o commit
+    segurando.join()
+    assert segurando.resultado["valor"] == "segurando"
+    assert mod.executar_escrita(_inserir, "depois") == "depois"
+    assert _tarefas(mod) == ["depois", "segurando"]
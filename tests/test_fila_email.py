@@ -0,0 +1,118 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+from conftest import RAIZ
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="a trava da fila usa fcntl.flock")
+
+# Processo do gunicorn de mentira: sobe a fila com 1 worker, troca o envio
+# SMTP por uma linha "pid destinatário" no arquivo de saída e diz se ficou
+# com a trava. Roda até o teste fechar o stdin.
+_PROCESSO = textwrap.dedent(
+    """
+    import os, sys, threading, time
+    import app
+
+    app.FILA_EMAIL_CONFIG["intervalo_s"] = float(sys.argv[2])
+
+    def enviar(mensagens):
+        with open(sys.argv[1], "a") as saida:
+            for mensagem in mensagens:
+                saida.write(f"{os.getpid()} {mensagem['To']}\\n")
+        return [None] * len(mensagens)
+
+    app.enviar_emails_lote = enviar
+    app.iniciar_fila_email(workers=1)
+    time.sleep(0.5)
+    dono = any(t.name == "fila-email-0" for t in threading.enumerate())
+    print(os.getpid(), dono, flush=True)
+    sys.stdin.read()
+    """
+)
+
+
+def _subir_processos(mod, tmp_path, quantidade, intervalo_s):
+    env = dict(os.environ, CONTRATOS_DB=mod.DATABASE, EMAIL_WORKERS="1", PYTHONPATH=RAIZ)
+    saida = tmp_path / "enviados.txt"
+    processos = [
+        subprocess.Popen(
+            [sys.executable, "-c", _PROCESSO, str(saida), str(intervalo_s)],
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        for _ in range(quantidade)
+    ]
+    donos = {}
+    for processo in processos:
+        pid, dono = processo.stdout.readline().split()
+        donos[int(pid)] = dono == "True"
+    return processos, donos, saida
+
+
+def _encerrar(processos):
+    for processo in processos:
+        processo.stdin.close()
+        processo.wait(timeout=10)
+
+
+def _enfileirar(client, emails):
+    r = client.post(
+        "/api/contratos", json={"nome": "Fila", "data_inicio": "2026-01-01", "data_fim": "2027-01-01"}
+    )
+    contrato_id = r.json["contrato"]["id"]
+    for email in emails:
+        r = client.post(f"/api/contratos/{contrato_id}/notificar", json={"emails": email, "tipo": "aviso"})
+        assert r.status_code == 202, r.json
+
+
+def _esperar_envios(mod, total, prazo_s):
+    conn = mod.abrir_conexao()
+    try:
+        limite = time.monotonic() + prazo_s
+        while time.monotonic() < limite:
+            enviadas = conn.execute("SELECT COUNT(*) FROM notificacao WHERE status = 'enviado'").fetchone()[0]
+            if enviadas == total:
+                return True
+            time.sleep(0.05)
+        return False
+    finally:
+        conn.close()
+
+
+def test_so_o_dono_da_trava_drena_a_fila(client, mod, tmp_path):
+    processos, donos, saida = _subir_processos(mod, tmp_path, 3, intervalo_s=0.5)
+    try:
+        assert sorted(donos.values()) == [False, False, True]
+        emails = [f"destino{i}@exemplo.com" for i in range(8)]
+        _enfileirar(client, emails)
+        assert _esperar_envios(mod, len(emails), prazo_s=10)
+    finally:
+        _encerrar(processos)
+
+    envios = [linha.split() for linha in saida.read_text().splitlines()]
+    dono = next(pid for pid, e_dono in donos.items() if e_dono)
+    assert {int(pid) for pid, _ in envios} == {dono}
+    assert sorted(email for _, email in envios) == sorted(emails)
+
+
+def test_aviso_de_outro_processo_espera_a_volta_do_dono(client, mod, tmp_path):
+    # avisar_fila_email só acorda os workers do próprio processo: gravada
+    # num processo sem a trava (este, com EMAIL_WORKERS=0), a notificação sai
+    # na próxima volta do dono, em até FILA_EMAIL_CONFIG["intervalo_s"]
+    intervalo_s = 1.5
+    processos, donos, _ = _subir_processos(mod, tmp_path, 1, intervalo_s=intervalo_s)
+    try:
+        assert list(donos.values()) == [True]
+        inicio = time.monotonic()
+        _enfileirar(client, ["atraso@exemplo.com"])
+        assert _esperar_envios(mod, 1, prazo_s=intervalo_s + 2)
+        assert time.monotonic() - inicio <= intervalo_s + 1
+    finally:
+        _encerrar(processos)
@@ -0,0 +1,29 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+pytest.importorskip("orjson")
+
+DADOS = {"b": 1, "a": {"z": [1, 2], "c": "Ação"}, "data": datetime(2026, 1, 2, 3, 4, 5), "valor": Decimal("1.50")}
+
+
+def test_orjson_segue_as_opcoes_do_provider(mod, monkeypatch):
+    padrao = DefaultJSONProvider(mod.app)
+    provider = mod.app.json
+    assert isinstance(provider, mod.JSONProviderOrjson)
+
+    saida = provider.dumps(DADOS)
+    assert json.loads(saida) == json.loads(padrao.dumps(DADOS))
+    assert saida == '{"a":{"c":"Ação","z":[1,2]},"b":1,"data":"Fri, 02 Jan 2026 03:04:05 GMT","valor":"1.50"}'
+
+    monkeypatch.setattr(provider, "sort_keys", False)
+    assert list(json.loads(provider.dumps(DADOS))) == ["b", "a", "data", "valor"]
+    assert list(json.loads(provider.dumps(DADOS, sort_keys=True))) == ["a", "b", "data", "valor"]
+
+    monkeypatch.setattr(provider, "compact", False)
+    with mod.app.app_context():
+        corpo = provider.response(DADOS).get_data(as_text=True)
+    assert corpo.startswith('{\n  "b": 1,') and json.loads(corpo) == json.loads(saida)
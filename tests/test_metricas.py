@@ -0,0 +1,33 @@
+import logging
+
+
+def test_metrics_fechado_sem_token(client, mod, monkeypatch):
+    monkeypatch.setitem(mod.METRICAS_CONFIG, "token", None)
+    assert client.get("/metrics").status_code == 403
+
+    monkeypatch.setitem(mod.METRICAS_CONFIG, "token", "segredo")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer outro"}).status_code == 401
+    client.get("/api/contratos")
+    r = client.get("/metrics", headers={"Authorization": "Bearer segredo"})
+    assert r.status_code == 200
+    texto = r.get_data(as_text=True)
+    assert 'contratomais_http_requisicoes_total{metodo="GET",rota="/api/contratos",status="200"}' in texto
+    assert "contratomais_fila_email_pendentes 0" in texto
+
+
+def test_plano_da_consulta_lenta_passa_pelo_offload(client, mod, monkeypatch, caplog):
+    chamadas = []
+    bloqueante = mod._sqlite_bloqueante
+
+    def registrar(funcao, *args):
+        chamadas.append(getattr(funcao, "__name__", ""))
+        return bloqueante(funcao, *args)
+
+    monkeypatch.setattr(mod, "_sqlite_bloqueante", registrar)
+    monkeypatch.setitem(mod.METRICAS_CONFIG, "consulta_lenta_ms", 0.0001)
+    with caplog.at_level(logging.WARNING, logger="app"):
+        assert client.get("/api/contratos").status_code == 200
+    assert "_explicar" in chamadas
+    lentas = [r.message for r in caplog.records if r.message.startswith("Consulta lenta")]
+    assert lentas and any("SEARCH" in m or "SCAN" in m for m in lentas)
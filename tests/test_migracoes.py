@@ -0,0 +1,107 @@
+import random
+import threading
+
+
+def test_preencher_em_lotes_usa_keyset(mod, monkeypatch):
+    monkeypatch.setitem(mod.MIGRACAO_CONFIG, "lote", 10)
+    monkeypatch.setitem(mod.MIGRACAO_CONFIG, "pausa_s", 0)
+    conn = mod.abrir_conexao()
+    conn.execute("CREATE TABLE esparsa (id INTEGER PRIMARY KEY, valor INTEGER)")
+    # 25 linhas espalhadas por 10 milhões de rowids
+    conn.executemany("INSERT INTO esparsa (id, valor) VALUES (?, 0)", [(i * 400_000,) for i in range(25)])
+    conn.commit()
+
+    transacoes = []
+    begin = conn.execute
+
+    def contar(sql, *args):
+        if sql == "BEGIN IMMEDIATE":
+            transacoes.append(sql)
+        return begin(sql, *args)
+
+    conn.execute = contar
+    assert mod.preencher_em_lotes(conn, "esparsa", "valor = 1", "valor = 0") == 25
+    assert len(transacoes) == 4  # 10 + 10 + 5 e a que vê que acabou
+    assert conn.execute("SELECT COUNT(*) FROM esparsa WHERE valor = 1").fetchone()[0] == 25
+
+
+def test_contadores_e_busca_semeados_com_escritas_concorrentes(tmp_path, mod, monkeypatch):
+    migracoes = mod.MIGRACOES
+    monkeypatch.setattr(mod, "DATABASE", str(tmp_path / "versao5.db"))
+    monkeypatch.setattr(mod, "MIGRACOES", migracoes[:5])
+    mod.migrar_banco()
+    # banco parado na versão 5, com contratos, como antes do deploy
+    conn = mod.abrir_conexao()
+    usuario_id = conn.execute("SELECT id FROM usuario").fetchone()[0]
+    registros = [
+        (f"contrato {i} licitação", "desc", "2026-01-01T00:00:00", f"20{26 + i % 4}-06-01T00:00:00",
+         random.choice(["ativo", "pendente", "inativo"]), usuario_id)
+        for i in range(3000)
+    ]
+    conn.executemany(
+        "INSERT INTO contrato (nome, descricao, data_inicio, data_fim, status, usuario_id) VALUES (?, ?, ?, ?, ?, ?)",
+        registros,
+    )
+    conn.execute("DELETE FROM contrato WHERE id % 7 = 0")  # ids esparsos
+    conn.commit()
+    monkeypatch.setattr(mod, "MIGRACOES", migracoes)
+    monkeypatch.setitem(mod.MIGRACAO_CONFIG, "lote", 100)
+    monkeypatch.setitem(mod.MIGRACAO_CONFIG, "pausa_s", 0.002)
+
+    parar = threading.Event()
+    escritas = []
+
+    def escrever():
+        escritor = mod.abrir_conexao()
+        aleatorio = random.Random(7)
+        while not parar.is_set():
+            escritor.execute("BEGIN IMMEDIATE")
+            maximo = escritor.execute("SELECT MAX(id) FROM contrato").fetchone()[0]
+            alvo = aleatorio.randint(1, maximo)
+            operacao = aleatorio.choice(["inserir", "atualizar", "excluir"])
+            if operacao == "inserir":
+                escritor.execute(
+                    "INSERT INTO contrato (nome, descricao, data_inicio, data_fim, status, usuario_id) "
+                    "VALUES ('novo licitação', '', '2026-01-01T00:00:00', '2027-01-01T00:00:00', 'ativo', ?)",
+                    (usuario_id,),
+                )
+            elif operacao == "atualizar":
+                escritor.execute(
+                    "UPDATE contrato SET status = ?, nome = ?, data_fim = '2026-12-01T00:00:00' WHERE id = ?",
+                    (aleatorio.choice(["ativo", "concluido"]), f"trocado {alvo}", alvo),
+                )
+            else:
+                escritor.execute("DELETE FROM contrato WHERE id = ?", (alvo,))
+            escritor.commit()
+            escritas.append(operacao)
+        escritor.close()
+
+    thread = threading.Thread(target=escrever)
+    thread.start()
+    try:
+        assert mod.migrar_banco() == [6, 7, 8, 9]
+    finally:
+        parar.set()
+        thread.join()
+    assert len(escritas) > 50
+
+    por_status = dict(conn.execute("SELECT status, COUNT(*) FROM contrato GROUP BY status").fetchall())
+    contagem = dict(conn.execute("SELECT status, total FROM contrato_status_contagem WHERE total > 0").fetchall())
+    assert contagem == por_status
+
+    estatisticas = conn.execute("SELECT * FROM usuario_estatisticas WHERE usuario_id = ?", (usuario_id,)).fetchone()
+    conn.execute("BEGIN IMMEDIATE")
+    instante = conn.execute("SELECT instante FROM estatisticas_referencia").fetchone()[0]
+    mod.recalcular_estatisticas(conn, mod.datetime.fromisoformat(instante))
+    recontadas = conn.execute("SELECT * FROM usuario_estatisticas WHERE usuario_id = ?", (usuario_id,)).fetchone()
+    conn.rollback()
+    assert tuple(estatisticas) == tuple(recontadas)
+
+    conn.execute("INSERT INTO contrato_fts (contrato_fts) VALUES ('integrity-check')")
+    encontrados = conn.execute("SELECT COUNT(*) FROM contrato_fts WHERE contrato_fts MATCH 'licitacao'").fetchone()[0]
+    assert encontrados == conn.execute("SELECT COUNT(*) FROM contrato WHERE nome LIKE '%licitação%'").fetchone()[0]
+
+    # terminada a semeadura, os triggers não dependem mais da marca
+    triggers = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    assert triggers and not any("migracao_marca" in t[0] for t in triggers)
+    assert conn.execute("SELECT COUNT(*) FROM migracao_marca").fetchone()[0] == 0